@@ -9,53 +9,171 @@
 
 
 import sys
-import math
 import os
+import time
+import copy
+
+# fr : Instant du lancement, pour mesurer le temps jusqu'au premier affichage (voir instrumentation.py).
+# en : Launch time, to measure the time to the first frame (see instrumentation.py).
+STARTED = time.perf_counter()
+
 import numpy as np
 
-from PyQt5.QtCore import Qt, QSize, QRect, QPoint
-from PyQt5.QtGui import QPainter, QPen, QPixmap, QImage, QColor, QCursor
-from PyQt5.QtWidgets import QApplication, QWidget, QLabel, QMainWindow, QPushButton, QVBoxLayout, QHBoxLayout, QGridLayout, QDesktopWidget, QCheckBox
-from pyqt5_tools.examples.exampleqmlitem import QtCore
-from skimage import morphology, io
-from qimage2ndarray import array2qimage
+from PyQt5.QtCore import Qt, QSize, QPointF, QRectF, QLineF, QThread, pyqtSignal
+from PyQt5.QtGui import QPen, QBrush, QImageReader, QColor, QCursor, QKeySequence
+from PyQt5.QtWidgets import QApplication, QWidget, QFrame, QGraphicsScene, QGraphicsView, QMainWindow, QPushButton, QVBoxLayout, QHBoxLayout, QGridLayout, QDesktopWidget, QCheckBox, QSpinBox, QScrollArea, QComboBox, QFileDialog
+
+import trajectory_compiler
+from corridor import mask_label, segment_in_corridor, polyline_first_violation
+from tile_pyramid import cached_pyramid, load_pyramid
+from circuit_workspace import CircuitWorkspace
+from scene_items import StrokeItem, CurveItem
+from spline_curve import SplineCurve
+from spatial_index import GridIndex
+from stroke_buffer import StrokeBuffer
+from stroke_estimator import StreamingEstimator
+from stroke_journal import EDIT
+from trajectory_store import TrajectoryLayerCache
+from trajectory_repository import TrajectoryRepository
+from instrumentation import timed, span, record_since
+
+
+# fr : La classe CorridorLoader ouvre (ou construit, la première fois) la pyramide de tuiles du circuit et de son champ
+# de distance dans un thread, pour que la fenêtre s'affiche sans attendre. Le signal loaded transmet la pyramide au
+# Canvas dans le thread de l'interface ; le circuit concerné est celui du loader (sender).
+# en : The CorridorLoader class opens (or builds, the first time) the tile pyramid of the circuit and of its distance
+# field in a thread, so that the window shows up without waiting. The loaded signal passes the pyramid to the Canvas
+# in the interface thread ; the circuit concerned is the one of the loader (sender).
+class CorridorLoader(QThread):
+    loaded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, circuit, threshold=0.5, parent=None):
+        super().__init__(parent)
+        self.circuit = circuit
+        self.threshold = threshold
+        self.pyramid = None
+
+
+    def run(self):
+        try:
+            self.pyramid = load_pyramid(self.circuit, threshold=self.threshold)
+        except (OSError, ValueError, KeyError, ImportError) as error:
+            self.failed.emit("%s : %s" % (self.circuit, error))
+            return
+        self.loaded.emit(self.pyramid)
 
 
 # fr : La classe Canvas a été créée afin de constituer un espace de dessin customisable.
 # en : The Canvas class was created to provide a customizable drawing space.
-class Canvas(QLabel):
+# fr : C'est une vue d'une scène graphique, en pixels de l'image du circuit : la molette zoome sous le pointeur, le
+# bouton du milieu déplace la vue et la touche 0 revient au zoom 1:1. En mode édition, les trajectoires affichées
+# deviennent des courbes dont on déplace les points de contrôle à la souris.
+# en : It is a view of a graphics scene, in pixels of the circuit image : the wheel zooms under the pointer, the middle
+# button moves the view and the 0 key goes back to the 1:1 zoom. In edit mode, the shown trajectories become curves
+# whose control points are moved with the mouse.
+class Canvas(QGraphicsView):
+
+    # fr : Émis lorsque le masque du circuit est prêt et que le dessin est possible.
+    # en : Emitted when the mask of the circuit is ready and drawing is possible.
+    corridorReady = pyqtSignal()
+    # fr : Émis avec le nouveau circuit lorsque le canvas change de circuit.
+    # en : Emitted with the new circuit when the canvas changes circuit.
+    circuitChanged = pyqtSignal(str)
+    # fr : Émis lorsque le mode édition est activé ou désactivé.
+    # en : Emitted when the edit mode is turned on or off.
+    editModeChanged = pyqtSignal(bool)
+    # fr : Émis lorsque le mode gomme est activé ou désactivé.
+    # en : Emitted when the eraser mode is turned on or off.
+    eraseModeChanged = pyqtSignal(bool)
+    # fr : Émis avec les identifiants des trajectoires créées et supprimées par la gomme (ou leur annulation).
+    # en : Emitted with the identifiers of the trajectories created and deleted by the eraser (or their undo).
+    trajectoriesChanged = pyqtSignal(list, list)
+    # fr : Zoom minimal et maximal (pixels de l'écran par pixel de l'image).
+    # en : Minimum and maximum zoom (screen pixels per image pixel).
+    zoom_range = (1 / 16, 16)
+    # fr : Demi-côté des points de contrôle, en pixels de l'écran.
+    # en : Half side of the control points, in screen pixels.
+    handle_size = 4
+    # fr : Rayon de la gomme, en pixels de l'écran.
+    # en : Radius of the eraser, in screen pixels.
+    eraser_size = 8
     
     if (os.path.exists("points.txt")) : os.remove("points.txt")
-    if (os.path.exists("dilatedN&BCircuitMIA.png")) : os.remove("dilatedN&BCircuitMIA.png")
     
     
-    def __init__(self):
-        QWidget.__init__(self)
-        # fr : pixmap est un format de fichier graphique. On initialise ici le fond de notre canvas avec l'image du
-        # circuit "circuitMIA.png". Il est donc possible de changer le fond avec vos propres images.
-        # en : pixmap is a graphics file format. Here we initialize the background of our canvas with the image of
-        # the circuit "circuitMIA.png". It is therefore possible to change the background with your own images.
-        self.my_pixmap = QPixmap("circuitMIA.png")
+    def __init__(self, circuit="circuitMIA.png"):
+        QGraphicsView.__init__(self)
+        # fr : Le fond du canvas est l'image du circuit circuit, "circuitMIA.png" par défaut. Il est possible de
+        # changer de circuit pendant la session avec setCircuit : les derniers circuits ouverts (fond, masque et
+        # journal) restent en mémoire dans workspace (voir circuit_workspace.py), dans la limite de sa capacité.
+        # en : The background of the canvas is the image of the circuit circuit, "circuitMIA.png" by default. The
+        # circuit can be changed during the session with setCircuit : the last opened circuits (background, mask and
+        # journal) stay in memory in workspace (see circuit_workspace.py), within the limit of its capacity.
+        self.circuit = None
+        self.workspace = CircuitWorkspace(capacity=4)
+        self.circuit_state = None
+        # fr : Les tracés ne sont plus dessinés dans l'image : la scène contient le fond (l'image entière en
+        # attendant la pyramide de tuiles, voir setPyramid), les trajectoires affichées et le tracé en cours, sous
+        # forme vectorielle (voir scene_items.py). Effacer le canvas revient à retirer ces objets.
+        # en : The drawings are no longer painted into the image : the scene holds the background (the whole image
+        # until the tile pyramid is ready, see setPyramid), the shown trajectories and the drawing in progress, as
+        # vectors (see scene_items.py). Clearing the canvas amounts to removing these items.
+        self.setScene(QGraphicsScene(self))
+        self.scene().setItemIndexMethod(QGraphicsScene.NoIndex)
+        self.background_item = None
+        self.setAlignment(Qt.AlignLeft | Qt.AlignTop)
+        self.setFrameShape(QFrame.NoFrame)
+        self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
+        # fr : Trajectoires affichées (identifiant -> TrajectoryItem) et tracé en cours.
+        # en : Shown trajectories (identifier -> TrajectoryItem) and drawing in progress.
+        self.shown_layers = {}
+        self.stroke_item = StrokeItem(Qt.black)
+        self.scene().addItem(self.stroke_item)
+        # fr : Dernière position du pointeur pendant un déplacement de la vue (None sinon).
+        # en : Last position of the pointer while moving the view (None otherwise).
+        self.panning = None
+        # fr : Mode édition : courbe de chaque trajectoire affichée (identifiant -> CurveItem), index spatial de leurs
+        # points de contrôle (clés (identifiant, indice)) et point de contrôle déplacé avec sa position de départ.
+        # en : Edit mode : curve of each shown trajectory (identifier -> CurveItem), spatial index of their control
+        # points (keys (identifier, index)) and moved control point with its starting position.
+        self.editing = False
+        self.curves = {}
+        self.control_index = GridIndex(cell=16)
+        self.dragged = None
+        # fr : Mode gomme : index spatial des points des trajectoires affichées (clés (identifiant, indice)), points
+        # effacés par le geste en cours (identifiant -> ensemble d'indices, None hors geste), dernière position de la
+        # gomme et segments effacés, surlignés jusqu'à la fin du geste.
+        # en : Eraser mode : spatial index of the points of the shown trajectories (keys (identifier, index)), points
+        # erased by the gesture in progress (identifier -> set of indices, None outside a gesture), last position of
+        # the eraser and erased segments, highlighted until the end of the gesture.
+        self.erasing = False
+        self.sample_index = GridIndex(cell=16)
+        self.erased = None
+        self.eraser_position = None
+        self.eraser_overlay = []
         
-        # fr :  Les objets QPixmaps peuvent être convertit en objets QImages. Ces objets QImages sont très utiles
-        # pour récupérer des informations concernants des images.
-        # en : QPixmaps objects can be converted into QImages objects. These QImages objects are very useful
-        # to retrieve information about images.
-        self.my_qimage = QPixmap.toImage(self.my_pixmap)
-        
-        # fr : On met la dilatation des bords du circuit à 10.
-        # En : We set the dilation of the edges of the circuit to 10.
-        self.dilation = 10
-        # fr : On convertit notre image de départ en une image noir et blanc dont les bords du circuit on été dilatés
-        # en : We convert our starting image to a grayscale image with dilated borders 
-        self.my_dilatedimage = morphology.erosion(io.imread('circuitMIA.png', as_gray = True), morphology.disk(self.dilation))
-        self.my_dilatedimage = np.where(self.my_dilatedimage>=0.5, 1, 0)
-        # fr : On sauvegarde le circuit dilaté noir et blanc.
-        # en : The dilated black and white circuit is saved.
-        io.imsave('dilatedN&BCircuitMIA.png',self.my_dilatedimage)
-        self.my_qdilatedimage = array2qimage(self.my_dilatedimage)
-
-        self.setPixmap(self.my_pixmap)
+        # fr : Pyramide de tuiles du circuit et champ de distance signé (distance en pixels au bord le plus proche),
+        # en mémoire partagée (voir tile_pyramid.py) : seules les tuiles lues sont chargées. Ils sont mis en cache sur
+        # le disque et ne sont recalculés que si l'image ou le seuil changent. Ils sont chargés en arrière-plan par
+        # CorridorLoader (un par circuit, lancé par setCircuit) : en attendant, le dessin est désactivé.
+        # en : Tile pyramid of the circuit and signed distance field (distance in pixels to the closest border),
+        # memory-mapped (see tile_pyramid.py) : only the tiles read are loaded. They are cached on disk and only
+        # recomputed when the image or the threshold change. They are loaded in the background by CorridorLoader (one
+        # per circuit, started by setCircuit) : meanwhile, drawing is disabled. No loading is started any more once
+        # the window is closing (see stopCorridorLoaders).
+        self.corridor_loaders = {}
+        self.corridor_loader = None
+        self.closing = False
+        self.pyramid = None
+        self.distance_field = None
+        self.my_dilatedimage = None
+        # fr : On met la dilatation des bords du circuit à 10 : le masque du couloir est le champ de distance seuillé
+        # à 10 pixels.
+        # en : We set the dilation of the edges of the circuit to 10 : the corridor mask is the distance field
+        # thresholded at 10 pixels.
+        self.set_dilation(10)
+
         # fr : PreviousPoint est la variable dans laquelle on va stocker les coordonnées du précédent point acquis
         # lors du tracé de la trajectoire.
         # en : PreviousPoint is the variable in which we will store the coordinates of the previous point acquired
@@ -73,26 +191,14 @@ class Canvas(QLabel):
         # fr : Permet d'activer le traqueur de la souris.
         # en : Enables the mouse tracker.
         self.setMouseTracking(True)
-        # fr : On initialise une intervalle de 30 points. Cela permettra de réaliser les mesures tous les 30 points.
-        # en : We initialize an interval of 30 points. This will allow measurements to be taken every 30 points.
-        self.point_interval = 30
-        # fr : La variable current_interval est une sorte de compteur permettant de savoir à quel point de l'intervalle
-        # nous sommes. On l'initialise à 29 de façon à ce que le premier point du tracé soit pris en compte.
-        # en : The current_interval variable is a kind of counter to know at what point of the interval we are. It is
-        # initialized to 29 so that the first point of the plot is taken into account.
-        self.current_interval = 29
+        # fr : Les mesures ne sont plus prises tous les 30 points : à la validation, le tracé est rééchantillonné tous
+        # les sample_spacing mètres le long de la courbe, quelle que soit la vitesse de la souris.
+        # en : Measurements are no longer taken every 30 points : on validation, the drawing is resampled every
+        # sample_spacing metres along the curve, whatever the mouse speed.
+        self.sample_spacing = trajectory_compiler.SAMPLE_SPACING
         # fr : Le rapport de distance écran-réel est d'environ 100 pixels/m.
         # en : The screen-to-real distance ratio is about 100 pixels/m.
         self.distance_ratio = 100
-        # fr : Variable contenant la distance entre deux points mesurés.
-        # en : Variable containing the distance between two measured points.
-        self.current_distance = 0
-        # fr : Variable contenant la distance entre deux points mesurés selon l'axe des x.
-        # en : Variable containing the distance between two points measured along the x axis.
-        self.current_distance_x = 0
-        # fr : Variable contenant la distance entre deux points mesurés selon l'axe des y.
-        # en : Variable containing the distance between two points measured along the y axis.
-        self.current_distance_y = 0
         
         
         # fr : Variable contenant la position de départ de la voiture selon l'axe des x.
@@ -104,82 +210,121 @@ class Canvas(QLabel):
         # fr : Variable contenant l'angle de départ de la voiture selon l'axe des abscisses.
         # en : Variable containing the departure angle of the car along the abscissa axis.
         self.start_angle = 0
+        # fr : Valeur du masque du circuit dilaté au point de départ du tracé.
+        # en : Value of the dilated circuit mask at the starting point of the drawing.
+        self.start_label = None
 
         # fr : entraxe correspondant à l'empattement (ou entraxe) de la voiture. C'est à dire la distance entre les
         # roues arrières et avants de la voiture.
         # en : center distance corresponding to the wheelbase (or center distance) of the car. That is to say the
         # distance between the rear and front wheels of the car.
         self.entraxe = 0.3355
-        # fr : xpos est un tableau qui va contenir les positions selon l'axe des x de tous les points acquis.
-        # en : xpos is an array that will contain the positions along the x axis of all acquired points.
-        self.xpos = np.empty(0)
-        # fr : ypos est un tableau qui va contenir les positions selon l'axe des y de tous les points acquis.
-        # en : ypos is an array that will contain the positions along the y axis of all acquired points.
-        self.ypos = np.empty(0)
         # fr : speed est un tableau qui va contenir les différentes vitesses à utiliser pour chaque commande donnée à la
         # voiture.
         # en : speed is an array that will contain the different speeds to use for each command given to the car.
         self.speed = np.empty(0)
-        # fr : La variable change permet de changer l'état du painter (mode dessiner/effacer). Cette fonction n'est
-        # néanmoins pas encore bien implémentée.
-        # en : The variable change allows to change the state of the painter (draw/erase mode). However,
-        # this function is not yet well implemented.
-        self.change = 0
-        # fr : all_points est un tableau qui va contenir tous les points du tracé.
-        # en : all_points is an array that will contain all the points of drawing.
-        self.all_points = np.empty(0)
-        # fr : Dernier point tracé
-        # en : Last point traced
-        self.very_last_point = QPoint(-1,-1)
+        # fr : all_points contient tous les points du tracé (en pixels de la scène, non arrondis), point de départ
+        # compris, ainsi que l'instant de chaque point.
+        # en : all_points holds all the points of drawing (in scene pixels, not rounded), starting point included, as
+        # well as the timestamp of each point.
+        self.all_points = StrokeBuffer(capacity=4096, dtype=np.float64, timestamps=True)
+        # fr : L'estimateur calcule vitesse, courbure et angle de braquage au fur et à mesure du tracé (voir
+        # stroke_estimator.py) : la validation ne fait que récupérer les résultats.
+        # en : The estimator computes speed, curvature and steering angle as the drawing goes (see
+        # stroke_estimator.py) : validation only collects the results.
+        self.estimator = StreamingEstimator(self.sample_spacing, self.distance_ratio, self.entraxe)
+        # fr : Portions du tracé où |entraxe * c| >= 1, surlignées en rouge par paintEvent pendant le tracé.
+        # en : Parts of the drawing where |entraxe * c| >= 1, highlighted in red by paintEvent while drawing.
+        self.steering_overlay = []
+        # fr : Dernier point tracé (dans la scène), None s'il n'y en a pas.
+        # en : Last point traced (in the scene), None if there is none.
+        self.very_last_point = None
+        # fr : Journal des gestes, effacements et éditions de courbes du circuit, pour annuler et rétablir (voir
+        # stroke_journal.py). gesture contient la longueur du tracé à l'appui du bouton et si le geste est sorti du
+        # couloir.
+        # en : Journal of the gestures, clearings and curve edits of the circuit, to undo and redo (see
+        # stroke_journal.py). gesture holds the length of the drawing when the button was pressed and whether the
+        # gesture left the corridor.
+        self.journal = None
+        self.gesture = None
         
-        # fr : on cree un compteur qui permet de garder une trace du nombre de fichier trajectoire et points nous
-        # avons cree.
-        # en : we create a counter that keeps track of the number of trajectory files and points we have created.
-        self.compteur = 0
+        # fr : Dépôt contenant toutes les trajectoires validées (voir trajectory_repository.py). Chaque trajectoire
+        # y a un identifiant stable, qui n'est jamais renuméroté.
+        # en : Repository holding all the validated trajectories (see trajectory_repository.py). Each trajectory has a
+        # stable identifier in it, which is never renumbered.
+        self.repository = TrajectoryRepository("trajectoires.db")
+        # fr : Identifiant de la dernière trajectoire validée sur ce circuit (None s'il n'y en a pas).
+        # en : Identifier of the last trajectory validated on this circuit (None if there is none).
+        self.last_trajectory_id = None
         
         # fr : indique si un tracé est valide, i.e si on a pas touché les bords du canvas.
         # en : indicates if a drawing is valid, i.e if we have not touched the edges of the canvas.
         self.valid_circuit = False
 
+        # fr : Cache en mémoire des points et des calques déjà tracés de chaque trajectoire (voir trajectory_store.py).
+        # en : In-memory cache of the points and of the already drawn layers of each trajectory (see
+        # trajectory_store.py).
+        self.layers = TrajectoryLayerCache(self.loadPoints)
+
+        self.first_frame = False
+        self.setCircuit(circuit)
+
+
+    # fr : Change le circuit du canvas. Le tracé en cours est effacé (l'effacement reste annulable dans le journal de
+    # l'ancien circuit) et les trajectoires affichées retirées. Si le circuit est gardé dans workspace, son fond et
+    # son masque sont repris tels quels ; si sa pyramide est dans le cache, elle est ouverte tout de suite. Sinon, un
+    # simple rectangle de la taille de l'image (lue dans son en-tête) est affiché le temps de construire la pyramide :
+    # l'image entière n'est jamais décodée d'un coup.
+    # en : Changes the circuit of the canvas. The drawing in progress is cleared (the clearing stays undoable in the
+    # journal of the former circuit) and the shown trajectories removed. If the circuit is kept in workspace, its
+    # background and its mask are taken back as they are ; if its pyramid is in the cache, it is opened at once.
+    # Otherwise, a mere rectangle of the size of the image (read from its header) is shown while the pyramid is built :
+    # the whole image is never decoded at once.
+    @timed()
+    def setCircuit(self, circuit):
+        if circuit == self.circuit:
+            return
+        if self.circuit is not None:
+            self.clear_circuit()
+        self.circuit = circuit
+        self.circuit_state = self.workspace.open(circuit)
+        self.journal = self.circuit_state.journal
+        ids = self.repository.ids(circuit)
+        self.last_trajectory_id = ids[-1] if ids else None
+
+        if self.background_item is not None:
+            self.scene().removeItem(self.background_item)
+            self.background_item = None
+        self.pyramid = self.distance_field = self.my_dilatedimage = None
+        if self.circuit_state.pyramid is None:
+            try:
+                pyramid = cached_pyramid(circuit)
+            except OSError:
+                pyramid = None
+            if pyramid is not None:
+                self.circuit_state.set_pyramid(pyramid)
+        if self.circuit_state.pyramid is not None:
+            self.showPyramid()
+        else:
+            size = QImageReader(circuit).size()
+            self.background_item = self.scene().addRect(QRectF(0, 0, max(size.width(), 0), max(size.height(), 0)),
+                                                        QPen(Qt.NoPen), QBrush(Qt.lightGray))
+            self.background_item.setZValue(-1)
+            self.scene().setSceneRect(self.background_item.boundingRect())
+            self.viewport().setCursor(QCursor(Qt.BusyCursor))
+            self.corridor_loader = self.corridor_loaders.get(circuit)
+            if self.corridor_loader is None and not self.closing:
+                self.corridor_loader = self.corridor_loaders[circuit] = CorridorLoader(circuit, 0.5, self)
+                self.corridor_loader.loaded.connect(self.setPyramid)
+                self.corridor_loader.failed.connect(self.corridorFailed)
+                self.corridor_loader.start()
+        self.circuitChanged.emit(circuit)
+
     
     # fr : méthode permettant de calculer la courbure c selon la position de tous les points mesurés.
     # en : method to calculate the curvature c according to the position of all the measured points.
     def calcul_curvature(self, x_value, y_value):
-        # fr : On calcule ici les valeurs du tableau x_t, dont les éléments correspondent aux dérivés premières des
-        # éléments du tableau xvalue passé en paramètre.
-        # en : Here we calculate the values of the array x_t, whose elements correspond to the first derivatives of
-        # the elements of the array xvalue passed as a parameter.
-        x_t = np.gradient(x_value)
-        # fr : On calcule ici les valeurs du tableau y_t, dont les éléments correspondent aux dérivés premières des
-        # éléments du tableau yvalue passé en paramètre.
-        # en : Here we calculate the values of the array y_t, whose elements correspond to the first derivatives of
-        # the elements of the array yvalue passed as a parameter.
-        y_t = np.gradient(y_value)
-        # fr : On calcule ici les valeurs du tableau xx_t, dont les éléments correspondent aux dérivés secondes des
-        # éléments du tableau xvalue passé en paramètre et donc aux dérivés premières des éléments de x_t calculé
-        # précédemment.
-        # en : Here we calculate the values of the xx_t array, whose elements correspond to the second derivatives of
-        # the elements of the xvalue array passed as a parameter and therefore to the first derivatives of the
-        # elements of x_t calculated previously.
-        xx_t = np.gradient(x_t)
-        # fr : On calcule ici les valeurs du tableau yy_t, dont les éléments correspondent aux dérivés secondes des
-        # éléments du tableau yvalue passé en paramètre et donc aux dérivés premières des éléments de y_t calculé
-        # précédemment.
-        # en : Here we calculate the values of the yy_t array, whose elements correspond to the second derivatives of
-        # the elements of the xvalue array passed as a parameter and therefore to the first derivatives of the
-        # elements of y_t calculated previously.
-        yy_t = np.gradient(y_t)
-
-        # fr : On calcule ici les valeurs du tableau speed à l'aide des tableaux x_t et y_t calculés auparavant.
-        # en : We calculate here the values of the speed array using the x_t and y_t arrays calculated before.
-        self.speed = np.sqrt(x_t * x_t + y_t * y_t)
-
-        # fr : On calcule ici les valeurs du tableau curvature_val qui correspond à la courbure c en tout point
-        # mesurés.
-        # en : We calculate here the values of the table curvature_val which corresponds to the curvature c
-        # at all measured points.
-        curvature_val = (xx_t * y_t - x_t * yy_t) / self.speed ** 3
-
+        curvature_val, self.speed = trajectory_compiler.calcul_curvature(x_value, y_value)
         return curvature_val
 
 
@@ -188,10 +333,7 @@ class Canvas(QLabel):
     # en : The curv_to_angle method is used to calculate the steering angle needed to command the angles at which the
     # wheels of the car will have to turn with each command.
     def curv_to_angle(self, c):
-        # fr : En effet, angle = arctan(L/R). Or R = 1/c donc angle = arctan(L*c)
-        # en : Indeed, angle = arctan(L/R). But R = 1/c so angle = arctan(L*c)
-        if -1 < self.entraxe * c < 1:
-            return math.atan(self.entraxe * c)
+        return trajectory_compiler.curv_to_angle(c, self.entraxe)
 
 
     def diff(self, a, b):
@@ -202,114 +344,60 @@ class Canvas(QLabel):
     # en : This method makes it possible to calculate the directing coefficient of a straight line defined by two
     # points.
     def calculateCoefficent(self, xA, yA, xB, yB):
-        # fr : Par rapport à la formule d'origine, yA et yB sont inversés puisque le repère est tel que l'axe y pointe
-        # vers le bas.
-        # en : Compared to the original formula, yA and yB are reversed since the mark is such that the y axis points
-        # down.
-        if xA != xB:
-            coeff = (yA - yB) / (xB - xA)
-        else:
-            coeff = 0
-        return coeff
+        return trajectory_compiler.calculateCoefficent(xA, yA, xB, yB)
     
     
     # fr : La méthode validate_circuit est appelée lorsque l'utilisateur a fini de tracer la trajectoire voulue et
     # clique sur le bouton "VALID CIRCUIT". On génère alors le fichier de commande adapté.
     # en : The validate_circuit method is called when the user has finished tracing the desired trajectory and clicks
     # on the "VALID CIRCUIT" button. One then generates the adapted command file.
+    @timed()
     def validate_circuit(self):
         
         if(self.valid_circuit) :
-            # fr : On augmente le compteur de fichier "trajectoires.txt"
-            # en : We increase the "trajectories.txt" file counter
-            self.compteur +=1
-
-            nom_fichier_trajectoire= "trajectoire"+str(self.compteur)+".txt"
-            nom_fichier_points = "points"+str(self.compteur)+".txt"
-            
-            # fr : si le fichier existe déjà, on le supprime, sinon on le cree et et le cureur est placé à la fin
-            # du fichier.
-            # en : if the file already exists, we delete it, otherwise we create it and the cursor is
-            # placed at the end of the file.
-            if (os.path.exists(nom_fichier_trajectoire)) : os.remove(nom_fichier_trajectoire)
-            self.fichier = open(nom_fichier_trajectoire, "a")
-            
-            # fr : On efface alors les précédentes commande et replace le curseur au début du fichier.
-            # en : The previous commands are then erased and the cursor is replaced at the beginning of the file.
-            self.fichier.truncate(0)
-            self.fichier.seek(0)
-
-            # fr : on calcule alors le tableau des courbures pour chaque point mesuré. (appel à calcul_curvature).
-            # en : the array of curvatures is then calculated for each point measured. (call to calcul_curvature).
-            curvature_array = self.calcul_curvature(self.xpos, self.ypos)
-            # print("curvature array \n", curvature_array)
-
-            # fr : On construit le tableaux des angles à appliquer. (appel à curv_to_angle).
-            # en : We build the table of angles to apply. (call to curv_to_angle).
-            angle_array = np.array([self.curv_to_angle(xi) for xi in curvature_array])
-            # print("angle array : \n", angle_array)
-
-            # fr : On calcule ici les 3 coefficients directeur des trois premières droites traçables.
-            # en : We calculate here the 3 directing coefficients of the first three traceable lines.
-            coeffd1 = self.calculateCoefficent(self.start_x, self.start_y, self.xpos[1], self.ypos[1])
-            coeffd2 = self.calculateCoefficent(self.start_x, self.start_y, self.xpos[2], self.ypos[2])
-            coeffd3 = self.calculateCoefficent(self.xpos[1], self.ypos[1], self.xpos[2], self.ypos[2])
-
-            # fr : Puis on calcule le coefficient moyen pour minimiser l'incertitude.
-            # en : Then the average coefficient is calculated to minimize the uncertainty.
-            coeff_moyen = (coeffd1 + coeffd2 + coeffd3) / 3
-
-            # fr : on calcule ici l'angle d'orientation de départ de la voiture. Pour plus de précision (section III.2 du
-            # rapport).
-            # en : here we calculate the starting orientation angle of the car. For more details (section III.2 of the
-            # report).
-            if self.diff(self.start_x, self.xpos[1]) > 0:
-                self.start_angle = math.atan(coeff_moyen)
-            else:
-                self.start_angle = math.pi + math.atan(coeff_moyen)
-
-            # fr : Calcul de la position de départ selon y (différence à cause du changement de repère entre l'interface
-            # et le logiciel de simulation).
-            # en : Calculation of the starting position according to y (difference due to the change of frame between the
-            # interface and the simulation software).
-            self.start_y = 4.67 - self.start_y
-
-            # fr : Écriture de la première ligne de commande (initialisation de la position de la voiture).
-            # en : Writing the first command line (initializing the position of the car).
-            self.fichier.write("{0:.3f}".format(self.start_x))
-            self.fichier.write(",{0:.3f}".format(self.start_y))
-            self.fichier.write(",{0:.8f}\n".format(self.start_angle))
-
-            # fr : Écriture des lignes de commande suivantes (avec une précision assez grande car impact important).
-            # en : Writing of the following command lines (with a rather high precision because significant impact).
-            for i in range(0, len(self.speed)):
-                self.fichier.write("{0:.8f}".format(self.speed[i]) 
-                                   + ",{0:.8f}\n".format(angle_array[i]))
-            self.fichier.close()
-            
-            # fr : si le fichier existe déjà, on le supprime, sinon on le cree et et le cureur est placé à la fin
-            # du fichier.
-            # en : if the file already exists, we delete it, otherwise we create it and the cursor is
-            # placed at the end of the file.
-            if (os.path.exists(nom_fichier_points)) : os.remove(nom_fichier_points)
-            self.fichier_point = open(nom_fichier_points,"a")
-            
-            # fr : On ecrit l'ensemble des points du tracé dans le fichier points.txt.
-            # en : We write all the points of the plot in the file points.txt.
-            for i in range(0, len(self.all_points) - 2):
-                self.fichier_point.write(str(self.all_points[i].x())
-                                        +","
-                                        +str(self.all_points[i].y())
-                                        +"\n")
-                
-            self.fichier_point.write(str(self.all_points[len(self.all_points) - 1].x()) + "," 
-                                     + str(self.all_points[len(self.all_points) - 1].y()))
-            self.fichier_point.close()
+            # fr : Les commandes (vitesses, angles de braquage, angle de départ et changement de repère) ont été
+            # calculées pendant le tracé : il ne reste que les deux dernières mesures. Voir stroke_estimator.py.
+            # en : The commands (speeds, steering angles, starting angle and change of frame) have been computed while
+            # drawing : only the last two measurements are left. See stroke_estimator.py.
+            # fr : Un tracé trop court (moins de 3 mesures) ne peut pas être compilé : il est gardé tel quel pour être
+            # prolongé, et rien n'est enregistré.
+            # en : A too short drawing (less than 3 measurements) cannot be compiled : it is kept as is to be extended,
+            # and nothing is saved.
+            try:
+                with span("Canvas.validate_circuit.flush"):
+                    start, self.speed, angle_array = self.estimator.flush()
+            except ValueError:
+                return
+            self.start_x, self.start_y, self.start_angle = start
+
+            # fr : La trajectoire est enregistrée dans le dépôt avec ses paramètres, puis exportée dans les fichiers
+            # trajectoire{id}.txt et points{id}.txt attendus par RVIZ.
+            # en : The trajectory is saved in the repository with its parameters, then exported to the
+            # trajectoire{id}.txt and points{id}.txt files expected by RVIZ.
+            params = {"entraxe": self.entraxe, "distance_ratio": self.distance_ratio,
+                      "sample_spacing": self.sample_spacing, "dilation": self.dilation}
+            with span("Canvas.validate_circuit.store"):
+                self.last_trajectory_id = self.repository.add(self.all_points.points, start, self.speed,
+                                                              angle_array, self.circuit, params)
+            with span("Canvas.validate_circuit.export"):
+                self.repository.export(self.last_trajectory_id)
             
-            # fr : On reinitialise les variable previousPoint et all_points.
-            # en : We reset the previousPoint and all_points variables.
+            # fr : On reinitialise les variable previousPoint et all_points. L'effacement du tracé et la création de
+            # la trajectoire forment une seule opération du journal : l'annuler supprime la trajectoire et rend le
+            # tracé, qui peut être validé de nouveau sans doublon ; la rétablir recrée la trajectoire sous le même
+            # identifiant.
+            # en : We reset the previousPoint and all_points variables. The clearing of the drawing and the creation
+            # of the trajectory form a single operation of the journal : undoing it deletes the trajectory and gives
+            # the drawing back, which can be validated again without duplicate ; redoing it creates the trajectory
+            # again under the same identifier.
+            self.journal.record_clear()
+            self.journal.record_edit(self.last_trajectory_id, self.all_points.points[:0], self.all_points.points,
+                                     joined=True)
             self.previousPoint = None
-            self.all_points= np.empty(0)
+            self.all_points.clear()
+            self.estimator.reset()
+            self.steering_overlay = []
+            self.viewport().update()
        
     
     # fr : La méthode clear_circuit, permet d'effacer le précédent tracé et de réinitialiser les différents paramètres
@@ -317,236 +405,743 @@ class Canvas(QLabel):
     # en : The clear_circuit method makes it possible to erase the preceding layout and to reinitialize the various
     # parameters making it possible to build the command file.
     def clear_circuit(self):
-        # fr : Ici on réinitialise l'image de fond du Canvas avec la même image du circuit qu'à l'origine. Cela permet
-        # aussi d'effacer les différents tracés par la même occasion.
-        # en : Here we reset the background image of the Canvas with the same image of the circuit as originally.
-        # This also makes it possible to erase the different traces at the same time.
-        self.my_pixmap = QPixmap("circuitMIA.png")
-        self.setPixmap(self.my_pixmap)
-        self.update()
-
-        # fr : Les tableaux contenant la posiition des points acquis et la vitesse sont donc vidés.
-        # en : The tables containing the position of the acquired points and the speed are therefore emptied.
-        self.xpos = np.empty(0)
-        self.ypos = np.empty(0)
+        self.changeEditMode(False)
+        self.changeEraseMode(False)
+        # fr : Ici on retire de la scène les trajectoires affichées et le tracé en cours : il ne reste que le fond.
+        # en : Here the shown trajectories and the drawing in progress are removed from the scene : only the
+        # background is left.
+        for layer in self.shown_layers.values():
+            self.scene().removeItem(layer)
+        self.shown_layers = {}
+        self.stroke_item.clear()
+        self.viewport().update()
+
+        # fr : Le tableau contenant la vitesse est donc vidé.
+        # en : The array containing the speed is therefore emptied.
         self.speed = np.empty(0)
 
         # fr : Étant donné qu'un nouveau tracé sera effectué, le point précédemment acquis est remis à None.
-        # On réinitialise tous les points du tracé effectué (pour ne pas influencer les tracés suivants).
+        # On réinitialise tous les points du tracé effectué (pour ne pas influencer les tracés suivants). L'effacement
+        # est enregistré dans le journal : il peut être annulé.
         # en : Since a new plot will be made, the previously acquired point is reset to None. 
-        # We reset all the points of the plot made (so as not to influence the following plots).
+        # We reset all the points of the plot made (so as not to influence the following plots). The clearing is
+        # recorded in the journal : it can be undone.
+        if len(self.all_points):
+            self.journal.record_clear()
         self.previousPoint = None
-        self.all_points = np.empty(0)
-        self.very_last_point = QPoint(-1,-1)
+        self.all_points.clear()
+        self.estimator.reset()
+        self.steering_overlay = []
+        self.very_last_point = None
          
          
+    # fr : Méthode permettant de changer la dilatation des bords du circuit (en pixels), par exemple pour une autre
+    # largeur de voiture. Il suffit de seuiller le champ de distance, sans recalculer d'érosion.
+    # en : Method to change the dilation of the edges of the circuit (in pixels), for example for another car width.
+    # Thresholding the distance field is enough, no erosion is recomputed.
+    def set_dilation(self, dilation):
+        self.dilation = dilation
+        if self.distance_field is not None:
+            self.my_dilatedimage = self.circuit_state.corridor(self.dilation)
+
+
+    # fr : Réception du champ de distance chargé en arrière-plan : le masque est seuillé et le dessin activé.
+    # en : Reception of the distance field loaded in the background : the mask is thresholded and drawing enabled.
+    def setDistanceField(self, distance_field):
+        if distance_field is self.distance_field:
+            return
+        self.distance_field = distance_field
+        self.set_dilation(self.dilation)
+        self.viewport().setCursor(QCursor(Qt.ArrowCursor))
+        record_since("startup.corridor_ready", STARTED)
+        self.corridorReady.emit()
+
+
+    # fr : Réception de la pyramide d'un circuit chargée en arrière-plan : elle est gardée dans workspace (si le
+    # circuit y est encore) et, si c'est le circuit affiché, le fond n'affiche plus que les tuiles visibles et son
+    # champ de distance devient celui du Canvas.
+    # en : Reception of the pyramid of a circuit loaded in the background : it is kept in workspace (if the circuit is
+    # still there) and, if it is the shown circuit, the background only shows the visible tiles from now on and its
+    # distance field becomes the one of the Canvas.
+    # fr : Le chargeur qui l'envoie finit son run juste après : on l'attend, pour qu'un programme qui s'arrête dès que le
+    # masque est prêt ne détruise pas le thread pendant son exécution.
+    # en : The loader which sends it ends its run right after : it is waited for, so that a program which stops as soon
+    # as the mask is ready does not destroy the thread while it runs.
+    def setPyramid(self, pyramid, circuit=None):
+        if circuit is None:
+            if isinstance(self.sender(), CorridorLoader):
+                circuit = self.sender().circuit
+                self.sender().wait()
+            else:
+                circuit = self.circuit
+        self.corridor_loaders.pop(circuit, None)
+        state = self.workspace.get(circuit)
+        if state is None:
+            return
+        state.set_pyramid(pyramid)
+        if circuit == self.circuit and self.pyramid is not pyramid:
+            self.showPyramid()
+
+
+    def showPyramid(self):
+        if self.background_item is not None:
+            self.scene().removeItem(self.background_item)
+        self.pyramid = self.circuit_state.pyramid
+        self.background_item = self.circuit_state.background
+        self.scene().addItem(self.background_item)
+        self.scene().setSceneRect(self.background_item.boundingRect())
+        self.setDistanceField(self.pyramid.field)
+
+
+    def corridorFailed(self, message):
+        if isinstance(self.sender(), CorridorLoader):
+            self.corridor_loaders.pop(self.sender().circuit, None)
+        self.viewport().setCursor(QCursor(Qt.ForbiddenCursor))
+        print("the circuit mask could not be loaded : " + message, file=sys.stderr)
+
+
+    # fr : Attend la fin du chargement du masque (pour les scripts, sans boucle d'évènements). Renvoie True si le
+    # dessin est possible.
+    # en : Waits for the end of the loading of the mask (for scripts, without event loop). Returns True if drawing is
+    # possible.
+    def waitForCorridor(self):
+        if self.corridor_loader is not None:
+            self.corridor_loader.wait()
+            if self.corridor_loader.pyramid is not None and self.pyramid is None:
+                self.setPyramid(self.corridor_loader.pyramid, self.corridor_loader.circuit)
+        return self.my_dilatedimage is not None
+
+
+    # fr : Fermeture : plus aucun chargement n'est lancé et on attend la fin de ceux en cours (y compris ceux déjà
+    # reçus, qui peuvent encore finir leur run), car un QThread détruit pendant son exécution arrête le programme.
+    # en : Closing : no loading is started any more and the ones in progress are waited for (including the ones already
+    # received, which may still be finishing their run), since a QThread destroyed while running aborts the program.
+    def stopCorridorLoaders(self):
+        self.closing = True
+        for loader in self.findChildren(CorridorLoader):
+            loader.wait()
+
+
     # fr : méthode servant à modifier la variable color avec la couleur passée en argument.
     # en : method used to modify the color variable with the color passed as an argument.
     def set_pen_color(self, c):
         self.color = QColor(c)
-
-
-    # TODO fr : la méthode suivant est encore en cours d'écriture et ne fonctionne pas de la bonne manière à ce jour.
-    # fr : Méthode permettant de changer l'état du painter (mode dessiner/effacer).
-    # TODO en : the following method is still being written and does not work well so far.
-    # en : Method to change the state of the painter (draw/erase mode).
-    def changeEraseMode(self):
-        # fr : Si le mode actuel est "dessiner", le mode devient "effacer" et inversement.
-        # en : If the current mode is "draw", the mode becomes "erase" and vice versa.
-        if(self.change != 1) :
-            self.change = 1
-        else :
-            self.change = 0
-            
-        if (self.change == 1) :
-            pixmap = self.pixmap()
-            pixmap.fill(QtCore.Qt.transparent)
-            painter = QPainter(pixmap)
-            painter.setPen(QPen(QtCore.Qt.black, 2))
-            painter.drawRect(pixmap.rect())
-            painter.end()
-            # cursor = QCursor(pixmap)
-            # QApplication.setOverrideCursor(cursor)
+        self.stroke_item.setColor(self.color)
+
+
+    # fr : Active ou désactive le mode gomme. À l'activation, les points de chaque trajectoire affichée sont ajoutés à
+    # un index spatial : la gomme ne parcourt que les points proches du pointeur, quel que soit le nombre de courbes.
+    # en : Turns the eraser mode on or off. When turned on, the points of each shown trajectory are added to a spatial
+    # index : the eraser only goes through the points close to the pointer, whatever the number of curves.
+    def changeEraseMode(self, erasing):
+        erasing = bool(erasing)
+        if erasing == self.erasing:
+            return
+        if erasing:
+            self.changeEditMode(False)
+        self.erasing = erasing
+        self.sample_index.clear()
+        if erasing:
+            for trajectory_id in self.shown_layers:
+                self.indexSamples(trajectory_id)
         else:
-            QApplication.restoreOverrideCursor()
+            self.erased = self.eraser_position = None
+            self.eraser_overlay = []
+            self.viewport().update()
+        self.eraseModeChanged.emit(erasing)
 
-        
-    # fr : Méthode qui permet de retracer un trajectoires bien précise.
-    # en : Method that allows to retrace a precise trajectory.
-    def loadChosenTrajectory(self,index):
-        
-        # fr : On active le painter pour retracer la dernière trajectoire validée.
-        # en : We active the painter to redraw the last valid trajectory.
-        painter = QPainter(self.pixmap())
-        pen = QPen()
-        pen.setWidth(3)
-        pen.setColor(self.color)
-        pen.setStyle(Qt.SolidLine)
-        painter.setPen(pen)
 
-        painter.begin(self)
+    def indexSamples(self, trajectory_id):
+        points = self.shown_layers[trajectory_id].points
+        self.sample_index.insert_many([(trajectory_id, i) for i in range(len(points))], points)
 
-        # fr : On récupère le contenu du fichier point.txt 
-        # en : We retrieve the content of the point.txt file
-        with open("points"+str(index+1)+".txt", "r") as f:
-            data = f.read()
 
-        # fr : On récupère les couples de coordonnées de la trajectoire
-        # en : We retrieve the coordinate pairs of the trajectory
-        line = data.split('\n')
+    def unindexSamples(self, trajectory_id):
+        for i in range(len(self.shown_layers[trajectory_id].points)):
+            if (trajectory_id, i) in self.sample_index:
+                self.sample_index.remove((trajectory_id, i))
 
-        # fr : On retrace la trajectoire à l'aide de ses points.
-        # en : We redraw the last trajectory with his points.
-        for i in range(2, len(line) -2):
-            couple1 = line[i].split(",")
-            couple2 = line[i+1].split(",")
-            pt1 = QPoint(int(couple1[0]), int(couple1[1]))
-            pt2 = QPoint(int(couple2[0]), int(couple2[1]))
 
-            painter.drawLine(pt1, pt2)
+    # fr : Les points à moins de eraser_size pixels de l'écran du pointeur (et du chemin parcouru depuis la position
+    # précédente, pour ne rien sauter si la souris va vite) sont retirés de l'index et marqués comme effacés.
+    # en : The points within eraser_size screen pixels of the pointer (and of the path since the previous position, so
+    # that nothing is skipped if the mouse moves fast) are removed from the index and marked as erased.
+    def eraseAt(self, position):
+        radius = self.eraser_size / self.transform().m11()
+        x, y = position.x(), position.y()
+        if self.eraser_position is None:
+            centers = [(x, y)]
+        else:
+            x0, y0 = self.eraser_position
+            steps = max(int(np.ceil(np.hypot(x - x0, y - y0) / radius)), 1)
+            centers = [(x0 + (x - x0) * k / steps, y0 + (y - y0) * k / steps) for k in range(1, steps + 1)]
+        self.eraser_position = (x, y)
+        for cx, cy in centers:
+            for key in self.sample_index.query(cx, cy, radius):
+                self.sample_index.remove(key)
+                trajectory_id, index = key
+                self.erased.setdefault(trajectory_id, set()).add(index)
+                points = self.shown_layers[trajectory_id].points
+                for a, b in ((index - 1, index), (index, index + 1)):
+                    if a >= 0 and b < len(points):
+                        self.eraser_overlay.append(QLineF(*points[a], *points[b]))
+        self.viewport().update()
+
+
+    # fr : Fin du geste de gomme : chaque trajectoire touchée (et seulement celles-ci) est coupée aux points effacés.
+    # Le premier morceau garde l'identifiant de la trajectoire, les suivants deviennent de nouvelles trajectoires ;
+    # les morceaux trop courts pour être compilés disparaissent, et la trajectoire est supprimée s'il n'en reste
+    # aucun. Le geste est enregistré dans le journal comme une seule opération.
+    # en : End of the eraser gesture : each touched trajectory (and only those) is cut at the erased points. The first
+    # piece keeps the identifier of the trajectory, the next ones become new trajectories ; the pieces too short to be
+    # compiled disappear, and the trajectory is deleted if none is left. The gesture is recorded in the journal as a
+    # single operation.
+    @timed()
+    def commitErase(self):
+        erased, self.erased, self.eraser_position = self.erased, None, None
+        self.eraser_overlay = []
+        self.viewport().update()
+        added, removed = [], []
+        joined = False
+        for trajectory_id, indices in (erased or {}).items():
+            old = self.layers.points(trajectory_id)
+            cuts = np.array(sorted(indices))
+            pieces = np.split(old, cuts)
+            pieces = [piece for piece in pieces[:1] + [piece[1:] for piece in pieces[1:]] if len(piece) >= 2]
+            target = trajectory_id
+            for piece in pieces:
+                stored = self.storePoints(target, piece)
+                if stored is None:
+                    continue
+                self.journal.record_edit(stored, old[:0] if target is None else old, piece, joined)
+                joined = True
+                self.showLayer(stored, self.layers.layer(stored, self.color))
+                if target is None:
+                    added.append(stored)
+                target = None
+            if target is not None:
+                self.storePoints(trajectory_id, old[:0])
+                self.journal.record_edit(trajectory_id, old, old[:0], joined)
+                joined = True
+                removed.append(trajectory_id)
+        if added or removed:
+            self.trajectoriesChanged.emit(added, removed)
 
-            self.update()
+        
+    # fr : Méthode qui permet de retracer un trajectoires bien précise, à partir de son identifiant dans le dépôt.
+    # en : Method that allows to retrace a precise trajectory, from its identifier in the repository.
+    @timed()
+    def loadChosenTrajectory(self, trajectory_id):
 
-        painter.end()
+        # fr : On récupère le calque vectoriel de la trajectoire (gardé en cache) et on l'ajoute à la scène : seul son
+        # rectangle est redessiné.
+        # en : We retrieve the vector layer of the trajectory (kept in cache) and it is added to the scene : only its
+        # rectangle is repainted.
+        self.showLayer(trajectory_id, self.layers.layer(trajectory_id, self.color))
 
         # fr : On vide le tableau all_points pour les prochains tracés.
         # en : We empty the all_points array for the next plots.
-        self.all_points = np.empty(0)
+        self.all_points.clear()
         
         
+    # fr : Méthode qui affiche uniquement les trajectoires d'identifiants trajectory_ids sur le fond du circuit, à
+    # partir des calques en cache : aucune donnée n'est relue et le canvas n'est redessiné qu'une fois.
+    # en : Method that only shows the trajectories of identifiers trajectory_ids over the circuit background, from the
+    # cached layers : no data is read again and the canvas is only repainted once.
+    @timed()
+    def showTrajectories(self, trajectory_ids):
+        editing, erasing = self.editing, self.erasing
+        self.clear_circuit()
+        for trajectory_id in trajectory_ids:
+            self.showLayer(trajectory_id, self.layers.layer(trajectory_id, self.color))
+        self.changeEditMode(editing)
+        self.changeEraseMode(erasing)
+
+        self.all_points.clear()
+
+
+    # fr : Ajoute à la scène le calque layer de la trajectoire trajectory_id, à la place de celui déjà affiché. En mode
+    # gomme, l'index spatial suit le calque affiché.
+    # en : Adds to the scene the layer layer of the trajectory trajectory_id, instead of the one already shown. In
+    # eraser mode, the spatial index follows the shown layer.
+    def showLayer(self, trajectory_id, layer):
+        shown = self.shown_layers.get(trajectory_id)
+        if shown is layer:
+            return
+        if shown is not None:
+            if self.erasing:
+                self.unindexSamples(trajectory_id)
+            self.scene().removeItem(shown)
+        self.scene().addItem(layer)
+        self.shown_layers[trajectory_id] = layer
+        if self.erasing:
+            self.indexSamples(trajectory_id)
+
+
+    # fr : Méthode qui renvoie les points (en pixels) d'une trajectoire, lus dans le dépôt.
+    # en : Method that returns the points (in pixels) of a trajectory, read from the repository.
+    def loadPoints(self, trajectory_id):
+        return self.repository.points(trajectory_id)
+
+
     # fr : Méthode qui permet de retracer la dernière trajectoire validée.
     # en : Method that allows to retrace the last validated trajectory.
     def loadLastTrajectory(self):
-        if(self.compteur != 0) :
-            return self.loadChosenTrajectory(self.compteur-1)
+        if(self.last_trajectory_id is not None) :
+            return self.loadChosenTrajectory(self.last_trajectory_id)
     
 
-    # fr : Méthode qui permet de retracer la dernière trajectoire validée.
-    # en : Method that allows to retrace the last validated trajectory.
-    def deleteTrajectory(self, index):        
-        # fr : on supprime le fichier qui correspond a la trajectoire d indice index
-        # et le fichier point correspondant
-        # en : we delete the file corresponding to the trajectory of index index
-        # and the corresponding point file
-        os.remove("trajectoire"+str(index+1)+".txt")
-        os.remove("points"+str(index+1)+".txt") 
-        self.compteur -= 1
+    # fr : Méthode qui permet de supprimer plusieurs trajectoires d'un coup (une seule transaction dans le dépôt),
+    # ainsi que leurs fichiers exportés.
+    # en : Method that allows to delete several trajectories at once (a single transaction in the repository), as
+    # well as their exported files.
+    def deleteTrajectories(self, trajectory_ids):
+        self.repository.delete(trajectory_ids)
+        for trajectory_id in trajectory_ids:
+            for nom_fichier in ("trajectoire"+str(trajectory_id), "points"+str(trajectory_id)):
+                for extension in (".txt", ".bin"):
+                    if os.path.exists(nom_fichier + extension) : os.remove(nom_fichier + extension)
+            self.layers.invalidate(trajectory_id)
+            if trajectory_id in self.shown_layers:
+                if self.erasing:
+                    self.unindexSamples(trajectory_id)
+                self.scene().removeItem(self.shown_layers.pop(trajectory_id))
+            if trajectory_id in self.curves:
+                self.removeCurve(trajectory_id)
+        # fr : La dernière trajectoire devient la plus récente qui reste sur le circuit.
+        # en : The last trajectory becomes the most recent one left on the circuit.
+        if self.last_trajectory_id in trajectory_ids:
+            ids = self.repository.ids(self.circuit)
+            self.last_trajectory_id = ids[-1] if ids else None
 
 
     # fr : L'événement mousePressEvent : Lorsqu'on maintient le clic sur la souris, le dessin est actif.
     # en : The mousePressEvent : When the mouse click is held down, the drawing is active.
     def mousePressEvent(self, event):
+        # fr : Le bouton du milieu déplace la vue, même sans masque.
+        # en : The middle button moves the view, even without mask.
+        if event.button() == Qt.MiddleButton:
+            self.panning = event.pos()
+            self.viewport().setCursor(QCursor(Qt.ClosedHandCursor))
+            return
+        if self.editing:
+            self.pickControlPoint(self.scenePosition(event))
+            return
+        if self.erasing:
+            self.erased = {}
+            self.eraseAt(self.scenePosition(event))
+            return
+        # fr : Pas de dessin tant que le masque du circuit n'est pas prêt.
+        # en : No drawing until the mask of the circuit is ready.
+        if self.my_dilatedimage is None:
+            return
         self.isDrawing = 1
+        self.gesture = (len(self.all_points), False)
         
         # fr : Si un tracé a déjà été commencé
-        if(self.very_last_point != QPoint(-1,-1)) : 
-            self.cursor().setPos(self.mapToGlobal(self.very_last_point))
+        if(self.very_last_point is not None) : 
+            self.cursor().setPos(self.viewport().mapToGlobal(self.mapFromScene(self.very_last_point)))
         
 
     # fr : L'événement mouseReleaseEvent : Lorsqu'on relache le clic de la souris, le dessin est en pause.
     # en : The mouseReleaseEvent : When the mouse click is released, the drawing is paused.
     def mouseReleaseEvent(self, event):
+        if event.button() == Qt.MiddleButton:
+            self.panning = None
+            self.viewport().setCursor(QCursor(Qt.ArrowCursor))
+            return
+        if self.editing:
+            self.dropControlPoint()
+            return
+        if self.erasing:
+            self.commitErase()
+            return
+        if self.my_dilatedimage is None:
+            return
         self.isDrawing = 0
-        self.setCursor(QCursor(Qt.ArrowCursor))
-        self.very_last_point = event.pos()
+        self.viewport().setCursor(QCursor(Qt.ArrowCursor))
+        self.very_last_point = self.scenePosition(event)
+        self.recordGesture()
+
+
+    # fr : Le geste qui vient de se terminer est ajouté au journal, avec un instantané de l'estimateur tous les
+    # snapshot_points points : annuler n'a alors à recalculer que les points ajoutés depuis cet instantané.
+    # en : The gesture which has just ended is added to the journal, with a snapshot of the estimator every
+    # snapshot_points points : undoing then only has to compute again the points added since this snapshot.
+    def recordGesture(self):
+        if self.gesture is None:
+            return
+        (start, left), self.gesture = self.gesture, None
+        if len(self.all_points) == start and not left:
+            return
+        index = self.journal.record_draw(self.all_points.points[start:], self.all_points.timestamps[start:], left)
+        if self.journal.wants_snapshot(len(self.all_points)):
+            self.journal.snapshot(index, len(self.all_points), copy.deepcopy(self.estimator))
+
+
+    # fr : Annule (ou rétablit) la dernière opération du journal. Rien n'est annulé pendant un geste.
+    # en : Undoes (or redoes) the last operation of the journal. Nothing is undone during a gesture.
+    def undo(self):
+        if self.isDrawing == 0 and self.dragged is None and self.erased is None:
+            for index in self.journal.undo():
+                self.replayEntry(index, True)
+
+
+    def redo(self):
+        if self.isDrawing == 0 and self.dragged is None and self.erased is None:
+            for index in self.journal.redo():
+                self.replayEntry(index, False)
+
+
+    def replayEntry(self, index, undo):
+        kind, trajectory_id, before, after = self.journal.entry(index)
+        if kind == EDIT:
+            points, other = (before, after) if undo else (after, before)
+            self.applyEdit(trajectory_id, points, len(other) == 0)
+        else:
+            self.restoreStroke()
+
+
+    # fr : Le tracé en cours est reconstruit à partir du journal : points, segments affichés, et estimateur repris du
+    # dernier instantané valable.
+    # en : The drawing in progress is rebuilt from the journal : points, shown segments, and estimator taken from the
+    # last valid snapshot.
+    @timed()
+    def restoreStroke(self):
+        points, timestamps, valid = self.journal.stroke()
+        snapshot = self.journal.latest_snapshot()
+        if snapshot is None:
+            done = 0
+            self.estimator.reset()
+        else:
+            done, estimator = snapshot
+            self.estimator = copy.deepcopy(estimator)
+        for x, y in points[done:].tolist():
+            self.estimator.add_point(x, y)
+        self.all_points.clear()
+        self.all_points.extend(points, timestamps)
+        self.stroke_item.setPolyline(points)
+
+        curvature = self.estimator.curvature
+        samples = self.estimator.samples * self.distance_ratio
+        self.steering_overlay = [QLineF(*samples[a], *samples[b])
+                                 for index in np.flatnonzero(~(np.abs(self.entraxe * curvature) < 1)).tolist()
+                                 for a, b in ((max(index - 1, 0), index), (index, index + 1))]
+
+        if len(points):
+            x, y = points[0].tolist()
+            self.start_x, self.start_y = x / self.distance_ratio, y / self.distance_ratio
+            if self.my_dilatedimage is not None:
+                self.start_label = mask_label(self.my_dilatedimage, int(round(x)), int(round(y)))
+            self.previousPoint = self.very_last_point = QPointF(*points[-1].tolist())
+        else:
+            self.previousPoint = self.very_last_point = None
+        self.valid_circuit = bool(len(points)) and valid
+        self.viewport().update()
+
+
+    # fr : Position de l'évènement souris dans la scène (pixels de l'image, en flottants) : la position exacte du
+    # pointeur quel que soit le zoom, qui divisée par distance_ratio donne des mètres.
+    # en : Position of the mouse event in the scene (pixels of the image, as floats) : the exact position of the
+    # pointer whatever the zoom, which divided by distance_ratio gives metres.
+    def scenePosition(self, event):
+        return self.viewportTransform().inverted()[0].map(event.localPos())
+
+
+    # fr : La molette zoome (d'un facteur 2 tous les 4 crans) sous le pointeur, dans les limites de zoom_range.
+    # en : The wheel zooms (by a factor 2 every 4 notches) under the pointer, within the limits of zoom_range.
+    def wheelEvent(self, event):
+        zoom = self.transform().m11()
+        target = min(max(zoom * 2 ** (event.angleDelta().y() / 480), self.zoom_range[0]), self.zoom_range[1])
+        self.scale(target / zoom, target / zoom)
+        self.updateHandles()
+
+
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key_0:
+            self.resetTransform()
+            self.updateHandles()
+        else:
+            QGraphicsView.keyPressEvent(self, event)
+
+
+    # fr : Les points de contrôle gardent la même taille à l'écran quel que soit le zoom.
+    # en : The control points keep the same size on screen whatever the zoom.
+    def updateHandles(self):
+        for item in self.curves.values():
+            item.setHandleSize(self.handle_size / self.transform().m11())
+
+
+    # fr : Active ou désactive le mode édition. À l'activation, chaque trajectoire affichée est approchée par une courbe
+    # (voir spline_curve.py) qui remplace son calque ; ses points de contrôle sont ajoutés à l'index spatial.
+    # en : Turns the edit mode on or off. When turned on, each shown trajectory is approximated by a curve (see
+    # spline_curve.py) which replaces its layer ; its control points are added to the spatial index.
+    def changeEditMode(self, editing):
+        editing = bool(editing)
+        if editing == self.editing:
+            return
+        if editing:
+            self.changeEraseMode(False)
+        self.editing = editing
+        if editing:
+            for trajectory_id in self.shown_layers:
+                self.addCurve(trajectory_id)
+        else:
+            for trajectory_id in list(self.curves):
+                self.removeCurve(trajectory_id)
+            self.dragged = None
+        self.editModeChanged.emit(editing)
+
+
+    def addCurve(self, trajectory_id):
+        layer = self.shown_layers[trajectory_id]
+        item = CurveItem(SplineCurve.fit(layer.points), layer.pen.color(),
+                         handle=self.handle_size / self.transform().m11())
+        layer.hide()
+        self.scene().addItem(item)
+        self.curves[trajectory_id] = item
+        self.control_index.insert_many([(trajectory_id, i) for i in range(len(item.curve))], item.curve.control)
+
+
+    def removeCurve(self, trajectory_id):
+        item = self.curves.pop(trajectory_id)
+        for i in range(len(item.curve)):
+            self.control_index.remove((trajectory_id, i))
+        self.scene().removeItem(item)
+        if trajectory_id in self.shown_layers:
+            self.shown_layers[trajectory_id].show()
+
+
+    # fr : Sélection du point de contrôle le plus proche du pointeur (à moins de deux demi-côtés), trouvé dans l'index
+    # spatial sans parcourir toutes les courbes.
+    # en : Selection of the closest control point to the pointer (within two half sides), found in the spatial index
+    # without going through all the curves.
+    def pickControlPoint(self, position):
+        key = self.control_index.nearest(position.x(), position.y(), 2 * self.handle_size / self.transform().m11())
+        if key is None:
+            return
+        self.dragged = (key, self.control_index.position(key))
+        self.curves[key[0]].selected = key[1]
+        self.curves[key[0]].update()
+
+
+    def dragControlPoint(self, position):
+        (trajectory_id, index), _ = self.dragged
+        item = self.curves[trajectory_id]
+        item.curve.move(index, position.x(), position.y())
+        self.control_index.move((trajectory_id, index), position.x(), position.y())
+        item.curveChanged()
+
+
+    # fr : Fin du déplacement : la courbe modifiée est recompilée et enregistrée, sauf si elle sort du couloir ou est
+    # trop courte, auquel cas le point de contrôle revient à sa place.
+    # en : End of the move : the modified curve is compiled again and saved, unless it leaves the corridor or is too
+    # short, in which case the control point goes back to its place.
+    def dropControlPoint(self):
+        if self.dragged is None:
+            return
+        (trajectory_id, index), origin = self.dragged
+        self.dragged = None
+        item = self.curves[trajectory_id]
+        item.selected = None
+        # fr : Un simple clic sur une poignée ne modifie pas la trajectoire enregistrée.
+        # en : A mere click on a handle does not modify the saved trajectory.
+        if np.array_equal(item.curve.control[index], origin):
+            item.update()
+            return
+        points = item.curve.points()
+        if self.my_dilatedimage is None or polyline_first_violation(self.my_dilatedimage, points) != -1 \
+                or not self.saveCurve(trajectory_id, points):
+            item.curve.move(index, *origin)
+            self.control_index.move((trajectory_id, index), *origin)
+        item.curveChanged()
+
+
+    # fr : Les points de la courbe passent par la même chaîne que les tracés (rééchantillonnage, courbure, braquage) ;
+    # la trajectoire est mise à jour dans le dépôt et ses fichiers exportés de nouveau. Renvoie False si la courbe est
+    # trop courte pour être compilée.
+    # en : The points of the curve go through the same pipeline as the drawings (resampling, curvature, steering) ; the
+    # trajectory is updated in the repository and its files exported again. Returns False if the curve is too short to
+    # be compiled.
+    def saveCurve(self, trajectory_id, points):
+        old = self.layers.points(trajectory_id)
+        if self.storePoints(trajectory_id, points) is None:
+            return False
+        self.journal.record_edit(trajectory_id, old, points)
+        self.showLayer(trajectory_id, self.layers.layer(trajectory_id, self.color))
+        self.shown_layers[trajectory_id].hide()
+        return True
+
+
+    # fr : Compile et enregistre les points points de la trajectoire trajectory_id : elle est mise à jour si elle
+    # existe, recréée sous cet identifiant sinon, ajoutée si trajectory_id vaut None et supprimée si points est vide.
+    # Renvoie l'identifiant de la trajectoire, ou None si les points sont trop peu nombreux pour être compilés.
+    # en : Compiles and saves the points points of the trajectory trajectory_id : it is updated if it exists, created
+    # again under this identifier otherwise, added if trajectory_id is None and deleted if points is empty. Returns
+    # the identifier of the trajectory, or None if there are too few points to be compiled.
+    def storePoints(self, trajectory_id, points):
+        if len(points) == 0:
+            self.deleteTrajectories([trajectory_id])
+            return trajectory_id
+        try:
+            start, speed, angle_array = trajectory_compiler.compile_points(points, self.entraxe, self.distance_ratio,
+                                                                           spacing=self.sample_spacing)
+        except ValueError:
+            return None
+        params = {"entraxe": self.entraxe, "distance_ratio": self.distance_ratio, "sample_spacing": self.sample_spacing}
+        if trajectory_id is None:
+            trajectory_id = self.repository.add(points, start, speed, angle_array, self.circuit, params)
+        elif trajectory_id in self.repository:
+            self.repository.update(trajectory_id, points, start, speed, angle_array, params)
+        else:
+            self.repository.insert(trajectory_id, points, start, speed, angle_array, self.circuit, params)
+        self.repository.export(trajectory_id)
+        self.layers.invalidate(trajectory_id)
+        return trajectory_id
+
+
+    # fr : Annulation ou rétablissement d'une édition : la trajectoire reprend les points points et son calque (ou sa
+    # courbe en mode édition) est remplacé. Une trajectoire supprimée depuis n'est recréée que si l'opération l'avait
+    # elle-même supprimée (created) ; sinon l'édition est ignorée.
+    # en : Undo or redo of an edit : the trajectory takes back the points points and its layer (or its curve in edit
+    # mode) is replaced. A trajectory deleted since then is only created again if the operation had itself deleted it
+    # (created) ; otherwise the edit is ignored.
+    def applyEdit(self, trajectory_id, points, created=False):
+        if trajectory_id not in self.repository and not (created and len(points)):
+            return
+        if self.storePoints(trajectory_id, points) is None:
+            return
+        if len(points) == 0:
+            self.trajectoriesChanged.emit([], [trajectory_id])
+            return
+        if trajectory_id in self.curves:
+            self.removeCurve(trajectory_id)
+        if created or trajectory_id in self.shown_layers:
+            self.showLayer(trajectory_id, self.layers.layer(trajectory_id, self.color))
+            if self.editing:
+                self.addCurve(trajectory_id)
+        if created:
+            self.trajectoriesChanged.emit([trajectory_id], [])
+
+
+    # fr : Le point est transmis à l'estimateur ; chaque mesure dont la courbure vient d'être calculée et sort des
+    # limites du braquage ajoute au surlignage la portion du tracé entre la mesure précédente et la suivante.
+    # en : The point is passed to the estimator ; each measurement whose curvature has just been computed and is out of
+    # the steering range adds to the highlight the part of the drawing between the previous and the next measurement.
+    def addEstimatorPoint(self, x, y):
+        samples = None
+        for index in self.estimator.add_point(x, y):
+            if self.estimator.out_of_range(index):
+                samples = self.estimator.samples * self.distance_ratio
+                for a, b in ((max(index - 1, 0), index), (index, index + 1)):
+                    self.steering_overlay.append(QLineF(*samples[a], *samples[b]))
+        if samples is not None:
+            self.viewport().update()
+
+
+    @timed()
+    def paintEvent(self, event):
+        QGraphicsView.paintEvent(self, event)
+        if not self.first_frame:
+            self.first_frame = True
+            record_since("startup.first_frame", STARTED)
+
+
+    # fr : Le surlignage des portions hors limites est ajouté par dessus la scène (en pixels de la scène).
+    # en : The highlight of the out of range parts is added on top of the scene (in scene pixels).
+    def drawForeground(self, painter, rect):
+        if self.steering_overlay:
+            pen = QPen(QColor(255, 0, 0, 160))
+            pen.setWidth(7)
+            pen.setCapStyle(Qt.RoundCap)
+            painter.setPen(pen)
+            painter.drawLines(self.steering_overlay)
+        if self.eraser_overlay:
+            pen = QPen(QColor(255, 255, 255, 200))
+            pen.setWidth(7)
+            pen.setCapStyle(Qt.RoundCap)
+            painter.setPen(pen)
+            painter.drawLines(self.eraser_overlay)
 
 
     # fr : L'événement mouseMoveEvent : Lorsque le dessin est actif et que l'on bouge la souris, on effectue le tracé de
     # la trajectoire et on récolte des données..
     # en : The mouseMoveEvent : When the drawing is active and the mouse is moved, the trajectory is drawn and data
     # is collected.
+    @timed()
     def mouseMoveEvent(self, event):
-        # fr : On initialise les différents parmètres nécessaires au dessin (comme la couleur, l'épaisseur etc...).
-        # en : We initialize the different parameters necessary for the drawing (such as the color, the thickness,
-        # etc.).
-        painter = QPainter(self.pixmap())
-        pen = QPen()
-        pen.setWidth(3)
-        pen.setColor(self.color)
-        pen.setStyle(Qt.SolidLine)
-        painter.setPen(pen)
+        # fr : Déplacement de la vue avec le bouton du milieu.
+        # en : Moving of the view with the middle button.
+        if self.panning is not None:
+            delta = event.pos() - self.panning
+            self.panning = event.pos()
+            self.horizontalScrollBar().setValue(self.horizontalScrollBar().value() - delta.x())
+            self.verticalScrollBar().setValue(self.verticalScrollBar().value() - delta.y())
+            return
+        if self.editing:
+            if self.dragged is not None:
+                self.dragControlPoint(self.scenePosition(event))
+            return
+        if self.erasing:
+            if self.erased is not None:
+                self.eraseAt(self.scenePosition(event))
+            return
 
         # fr : Si le dessin est actif
         # en : if drawing is active
         if self.isDrawing == 1:
-            self.setCursor(QCursor(Qt.CrossCursor))
+            self.viewport().setCursor(QCursor(Qt.CrossCursor))
+            # fr : Position exacte du pointeur dans la scène, en pixels de l'image.
+            # en : Exact position of the pointer in the scene, in pixels of the image.
+            position = self.scenePosition(event)
+            x, y = position.x(), position.y()
             # fr : Si c'est le début du dessin (premier point à tracer).
             # en : if it is the beginning of the drawing (first point to draw);
             if self.previousPoint is None:
                 # fr : On initialise la position de départ.
                 # en : We initialize the starting position;
-                self.start_x = event.x() / self.distance_ratio
-                self.start_y = event.y() / self.distance_ratio
+                self.start_x = x / self.distance_ratio
+                self.start_y = y / self.distance_ratio
+                # fr : On garde la valeur du masque au point de départ pour tout le tracé.
+                # en : The value of the mask at the starting point is kept for the whole drawing.
+                self.start_label = mask_label(self.my_dilatedimage, int(round(x)), int(round(y)))
+                self.all_points.append(x, y, event.timestamp())
+                self.estimator.reset()
+                self.estimator.add_point(x, y)
                 #print("start_x :", self.start_x)
                 #print("start_y :", self.start_y)
                 # fr : le point de départ devient à présent le dernier point tracé.
                 # en : the starting point now becomes the last point plotted.
-                self.previousPoint = event.pos()
+                self.previousPoint = position
                 
                 self.valid_circuit = True
                 
                 return
             
             
-            # fr : Si la couleur du terrain sous le tracé est la même que la couleur
+            # fr : Si la couleur du terrain sous tout le segment tracé est la même que la couleur
             # du terrain au point de départ et que nous sommes en train de dessiner :
-            # en : If the color of the land under the plot is the same as the color
-             # of the terrain at the starting point and that we are drawing:
-            if (self.my_qdilatedimage.pixel(event.pos()) == self.my_qdilatedimage.pixel(QPoint(self.start_x * self.distance_ratio, self.start_y * self.distance_ratio))) :
-                
+            # en : If the color of the land under the whole plotted segment is the same as the color
+            # of the terrain at the starting point and that we are drawing:
+            with span("Canvas.mouseMoveEvent.corridor"):
+                inside = segment_in_corridor(self.my_dilatedimage, self.previousPoint.x(), self.previousPoint.y(),
+                                             x, y, self.start_label)
+            if inside :
                 
-                # fr : On active le "painter" permettant le tracé.
-                # en : We activate the "painter" allowing the drawing.
-                if not painter.isActive():
-                    painter.begin(self)
-
                 # fr : On enregistre tous les points du tracé
                 # en : We save all the drawing points.
-                self.all_points = np.append(self.all_points, event.pos())
+                self.all_points.append(x, y, event.timestamp())
+                with span("Canvas.mouseMoveEvent.estimator"):
+                    self.addEstimatorPoint(x, y)
                 
-                # fr : On trace la droite entre le nouveau point acquis et le précédent.
-                # en : The line is drawn between the new acquired point and the previous one.
-                painter.drawLine(self.previousPoint, event.pos())
-                painter.end()
-
-                self.update()
-
-                # fr : les distances en x et y sont incrémentés à chaque nouveau point mesuré.
-                # en : the distances in x and y are incremented with each new measured point.
-                self.current_distance_x += (event.x() - self.previousPoint.x()) / self.distance_ratio
-                self.current_distance_y += (event.y() - self.previousPoint.y()) / self.distance_ratio
+                # fr : On ajoute au tracé en cours le segment entre le nouveau point acquis et le précédent.
+                # en : The segment between the new acquired point and the previous one is added to the drawing in
+                # progress.
+                self.stroke_item.addSegment(self.previousPoint.x(), self.previousPoint.y(), x, y)
 
                 # fr : Le point actuel devient notre dernier point tracé.
                 # en : The current point becomes our last plotted point.
-                self.previousPoint = event.pos()
-
-                # fr : Notre intervalle courante augmente de 1 car on vient de mesurer un point de plus.
-                # en : Our current interval increases by 1 because we have just measured one more point.
-                self.current_interval += 1
-
-                # fr : Si on a mesuré autant de points que l'intervalle voulue (30).
-                # en : If we have measured as many points as the desired interval (30).
-                if self.current_interval == self.point_interval:
-                    # fr : On calcule la distance linéaire entre le premier et le dernier point de l'intervalle.
-                    # en : We calculate the linear distance between the first and the last point of the interval.
-                    self.current_distance = math.hypot(self.current_distance_x, self.current_distance_y)
-
-                    # fr : La position du dernier point tracé est alors ajouté aux tableaux xpos et ypos.
-                    # en : The position of the last plotted point is then added to the xpos and ypos arrays.
-                    xB = event.x() / self.distance_ratio
-                    yB = event.y() / self.distance_ratio
-                    #print("xB = ", xB, " and yB = ", yB)
-                    self.xpos = np.append(self.xpos, xB)
-                    self.ypos = np.append(self.ypos, yB)
-
-                    # fr : L'intervalle courante et les distances calculés sont alors remis à 0 afin de reparcourir une
-                    # nouvelle intervalle de points.
-                    # en : The current interval and the calculated distances are then reset to 0 in order to cover a new
-                    # interval of points.
-                    self.current_interval = 0
-                    self.current_distance = 0
-                    self.current_distance_x = 0
-                    self.current_distance_y = 0
+                self.previousPoint = position
             
             # fr : Si la couleur du terrain sous le tracé n'est pas la même que la couleur
             # du terrain au point de départ ou que nous ne sommes pas en train de dessiner :
@@ -563,6 +1158,8 @@ class Canvas(QLabel):
                 
                 # fr : The circuit becomes invalid
                 self.valid_circuit = False
+                if self.gesture is not None:
+                    self.gesture = (self.gesture[0], True)
                 
 
 
@@ -587,7 +1184,7 @@ class QPaletteButton(QPushButton):
         self.setFixedSize(QSize(24, 24))
         self.color = color
         self.setStyleSheet("background-color: %s;" % color)
-        self.setCursor(QCursor(QtCore.Qt.PointingHandCursor))
+        self.setCursor(QCursor(Qt.PointingHandCursor))
 
 
 
@@ -602,7 +1199,7 @@ class QButton(QPushButton):
         self.color = color
         self.setStyleSheet("QPushButton::hover{background-color: orange; border-style: outset; border-radius: 10px ;}"
                            "QPushButton{background-color: white; border-style: outset; border-radius: 10px ;}")
-        self.setCursor(QCursor(QtCore.Qt.PointingHandCursor))
+        self.setCursor(QCursor(Qt.PointingHandCursor))
 
 
 
@@ -631,12 +1228,26 @@ class MainWindow(QMainWindow):
         
         # fr : Creation de l'interface du choix de l'affichage des courbes
         # en : Creation of the interface for choosing the display of curves
+        # fr : Les checkboxs sont placées dans une zone défilante pour supporter un grand nombre de courbes. numero
+        # contient l'identifiant (dans le dépôt) de la courbe de chaque checkbox.
+        # en : The checkboxes are placed in a scroll area to support a large number of curves. numero holds the
+        # identifier (in the repository) of the curve of each checkbox.
         self.checkBoxs = QHBoxLayout()
         self.canvas_box.addLayout(self.checkBoxs)        
         self.listCheckBox=[]
         self.numero = []    
         self.courbes = QGridLayout()                 
+        self.courbes.setAlignment(Qt.AlignTop)
+        courbesWidget = QWidget()
+        courbesWidget.setLayout(self.courbes)
+        courbesArea = QScrollArea()
+        courbesArea.setWidgetResizable(True)
+        courbesArea.setWidget(courbesWidget)
+        courbesArea.setFixedWidth(240)
+        self.checkBoxs.addWidget(courbesArea)
         self.button_delete = QButton("#000000","Delete")
+        self.button_delete.clicked.connect(self.deletecheckBox)
+        self.button_delete.setVisible(False)
 
         # fr : Ajout et affichage de la palette de couleurs dans la fenêtre principale.
         # en : Added and displayed the color palette in the main window.
@@ -676,14 +1287,71 @@ class MainWindow(QMainWindow):
 
         self.add_action_buttons(loadingButton, actions)
 
-        # TODO fr : le bouton suivant est encore en cours d'écriture et ne fonctionne pas de la bonne manière à ce jour.
-        # TODO en : the following button is still being written and not working the right way so far.
-        """eraseButton = QButton("#000000", "ACTIVE/DESACTIVE ERASER")
-        eraseButton.clicked.connect(self.canvas.changeEraseMode)
-        layout.addWidget(eraseButton)"""
+        # fr : Ajout du bouton "EDIT CURVES" : tant qu'il est enfoncé, les courbes affichées sont éditables.
+        # en : Addition of the "EDIT CURVES" button : as long as it is down, the shown curves are editable.
+        editButton = QButton("#000000", "EDIT CURVES")
+        editButton.setCheckable(True)
+        editButton.toggled.connect(self.canvas.changeEditMode)
+        self.canvas.editModeChanged.connect(editButton.setChecked)
+
+        self.add_action_buttons(editButton, actions)
+
+        # fr : Ajout des boutons "UNDO" et "REDO" (raccourcis habituels du système, par exemple Ctrl+Z et Ctrl+Y).
+        # en : Addition of the "UNDO" and "REDO" buttons (usual shortcuts of the system, for example Ctrl+Z and Ctrl+Y).
+        undoButton = QButton("#000000", "UNDO")
+        undoButton.setShortcut(QKeySequence.Undo)
+        undoButton.clicked.connect(self.canvas.undo)
+
+        self.add_action_buttons(undoButton, actions)
+
+        redoButton = QButton("#000000", "REDO")
+        redoButton.setShortcut(QKeySequence.Redo)
+        redoButton.clicked.connect(self.canvas.redo)
+
+        self.add_action_buttons(redoButton, actions)
+
+        # fr : Ajout du choix du circuit : les circuits des trajectoires enregistrées, et l'ouverture d'une autre image.
+        # en : Addition of the choice of the circuit : the circuits of the saved trajectories, and the opening of
+        # another image.
+        self.circuitBox = QComboBox()
+        self.circuitBox.setStyleSheet("background-color: white;")
+        for circuit in [self.canvas.circuit] + self.canvas.repository.circuits():
+            if self.circuitBox.findText(circuit) < 0:
+                self.circuitBox.addItem(circuit)
+        self.circuitBox.addItem("OPEN CIRCUIT...")
+        self.circuitBox.activated.connect(self.chooseCircuit)
+        self.canvas.circuitChanged.connect(self.circuitChanged)
+
+        self.add_action_buttons(self.circuitBox, actions)
+
+        # fr : Ajout du choix de la dilatation des bords du circuit (marge de la voiture, en pixels).
+        # en : Addition of the choice of the dilation of the circuit edges (car clearance, in pixels).
+        dilationBox = QSpinBox()
+        dilationBox.setRange(0, 100)
+        dilationBox.setPrefix("dilation : ")
+        dilationBox.setSuffix(" px")
+        dilationBox.setValue(self.canvas.dilation)
+        dilationBox.setStyleSheet("background-color: white;")
+        dilationBox.valueChanged.connect(self.canvas.set_dilation)
+
+        self.add_action_buttons(dilationBox, actions)
+
+        # fr : Ajout du bouton "ERASER" : tant qu'il est enfoncé, la souris efface les portions de courbes affichées.
+        # en : Addition of the "ERASER" button : as long as it is down, the mouse erases parts of the shown curves.
+        eraseButton = QButton("#000000", "ERASER")
+        eraseButton.setCheckable(True)
+        eraseButton.toggled.connect(self.canvas.changeEraseMode)
+        self.canvas.eraseModeChanged.connect(eraseButton.setChecked)
+        self.canvas.trajectoriesChanged.connect(self.trajectoriesChanged)
+
+        self.add_action_buttons(eraseButton, actions)
 
         self.layout.addLayout(actions)
         self.setCentralWidget(widget)
+
+        # fr : On recrée les checkboxs des courbes déjà enregistrées sur ce circuit lors des sessions précédentes.
+        # en : The checkboxes of the curves already saved on this circuit during previous sessions are created again.
+        self.circuitChanged(self.canvas.circuit)
         
         self.setGeometry(0,0,1400,480)
         self.geometry()
@@ -702,7 +1370,7 @@ class MainWindow(QMainWindow):
             b = QPaletteButton(c)
             # fr : La méthode set_pen_color est appelée à chaque clic sur le bouton en question.
             # en : The set_pen_color method is called each time the button in question is clicked.
-            b.pressed.connect(lambda c=c: self.canvas.set_pen_color(c))
+            b.pressed.connect(lambda c=c, canvas=self.canvas: canvas.set_pen_color(c))
             layout.addWidget(b)
 
 
@@ -712,116 +1380,107 @@ class MainWindow(QMainWindow):
             layout.addWidget(button)
 
 
-    # fr : Méthode qui permet d'ajouter une checkbox lorsqu'on enregistre une courbe.
-    # TODO : Créer un système qui insert les checkboxs dans la QVBoxLayout et qui les gèrent 
-    # à partir d'indices pour éviter de recréer toutes les checkboxs a chaque fois.
-    # en : Method that adds a checkbox when saving a curve.
-    # TODO: Create a system that inserts checkboxes in the QVBoxLayout and manages them 
-    # by indexes to avoid recreating all checkboxes each time.
+    # fr : Méthode qui permet d'ajouter une checkbox lorsqu'on enregistre une courbe. Une validation réussie vide le
+    # tracé en cours ; s'il reste des points, le tracé était trop court et aucune trajectoire n'a été enregistrée.
+    # en : Method that adds a checkbox when saving a curve. A successful validation empties the drawing in progress ;
+    # if points are left, the drawing was too short and no trajectory was saved.
     def addCheckBox(self):
-        if(self.canvas.valid_circuit): 
-                self.button_delete.setParent(None)
-                
-                # fr : on numerote chacune des checkboxs en commençant par 0.
-                # en : we number each of the checkboxes starting with 0.
-                if (self.numero == []):
-                    indice = 0
-                else: 
-                    indice = self.numero[-1]+1 
-                
-                self.numero.append(indice) 
-                    
-                                        
-                # fr : on ajoute la case manquante par rapport à la courbe enregistree
-                # en : we add the missing box in relation to the saved curve
-                self.listCheckBox.append("courbe "+str(indice))
-                
-                # fr : On renomme les cases en fonction du numero.
-                # en : We rename the boxes according to the number.
-                for i in range(0, len(self.listCheckBox)):
-                    self.listCheckBox[i] = "courbe"+str(self.numero[i]+1)
-                    print(self.numero[i]+1)
-
-                # fr : On associe les noms avec des cases a cocher.
-                # en : We associate the names with checkboxes.
-                for i, v in enumerate(self.listCheckBox):
-                    self.listCheckBox[i] = QCheckBox(v)
-                    self.listCheckBox[i].toggled.connect(self.checkboxChanged)
-                    
-                    self.courbes.addWidget(self.listCheckBox[i],i,0)
-                    
-                self.listCheckBox[indice].setChecked(True)
-                self.checkBoxs.addLayout(self.courbes)                
-                
-                # fr : On ajoute les boutons suivant, appelés lorsqu'on valide un circuit.
-                # en: We add the following buttons, called when we validate a circuit.
-                self.button_delete = QButton("#000000","Delete")
-                self.button_delete.clicked.connect(self.deletecheckBox)
-                
-                self.courbes.addWidget(self.button_delete)
-                
+        if(self.canvas.valid_circuit and len(self.canvas.all_points) == 0): 
+                self.addTrajectoryCheckBox(self.canvas.last_trajectory_id, True)
                 self.canvas.valid_circuit = False
 
 
-    # fr : Méthode qui permet de supprimer une checkbox lorsqu'on supprime une courbe.
-    # TODO adapter cette méthode pour la suppression de plusieurs courbes à la fois (On a remarquer des erreurs)
-    # en : Method that delete a checkbox when deleting a curve.
-    # TODO adapt this method for deleting multiple curves at once (error remarqued)
+    # fr : Méthode qui insère, à la fin de la liste, la checkbox de la trajectoire d'identifiant trajectory_id, sans
+    # recréer les autres checkboxs. Le bouton "Delete" est replacé sous la dernière checkbox.
+    # en : Method that inserts, at the end of the list, the checkbox of the trajectory of identifier trajectory_id,
+    # without recreating the other checkboxes. The "Delete" button is moved under the last checkbox.
+    def addTrajectoryCheckBox(self, trajectory_id, checked=False):
+        checkBox = QCheckBox("courbe"+str(trajectory_id))
+        self.courbes.addWidget(checkBox, len(self.listCheckBox), 0)
+        self.listCheckBox.append(checkBox)
+        self.numero.append(trajectory_id)
+
+        self.courbes.addWidget(self.button_delete, len(self.listCheckBox), 0)
+        self.button_delete.setVisible(True)
+
+        checkBox.setChecked(checked)
+        checkBox.toggled.connect(self.checkboxChanged)
+        if checked:
+            self.checkboxChanged()
+
+
+    # fr : Méthode qui permet de supprimer les checkboxs cochées et leurs courbes. Les courbes sont supprimées du dépôt
+    # en une seule transaction ; les autres checkboxs gardent leur nom puisque les identifiants ne changent pas.
+    # en : Method that deletes the checked checkboxes and their curves. The curves are deleted from the repository in
+    # a single transaction ; the other checkboxes keep their name since the identifiers do not change.
     def deletecheckBox(self):
-        indice = []
-        
-        # fr : On ajoute au tableau d'indice les checkboxs à supprimer.
-        # en : We add to the index array the checkboxes to delete.
-        for i,v in enumerate(self.listCheckBox):
-            if(v.checkState()):
-                indice.append(self.listCheckBox.index(v))
-                self.canvas.deleteTrajectory(self.listCheckBox.index(v))
-                
-                
-        i = len(self.listCheckBox)-1
-        
-        # fr : On supprime les toutes les cases a cocher en partant de la fin jusqu'à la dernière checkbox supprimée.
-        # en : We remove all the checkboxes starting from the end until the last checkbox removed.
-        while (i>= indice[0]):
-            self.listCheckBox[-1].deleteLater()
-            self.listCheckBox.pop() 
-            i-=1
-
-        # fr : On supprime les numéros des checkboxs supprimée de la liste de toutes les checkboxs.
-        # en : We delete the numbers of the deleted checkboxes from the list of all checkboxes.
-        for j in reversed(indice):
-            del self.numero[j]
-
-        # fr : nommer les courbes apres la courbes supprimées
-        # en : name the curves after the one deleted
-        for j in range(indice[0], self.canvas.compteur):
-            self.listCheckBox.append("courbe"+str(self.numero[j]+1))
-        
-        # fr : nommer les courbes avant la courbes supprimées
-        # en : name the curves before the one deleted
-        k=0
-        while k<indice[0]:
-            self.listCheckBox[k]="courbe"+str(self.numero[k]+1)
-            k+=1
-
-        # fr : supprimer les doublons dans la liste
-        # en : delete the same numbers in the list
-        for i in range(len(self.listCheckBox), len(self.numero)):
-            del self.numero[-1]        
-    
-        # fr : On associe les noms avec des cases a cocher.
-        # en : We associate the names with checkboxes.
-        for j, v in enumerate(self.listCheckBox):
-            self.listCheckBox[j] = QCheckBox(v)
-            self.listCheckBox[j].toggled.connect(self.checkboxChanged)
-            self.courbes.addWidget(self.listCheckBox[j],j,0)
-        self.layout.addLayout(self.courbes)
-        
+        indice = [i for i, v in enumerate(self.listCheckBox) if v.isChecked()]
+        if not indice:
+            return
+        self.canvas.deleteTrajectories([self.numero[i] for i in indice])
+        self.removeCheckBoxes(indice)
+        self.checkboxChanged()
+
+
+    # fr : On retire les checkboxs d'indices indice puis on replace les autres dans la grille.
+    # en : The checkboxes of indices indice are removed then the other ones are placed again in the grid.
+    def removeCheckBoxes(self, indice):
+        for i in indice:
+            self.courbes.removeWidget(self.listCheckBox[i])
+            self.listCheckBox[i].deleteLater()
+        kept = [i for i in range(len(self.listCheckBox)) if i not in set(indice)]
+        self.listCheckBox = [self.listCheckBox[i] for i in kept]
+        self.numero = [self.numero[i] for i in kept]
+        for row, checkBox in enumerate(self.listCheckBox):
+            self.courbes.addWidget(checkBox, row, 0)
+        self.courbes.addWidget(self.button_delete, len(self.listCheckBox), 0)
+
         # fr : reglage de l affichage des boutons
         # en : boutons appearances
-        if(self.canvas.compteur==0):
-            self.button_delete.setParent(None)
-        window.show()
+        self.button_delete.setVisible(len(self.listCheckBox) > 0)
+
+
+    # fr : Les checkboxs suivent les trajectoires créées et supprimées par la gomme : une nouvelle checkbox est cochée
+    # si sa courbe est affichée, sans redessiner le canvas.
+    # en : The checkboxes follow the trajectories created and deleted by the eraser : a new checkbox is checked if its
+    # curve is shown, without repainting the canvas.
+    def trajectoriesChanged(self, added, removed):
+        removed = set(removed)
+        self.removeCheckBoxes([i for i, trajectory_id in enumerate(self.numero) if trajectory_id in removed])
+        for trajectory_id in added:
+            if trajectory_id in self.numero:
+                continue
+            self.addTrajectoryCheckBox(trajectory_id)
+            checkBox = self.listCheckBox[-1]
+            checkBox.blockSignals(True)
+            checkBox.setChecked(trajectory_id in self.canvas.shown_layers)
+            checkBox.blockSignals(False)
+
+
+    # fr : Choix d'un circuit dans la liste ; le dernier élément ouvre une image choisie par l'utilisateur.
+    # en : Choice of a circuit in the list ; the last item opens an image chosen by the user.
+    def chooseCircuit(self, index):
+        if index == self.circuitBox.count() - 1:
+            path, _ = QFileDialog.getOpenFileName(self, "Circuit", "", "Images (*.png *.jpg *.jpeg *.bmp)")
+            if not path:
+                self.circuitBox.setCurrentText(self.canvas.circuit)
+                return
+            relative = os.path.relpath(path)
+            circuit = path if relative.startswith("..") else relative
+        else:
+            circuit = self.circuitBox.itemText(index)
+        self.canvas.setCircuit(circuit)
+
+
+    # fr : Les checkboxs sont remplacées par celles des courbes du nouveau circuit.
+    # en : The checkboxes are replaced by the ones of the curves of the new circuit.
+    def circuitChanged(self, circuit):
+        if self.circuitBox.findText(circuit) < 0:
+            self.circuitBox.insertItem(self.circuitBox.count() - 1, circuit)
+        self.circuitBox.setCurrentText(circuit)
+        self.removeCheckBoxes(list(range(len(self.listCheckBox))))
+        for trajectory_id in self.canvas.repository.ids(circuit):
+            self.addTrajectoryCheckBox(trajectory_id)
 
 
     # fr : Méthode qui permet de decocher toutes les checkboxs lorsqu'on supprime une courbe.
@@ -829,24 +1488,50 @@ class MainWindow(QMainWindow):
     def uncochedCheckBox(self):
         for i , v in enumerate(self.listCheckBox):
             if(v.checkState()):
-                v.setCheckState(False)
+                # fr : Le canvas vient d'être effacé : inutile de le redessiner pour chaque case décochée.
+                # en : The canvas has just been cleared : no need to repaint it for each unchecked box.
+                v.blockSignals(True)
+                v.setChecked(False)
+                v.blockSignals(False)
 
 
     # fr : Méthode qui permet d'afficher les coubres en fonction des checkboxs cochées.
     # en : Method used to display the curves according to the checked checkboxes.
-    def checkboxChanged(self):
-        self.canvas.clear_circuit()
-        for i,v in enumerate(self.listCheckBox):
-            if(v.checkState()):
-                self.canvas.loadChosenTrajectory(self.listCheckBox.index(v))
+    @timed()
+    def checkboxChanged(self, checked=False):
+        self.canvas.showTrajectories([self.numero[i] for i, v in enumerate(self.listCheckBox) if v.checkState()])
+
+
+    # fr : Les chargements du Canvas sont attendus à la fermeture de la fenêtre, ou à sa destruction si elle n'a pas été
+    # fermée (scripts).
+    # en : The loadings of the Canvas are waited for when the window is closed, or when it is destroyed if it was not
+    # closed (scripts).
+    def closeEvent(self, event):
+        self.canvas.stopCorridorLoaders()
+        super().closeEvent(event)
+
+
+    def __del__(self):
+        # fr : À la sortie de l'interpréteur, Qt a pu détruire le Canvas (et ses chargements) avant la fenêtre.
+        # en : When the interpreter exits, Qt may have destroyed the Canvas (and its loadings) before the window.
+        try:
+            self.canvas.stopCorridorLoaders()
+        except RuntimeError:
+            pass
+
+
 
+def main():
+    app = QApplication.instance()
+    if not app:
+        app = QApplication(sys.argv)
 
+    window = MainWindow()
+    window.show()
+    app.aboutToQuit.connect(window.canvas.stopCorridorLoaders)
 
-app = QApplication.instance()
-if not app:
-    app = QApplication(sys.argv)
+    return app.exec_()
 
-window = MainWindow()
-window.show()
 
-app.exec_()
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# Benchmark : performance measurements of the Canvas paths (drawing, validation, loading and toggling of trajectories).
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# fr : Utilisation : python benchmark.py [--lengths 250 1000 4000] [--repeat 5] [--json resultats.json]
+#                    python benchmark.py --baseline resultats.json     (code de retour 1 en cas de régression)
+#                    python benchmark.py --session session.jsonl       (session enregistrée avec event_replay.py)
+# en : Usage : python benchmark.py [--lengths 250 1000 4000] [--repeat 5] [--json results.json]
+#              python benchmark.py --baseline results.json     (exit code 1 on regression)
+#              python benchmark.py --session session.jsonl       (session recorded with event_replay.py)
+# fr : Les mesures se font sans fenêtre (QT_QPA_PLATFORM=offscreen), dans un dossier temporaire : le dépôt et les
+# fichiers exportés du dossier courant ne sont pas modifiés.
+# en : The measurements run without window (QT_QPA_PLATFORM=offscreen), in a temporary folder : the repository and the
+# exported files of the current folder are not modified.
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication
+
+import event_replay
+
+
+LENGTHS = (250, 1000, 4000)
+# fr : Budget de démarrage : la fenêtre doit s'afficher en moins d'une seconde après le lancement de Python.
+# en : Startup budget : the window must show up less than one second after Python is launched.
+STARTUP_BUDGET = 1.0
+
+# fr : Programme lancé dans un processus neuf pour mesurer le démarrage : il affiche les instants (time.time) de fin
+# des imports, du premier affichage du canvas et de la fin du chargement du masque.
+# en : Program run in a fresh process to measure the startup : it prints the times (time.time) of the end of the
+# imports, of the first frame of the canvas and of the end of the loading of the mask.
+STARTUP_PROBE = """
+import json, sys, time
+from PyQt5.QtCore import QEvent, QObject, QTimer
+from PyQt5.QtWidgets import QApplication
+app = QApplication(sys.argv)
+import Projet
+times = {"import": time.time()}
+
+class FirstFrame(QObject):
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Paint and "first_frame" not in times:
+            times["first_frame"] = time.time()
+            done()
+        return False
+
+def ready():
+    times["corridor_ready"] = time.time()
+    done()
+
+def done():
+    if "first_frame" in times and "corridor_ready" in times:
+        app.quit()
+
+window = Projet.MainWindow()
+window.canvas.viewport().installEventFilter(FirstFrame(window))
+window.canvas.corridorReady.connect(ready)
+# fr : Pyramide déjà dans le cache : le masque est prêt dès la construction de la fenêtre.
+# en : Pyramid already in the cache : the mask is ready as soon as the window is built.
+if window.canvas.my_dilatedimage is not None:
+    ready()
+window.show()
+QTimer.singleShot(30000, app.quit)
+app.exec_()
+print(json.dumps(times))
+"""
+
+# fr : Mesures pour lesquelles une valeur plus grande est meilleure (les autres sont des durées).
+# en : Measurements for which a larger value is better (the other ones are durations).
+HIGHER_IS_BETTER = ("events_per_second",)
+
+
+def _timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+# fr : Mesures pour un tracé : débit d'évènements dans mouseMoveEvent, durée de la validation, du premier affichage
+# de la trajectoire (calque à construire) puis des suivants (calque en cache), et du décochage/cochage de sa checkbox.
+# en : Measurements for one stroke : event rate through mouseMoveEvent, duration of the validation, of the first
+# display of the trajectory (layer to build) then of the next ones (cached layer), and of the unchecking/checking of
+# its checkbox.
+def measure_stroke(window, events):
+    canvas = window.canvas
+    canvas.clear_circuit()
+    window.uncochedCheckBox()
+
+    moves = sum(event["type"] == "move" for event in events)
+    replay_time = _timed(event_replay.replay, canvas, events)
+    drawn = len(canvas.all_points)
+    validate_time = _timed(canvas.validate_circuit)
+    window.addCheckBox()
+
+    trajectory_id = canvas.last_trajectory_id
+    canvas.layers.invalidate(trajectory_id)
+    load_cold = _timed(canvas.loadChosenTrajectory, trajectory_id)
+    load_warm = _timed(canvas.loadChosenTrajectory, trajectory_id)
+    checkBox = window.listCheckBox[window.numero.index(trajectory_id)]
+    toggle_time = (_timed(checkBox.setChecked, False) + _timed(checkBox.setChecked, True)) / 2
+    return {"moves": moves, "points": drawn, "events_per_second": moves / replay_time if replay_time else 0.0,
+            "validate": validate_time, "load_cold": load_cold, "load_warm": load_warm, "toggle": toggle_time}
+
+
+# fr : Démarrage de l'interface dans un processus neuf (dans le dossier courant) : durées depuis le lancement jusqu'à la
+# fin des imports, au premier affichage et au masque prêt.
+# en : Startup of the interface in a fresh process (in the current folder) : durations from launch to the end of the
+# imports, to the first frame and to the mask being ready.
+def measure_startup(project_folder):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (project_folder, os.environ.get("PYTHONPATH")))))
+    launched = time.time()
+    output = subprocess.run([sys.executable, "-c", STARTUP_PROBE], env=env, capture_output=True, text=True,
+                            check=True).stdout
+    times = json.loads(output.strip().splitlines()[-1])
+    return {key: value - launched for key, value in times.items()}
+
+
+# fr : Médiane de chaque mesure sur repeat répétitions.
+# en : Median of each measurement over repeat repetitions.
+def run(window, events, repeat):
+    runs = [measure_stroke(window, events) for _ in range(repeat)]
+    return {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+
+def print_results(results, file=sys.stdout):
+    startup = results.get("startup")
+    if startup is not None:
+        print("startup : imports %.0f ms, first frame %.0f ms (budget %.0f ms), mask ready %.0f ms"
+              % (1e3 * startup["import"], 1e3 * startup["first_frame"], 1e3 * STARTUP_BUDGET,
+                 1e3 * startup["corridor_ready"]), file=file)
+    print("%-16s %8s %8s %12s %10s %10s %10s %10s" % ("stroke", "moves", "points", "events/s", "validate", "load cold",
+                                                     "load warm", "toggle"), file=file)
+    for name, r in results.items():
+        if name == "startup":
+            continue
+        print("%-16s %8d %8d %12.0f %8.2fms %8.2fms %8.2fms %8.2fms"
+              % (name, r["moves"], r["points"], r["events_per_second"], 1e3 * r["validate"], 1e3 * r["load_cold"],
+                 1e3 * r["load_warm"], 1e3 * r["toggle"]), file=file)
+
+
+# fr : Comparaison avec des résultats de référence : renvoie la liste des mesures dégradées de plus de tolerance (en
+# proportion).
+# en : Comparison with baseline results : returns the list of the measurements degraded by more than tolerance (as a
+# proportion).
+def regressions(results, baseline, tolerance):
+    found = []
+    for name, r in results.items():
+        for key, value in r.items():
+            reference = baseline.get(name, {}).get(key)
+            if key in ("moves", "points") or not reference:
+                continue
+            change = reference / value - 1 if key in HIGHER_IS_BETTER else value / reference - 1
+            if change > tolerance:
+                found.append("%s %s : %.3g -> %.3g (%+.0f%%)" % (name, key, reference, value, 100 * change))
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Canvas drawing, validation and loading paths.")
+    parser.add_argument("--lengths", type=int, nargs="+", default=LENGTHS, help="number of mouse moves per stroke")
+    parser.add_argument("--session", default=None, help="also measure a session recorded with event_replay.py")
+    parser.add_argument("--repeat", type=int, default=5, help="repetitions per stroke (the median is kept)")
+    parser.add_argument("--json", default=None, help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=None, help="compare with the results of a previous --json run")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    session = os.path.abspath(args.session) if args.session else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    folder = tempfile.mkdtemp(prefix="benchmark_")
+    cwd = os.getcwd()
+    try:
+        # fr : Le circuit et le cache du champ de distance sont partagés avec le dossier du projet.
+        # en : The circuit and the distance field cache are shared with the project folder.
+        import Projet
+        import corridor
+        for name in ("circuitMIA.png", corridor.CACHE_DIR):
+            if os.path.exists(os.path.join(here, name)):
+                os.symlink(os.path.join(here, name), os.path.join(folder, name))
+        os.chdir(folder)
+        startup = [measure_startup(here) for _ in range(args.repeat)]
+        window = Projet.MainWindow()
+        if not window.canvas.waitForCorridor():
+            return 1
+
+        strokes = {"synthetic %d" % n: event_replay.synthetic_stroke(window.canvas.distance_field, n)
+                   for n in args.lengths}
+        if session is not None:
+            strokes[os.path.basename(session)] = event_replay.read_events(session)
+        results = {name: run(window, events, args.repeat) for name, events in strokes.items()}
+        results["startup"] = {key: statistics.median(run[key] for run in startup) for key in startup[0]}
+        window.canvas.repository.close()
+        # fr : La fenêtre est fermée (ses chargements sont attendus, voir Canvas.stopCorridorLoaders) et les évènements
+        # en attente traités avant de supprimer le dossier temporaire.
+        # en : The window is closed (its loadings are waited for, see Canvas.stopCorridorLoaders) and the pending
+        # events processed before removing the temporary folder.
+        window.close()
+        app.processEvents()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(folder, ignore_errors=True)
+
+    print_results(results)
+    if json_path is not None:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=2)
+    found = []
+    if results["startup"]["first_frame"] > STARTUP_BUDGET:
+        found.append("startup first_frame : %.0f ms over the %.0f ms budget"
+                     % (1e3 * results["startup"]["first_frame"], 1e3 * STARTUP_BUDGET))
+    if baseline_path is not None:
+        with open(baseline_path) as f:
+            found.extend(regressions(results, json.load(f), args.tolerance))
+    for line in found:
+        print("regression : " + line)
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
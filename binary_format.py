@@ -0,0 +1,144 @@
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# Binary format : compact, memory-mappable storage of the trajectory and points files.
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# fr : Un fichier commence par un en-tête de 64 octets (little-endian) :
+#   - magic "PRJT" (4 octets), version (uint16), type (uint16 : 1 = trajectoire, 2 = points), nombre de lignes (uint32)
+#   - dtype NumPy des données (8 octets ASCII, ex. "<f4")
+#   - position et angle de départ (3 float64, nuls pour un fichier points)
+# puis viennent les données brutes : un tableau (n, 2) de float32 (vitesse, angle) ou de int16 (x, y en pixels).
+# en : A file starts with a 64 bytes header (little-endian) :
+#   - magic "PRJT" (4 bytes), version (uint16), kind (uint16 : 1 = trajectory, 2 = points), number of rows (uint32)
+#   - NumPy dtype of the data (8 ASCII bytes, e.g. "<f4")
+#   - starting position and angle (3 float64, zero for a points file)
+# then comes the raw data : an (n, 2) array of float32 (speed, angle) or of int16 (x, y in pixels).
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# fr : Utilisation : python binary_format.py to-bin trajectoire1.txt points1.txt
+#                    python binary_format.py to-txt trajectoire1.bin points1.bin
+# en : Usage : python binary_format.py to-bin trajectoire1.txt points1.txt
+#              python binary_format.py to-txt trajectoire1.bin points1.bin
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+import argparse
+import os
+import struct
+import sys
+import numpy as np
+
+import trajectory_compiler
+
+
+MAGIC = b"PRJT"
+VERSION = 1
+KIND_TRAJECTORY = 1
+KIND_POINTS = 2
+HEADER = struct.Struct("<4sHHI8s3d")
+HEADER_SIZE = 64
+
+TRAJECTORY_DTYPE = np.dtype("<f4")
+POINTS_DTYPE = np.dtype("<i2")
+
+
+def _write(path, kind, data, start=(0.0, 0.0, 0.0)):
+    data = np.ascontiguousarray(data).reshape(-1, 2)
+    header = HEADER.pack(MAGIC, VERSION, kind, len(data), data.dtype.str.encode().ljust(8), *(float(v) for v in start))
+    with open(path, "wb") as f:
+        f.write(header.ljust(HEADER_SIZE, b"\0"))
+        f.write(data.tobytes())
+
+
+# fr : Lecture de l'en-tête puis des données. Avec mmap=True les données ne sont pas copiées : le tableau renvoyé est
+# une vue en lecture seule sur le fichier.
+# en : Reading of the header then of the data. With mmap=True the data is not copied : the returned array is a
+# read-only view on the file.
+def _read(path, kind, mmap=True):
+    with open(path, "rb") as f:
+        magic, version, file_kind, count, dtype, *start = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("%s is not a binary trajectory/points file" % path)
+        if version != VERSION:
+            raise ValueError("%s has an unsupported version %d" % (path, version))
+        if file_kind != kind:
+            raise ValueError("%s holds kind %d data, expected %d" % (path, file_kind, kind))
+        dtype = np.dtype(dtype.rstrip(b"\0 ").decode())
+        if mmap and count:
+            data = np.memmap(path, dtype=dtype, mode="r", offset=HEADER_SIZE, shape=(count, 2))
+        else:
+            f.seek(HEADER_SIZE)
+            data = np.fromfile(f, dtype=dtype, count=2 * count).reshape(count, 2)
+    return tuple(start), data
+
+
+# fr : Fichier trajectoire : position et angle de départ dans l'en-tête, commandes (vitesse, angle) en float32.
+# en : Trajectory file : starting position and angle in the header, commands (speed, angle) as float32.
+def write_trajectory_bin(path, start, speed, angle_array):
+    _write(path, KIND_TRAJECTORY, np.column_stack((speed, angle_array)).astype(TRAJECTORY_DTYPE), start)
+
+
+def read_trajectory_bin(path, mmap=True):
+    return _read(path, KIND_TRAJECTORY, mmap)
+
+
+# fr : Fichier points : couples (x, y) en pixels, en int16 (ou int32 si une coordonnée ne tient pas sur 16 bits).
+# en : Points file : (x, y) pairs in pixels, as int16 (or int32 if a coordinate does not fit in 16 bits).
+def write_points_bin(path, points):
+    points = np.asarray(points).reshape(-1, 2)
+    info = np.iinfo(POINTS_DTYPE)
+    fits = len(points) == 0 or (points.min() >= info.min and points.max() <= info.max)
+    _write(path, KIND_POINTS, points.astype(POINTS_DTYPE if fits else np.dtype("<i4")))
+
+
+def read_points_bin(path, mmap=True):
+    return _read(path, KIND_POINTS, mmap)[1]
+
+
+# fr : Convertisseurs depuis et vers les fichiers texte attendus par RVIZ.
+# en : Converters from and to the text files expected by RVIZ.
+def trajectory_txt_to_bin(txt_path, bin_path):
+    start, commands = trajectory_compiler.read_trajectory(txt_path)
+    write_trajectory_bin(bin_path, start, commands[:, 0], commands[:, 1])
+
+
+def trajectory_bin_to_txt(bin_path, txt_path):
+    start, commands = read_trajectory_bin(bin_path)
+    trajectory_compiler.write_trajectory(txt_path, start, commands[:, 0], commands[:, 1])
+
+
+def points_txt_to_bin(txt_path, bin_path):
+    write_points_bin(bin_path, trajectory_compiler.read_points(txt_path))
+
+
+def points_bin_to_txt(bin_path, txt_path):
+    trajectory_compiler.write_points(txt_path, read_points_bin(bin_path))
+
+
+# fr : Type (trajectoire ou points) d'un fichier binaire, lu dans son en-tête.
+# en : Kind (trajectory or points) of a binary file, read from its header.
+def file_kind(path):
+    with open(path, "rb") as f:
+        return HEADER.unpack(f.read(HEADER.size))[2]
+
+
+def _is_points_file(path):
+    return os.path.basename(path).startswith("points")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert trajectory and points files between text and binary.")
+    parser.add_argument("direction", choices=("to-bin", "to-txt"))
+    parser.add_argument("files", nargs="+", help="files to convert, written next to the originals")
+    args = parser.parse_args(argv)
+
+    for path in args.files:
+        root = os.path.splitext(path)[0]
+        if args.direction == "to-bin":
+            convert = points_txt_to_bin if _is_points_file(path) else trajectory_txt_to_bin
+            convert(path, root + ".bin")
+        else:
+            convert = points_bin_to_txt if file_kind(path) == KIND_POINTS else trajectory_bin_to_txt
+            convert(path, root + ".txt")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
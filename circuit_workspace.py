@@ -0,0 +1,92 @@
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# Circuit workspace : bounded cache of the circuits opened during a session (background, corridor mask and journal).
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+from collections import OrderedDict
+
+from corridor import corridor_mask
+from scene_items import TileLayerItem
+from stroke_journal import StrokeJournal
+
+
+# fr : La classe CircuitState garde ce qui est propre à un circuit : sa pyramide de tuiles (image et champ de distance,
+# voir tile_pyramid.py), le calque de fond qui garde en cache ses tuiles déjà converties en QPixmap, le masque du
+# couloir pour la dernière dilatation demandée et le journal des tracés (voir stroke_journal.py). La pyramide vaut None
+# tant qu'elle n'est pas chargée.
+# en : The CircuitState class keeps what belongs to a circuit : its tile pyramid (image and distance field, see
+# tile_pyramid.py), the background layer which keeps in cache its tiles already converted to QPixmap, the corridor mask
+# for the last requested dilation and the journal of the drawings (see stroke_journal.py). The pyramid is None as long
+# as it is not loaded.
+class CircuitState:
+
+    def __init__(self, circuit):
+        self.circuit = circuit
+        self.pyramid = None
+        self.background = None
+        self.journal = StrokeJournal()
+        self.dilation = None
+        self.mask = None
+
+
+    def set_pyramid(self, pyramid):
+        if pyramid is self.pyramid:
+            return
+        self.pyramid = pyramid
+        self.background = TileLayerItem(pyramid)
+        self.dilation = self.mask = None
+
+
+    # fr : Masque du couloir à dilation pixels des bords (None tant que la pyramide n'est pas chargée).
+    # en : Corridor mask at dilation pixels from the borders (None as long as the pyramid is not loaded).
+    def corridor(self, dilation):
+        if self.pyramid is None:
+            return None
+        if dilation != self.dilation:
+            self.mask = corridor_mask(self.pyramid.field, dilation)
+            self.dilation = dilation
+        return self.mask
+
+
+# fr : La classe CircuitWorkspace garde les capacity derniers circuits ouverts : revenir à l'un d'eux est immédiat
+# (ni relecture de la pyramide, ni conversion des tuiles déjà affichées). Au-delà, le circuit le moins récemment
+# ouvert est oublié avec son fond, son masque et son journal ; sa pyramide reste en cache sur le disque.
+# en : The CircuitWorkspace class keeps the last capacity opened circuits : going back to one of them is immediate
+# (neither reading the pyramid again, nor converting the tiles already shown). Beyond, the least recently opened circuit
+# is forgotten with its background, its mask and its journal ; its pyramid stays cached on disk.
+class CircuitWorkspace:
+
+    def __init__(self, capacity=4):
+        self.capacity = capacity
+        self._circuits = OrderedDict()
+
+
+    def __len__(self):
+        return len(self._circuits)
+
+
+    def __contains__(self, circuit):
+        return circuit in self._circuits
+
+
+    # fr : Circuits gardés, du moins récemment au plus récemment ouvert.
+    # en : Kept circuits, from the least to the most recently opened.
+    def circuits(self):
+        return list(self._circuits)
+
+
+    def get(self, circuit):
+        return self._circuits.get(circuit)
+
+
+    # fr : État du circuit circuit (créé s'il n'est pas gardé), qui devient le plus récemment ouvert.
+    # en : State of the circuit circuit (created if it is not kept), which becomes the most recently opened.
+    def open(self, circuit):
+        state = self._circuits.get(circuit)
+        if state is None:
+            state = self._circuits[circuit] = CircuitState(circuit)
+            while len(self._circuits) > self.capacity:
+                self._circuits.popitem(last=False)
+        else:
+            self._circuits.move_to_end(circuit)
+        return state
@@ -0,0 +1,188 @@
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# Corridor : computation and disk cache of the eroded black and white circuit in which drawing is allowed.
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+import hashlib
+import os
+import numpy as np
+
+
+# fr : Dossier dans lequel sont stockés les champs de distance déjà calculés.
+# en : Folder in which the already computed distance fields are stored.
+CACHE_DIR = ".corridor_cache"
+
+
+# fr : Clé du cache : empreinte SHA-256 du contenu de l'image et des paramètres du calcul. Modifier l'image ou un
+# paramètre donne donc une nouvelle clé.
+# en : Cache key : SHA-256 digest of the image content and of the computation parameters. Changing the image or a
+# parameter therefore gives a new key.
+def cache_key(image_path, **params):
+    digest = hashlib.sha256()
+    with open(image_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    digest.update(";".join("%s=%r" % item for item in sorted(params.items())).encode())
+    return digest.hexdigest()
+
+
+# fr : Champ de distance signé du circuit, en pixels : positif sur la piste (pixels clairs, distance au bord le plus
+# proche), négatif en dehors (distance à la piste la plus proche). Éroder la piste d'un disque de rayon r revient à
+# garder les pixels dont la distance est strictement supérieure à r.
+# en : Signed distance field of the circuit, in pixels : positive on the track (bright pixels, distance to the closest
+# border), negative outside (distance to the closest track pixel). Eroding the track with a disk of radius r is the
+# same as keeping the pixels whose distance is strictly greater than r.
+def compute_distance_field(image_path, threshold=0.5):
+    from scipy import ndimage
+    from skimage import io
+
+    track = io.imread(image_path, as_gray=True) >= threshold
+    inside = ndimage.distance_transform_edt(track)
+    outside = ndimage.distance_transform_edt(~track)
+    return np.where(track, inside, -outside).astype(np.float32)
+
+
+# fr : Renvoie le champ de distance, lu en mémoire partagée (memory-map) depuis le cache s'il existe. Sinon il est
+# calculé une seule fois puis enregistré dans le cache.
+# en : Returns the distance field, memory-mapped from the cache if it exists. Otherwise it is computed once then saved
+# in the cache.
+def load_distance_field(image_path, threshold=0.5, cache_dir=CACHE_DIR):
+    path = os.path.join(cache_dir, "sdf-%s.npy" % cache_key(image_path, threshold=threshold))
+    if not os.path.exists(path):
+        _save_atomic(path, compute_distance_field(image_path, threshold))
+    return np.load(path, mmap_mode="r")
+
+
+# fr : Masque du couloir pour une marge donnée (en pixels) : 1 pour la zone autorisée, 0 pour les bords dilatés. Un
+# simple seuillage du champ de distance, donc instantané quelle que soit la largeur de la voiture. Un champ en tuiles
+# (voir tile_pyramid.py) donne un masque calculé à la lecture, tuile par tuile, au lieu d'une copie complète.
+# en : Corridor mask for a given clearance (in pixels) : 1 for the allowed area, 0 for the dilated borders. A simple
+# threshold of the distance field, hence instantaneous whatever the width of the car. A tiled field (see
+# tile_pyramid.py) gives a mask computed on read, tile by tile, instead of a full copy.
+def corridor_mask(distance_field, clearance):
+    if hasattr(distance_field, "threshold"):
+        return distance_field.threshold(clearance)
+    return (np.asarray(distance_field) > clearance).astype(np.uint8)
+
+
+def load_corridor_mask(image_path, radius=10, threshold=0.5, cache_dir=CACHE_DIR):
+    return corridor_mask(load_distance_field(image_path, threshold, cache_dir), radius)
+
+
+# fr : Composantes connexes du masque du couloir (0 hors du couloir, 1..n dedans) et numéro de celle de la piste. Le
+# fond de l'image est aussi clair que la piste : la piste est la plus grande composante qui ne touche pas le bord de
+# l'image (0 s'il n'y en a pas).
+# en : Connected components of the corridor mask (0 outside of the corridor, 1..n inside) and number of the one of the
+# track. The background of the image is as bright as the track : the track is the largest component which does not
+# touch the border of the image (0 if there is none).
+def corridor_components(mask):
+    from scipy import ndimage
+
+    labels, _ = ndimage.label(np.asarray(mask))
+    border = np.unique(np.concatenate((labels[0], labels[-1], labels[:, 0], labels[:, -1])))
+    sizes = np.bincount(labels.ravel())
+    sizes[0] = 0
+    sizes[border] = 0
+    return labels, int(np.argmax(sizes))
+
+
+# fr : Masque (1 sur la piste, 0 ailleurs) de la composante de la piste dans le couloir de marge clearance, lu en
+# mémoire partagée depuis le cache s'il existe, calculé une seule fois sinon. distance_field peut être un champ en
+# tuiles (voir tile_pyramid.py), exact au-delà de clearance.
+# en : Mask (1 on the track, 0 elsewhere) of the component of the track in the corridor of clearance clearance,
+# memory-mapped from the cache if it exists, computed once otherwise. distance_field may be a tiled field (see
+# tile_pyramid.py), exact beyond clearance.
+def load_track_mask(image_path, clearance=10, threshold=0.5, cache_dir=CACHE_DIR, distance_field=None):
+    path = os.path.join(cache_dir, "track-%s.npy" % cache_key(image_path, threshold=threshold, clearance=clearance))
+    if not os.path.exists(path):
+        if distance_field is None:
+            distance_field = load_distance_field(image_path, threshold, cache_dir)
+        labels, track = corridor_components(corridor_mask(distance_field, clearance))
+        if track == 0:
+            raise ValueError("%s has no track left for a clearance of %g pixels" % (image_path, clearance))
+        _save_atomic(path, (labels == track).astype(np.uint8))
+    return np.load(path, mmap_mode="r")
+
+
+# fr : Valeur du masque au pixel (x, y), ou None si le pixel est en dehors de l'image.
+# en : Value of the mask at pixel (x, y), or None if the pixel is outside of the image.
+def mask_label(mask, x, y):
+    if 0 <= y < mask.shape[0] and 0 <= x < mask.shape[1]:
+        return int(mask[y, x])
+    return None
+
+
+# fr : Pixels traversés par le segment (x0, y0) -> (x1, y1), un par pas d'un pixel selon l'axe le plus long.
+# en : Pixels crossed by the segment (x0, y0) -> (x1, y1), one per one-pixel step along the longest axis.
+def segment_pixels(x0, y0, x1, y1):
+    xs, ys, _ = polyline_pixels(((x0, y0), (x1, y1)))
+    return xs, ys
+
+
+# fr : Vérifie que tous les pixels du segment ont la valeur label dans le masque, sans sortir de l'image. Tester tout
+# le segment (et pas seulement son extrémité) évite de traverser un bord lorsque la souris bouge vite.
+# en : Checks that every pixel of the segment has the value label in the mask, without leaving the image. Testing the
+# whole segment (and not only its end) avoids crossing a border when the mouse moves fast.
+def segment_in_corridor(mask, x0, y0, x1, y1, label):
+    xs, ys = segment_pixels(x0, y0, x1, y1)
+    height, width = mask.shape
+    if xs.min() < 0 or ys.min() < 0 or xs.max() >= width or ys.max() >= height:
+        return False
+    return bool(np.all(mask[ys, xs] == label))
+
+
+# fr : Pixels traversés par tous les segments d'une polyligne (n, 2) d'un seul coup, avec pour chaque pixel l'indice
+# du segment correspondant.
+# en : Pixels crossed by all the segments of an (n, 2) polyline at once, with for each pixel the index of the matching
+# segment.
+def polyline_pixels(points):
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    if len(points) < 2:
+        xy = np.rint(points).astype(np.intp)
+        return xy[:, 0], xy[:, 1], np.zeros(len(points), dtype=np.intp)
+    deltas = np.diff(points, axis=0)
+    steps = np.ceil(np.max(np.abs(deltas), axis=1)).astype(np.intp)
+    counts = steps + 1
+    segment = np.repeat(np.arange(len(deltas)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    t = offsets / np.maximum(steps, 1)[segment]
+    xs = np.rint(points[segment, 0] + t * deltas[segment, 0]).astype(np.intp)
+    ys = np.rint(points[segment, 1] + t * deltas[segment, 1]).astype(np.intp)
+    return xs, ys, segment
+
+
+# fr : Indice du premier point de la polyligne dont le segment d'arrivée sort de la zone de valeur label (0 si le
+# premier point lui-même est hors de la zone), ou -1 si tout le tracé est valide. Par défaut, label est la valeur du
+# masque au premier point, comme dans le Canvas.
+# en : Index of the first point of the polyline whose incoming segment leaves the area of value label (0 if the first
+# point itself is outside the area), or -1 if the whole drawing is valid. By default, label is the value of the mask at
+# the first point, as in the Canvas.
+def polyline_first_violation(mask, points, label=None):
+    points = np.asarray(points).reshape(-1, 2)
+    if len(points) == 0:
+        return -1
+    if label is None:
+        label = mask_label(mask, int(round(points[0, 0])), int(round(points[0, 1])))
+        if label is None:
+            return 0
+    xs, ys, segment = polyline_pixels(points)
+    height, width = mask.shape
+    inside = (xs >= 0) & (ys >= 0) & (xs < width) & (ys < height)
+    valid = inside.copy()
+    valid[inside] = mask[ys[inside], xs[inside]] == label
+    if valid.all():
+        return -1
+    first = int(np.argmin(valid))
+    if len(points) < 2 or (first == 0 and not valid[0]):
+        return 0
+    return int(segment[first]) + 1
+
+
+# fr : Écriture dans un fichier temporaire puis renommage, pour ne jamais laisser un fichier incomplet dans le cache.
+# en : Writing to a temporary file then renaming, so that an incomplete file is never left in the cache.
+def _save_atomic(path, array):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
@@ -0,0 +1,125 @@
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# Corridor validator : bulk check of points files against the corridor of a circuit, spread over a pool of processes.
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# fr : Utilisation : python corridor_validator.py dossier/points*.txt [--circuit circuitMIA.png] [--dilation 10]
+#                    [--csv rapport.csv]
+# en : Usage : python corridor_validator.py folder/points*.txt [--circuit circuitMIA.png] [--dilation 10]
+#              [--csv report.csv]
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+import argparse
+import csv
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from corridor import corridor_mask, load_track_mask, polyline_first_violation, polyline_pixels
+from simulator import read_points_any
+from tile_pyramid import load_pyramid
+
+
+# fr : Contrôle d'un tracé (n, 2) en pixels : indice du premier point dont le segment d'arrivée sort du couloir
+# (-1 si aucun, voir polyline_first_violation) et marge minimale, c'est-à-dire la plus petite distance au bord du
+# circuit (en pixels, négative hors de la piste, -inf hors de l'image) parmi tous les pixels traversés par le tracé.
+# Le fond de l'image est aussi clair que la piste : avec label = 1, si track (masque de la composante de la piste, voir
+# corridor.load_track_mask) est donné, le tracé doit rester dans cette composante et non seulement dans le couloir.
+# en : Check of an (n, 2) drawing in pixels : index of the first point whose incoming segment leaves the corridor (-1
+# if none, see polyline_first_violation) and minimum clearance, that is the smallest distance to the circuit border
+# (in pixels, negative off the track, -inf out of the image) among all the pixels crossed by the drawing.
+# The background of the image is as bright as the track : with label = 1, if track (mask of the component of the
+# track, see corridor.load_track_mask) is given, the drawing must stay in this component and not only in the corridor.
+def check_points(distance_field, points, dilation=10, label=1, track=None):
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    if len(points) == 0:
+        return -1, np.inf
+    mask = track if track is not None and label == 1 else corridor_mask(distance_field, dilation)
+    first_violation = polyline_first_violation(mask, points, label)
+    xs, ys, _ = polyline_pixels(points)
+    height, width = distance_field.shape
+    inside = (xs >= 0) & (ys >= 0) & (xs < width) & (ys < height)
+    if not inside.all():
+        return first_violation, -np.inf
+    return first_violation, float(np.min(distance_field[ys, xs]))
+
+
+# fr : État de chaque processus de travail : champ de distance en tuiles de la pyramide du circuit (en mémoire
+# partagée, voir tile_pyramid.py : le masque du couloir n'est calculé que pour les pixels lus), masque de la piste (en
+# mémoire partagée aussi) et paramètres.
+# en : State of each worker process : tiled distance field of the pyramid of the circuit (memory-mapped, see
+# tile_pyramid.py : the corridor mask is only computed for the pixels read), mask of the track (memory-mapped too) and
+# parameters.
+_worker = {}
+
+
+def _init_worker(circuit, dilation, threshold, label):
+    _worker["field"] = load_pyramid(circuit, threshold=threshold).field
+    _worker["track"] = load_track_mask(circuit, dilation, threshold) if label == 1 else None
+    _worker["dilation"] = dilation
+    _worker["label"] = label
+
+
+def _check_file(path):
+    try:
+        points = read_points_any(path)
+    except (OSError, ValueError) as error:
+        return {"points": path, "n_points": 0, "first_violation": 0, "min_clearance": -np.inf, "error": str(error)}
+    first_violation, min_clearance = check_points(_worker["field"], points, _worker["dilation"], _worker["label"],
+                                                  _worker["track"])
+    return {"points": path, "n_points": len(points), "first_violation": first_violation,
+            "min_clearance": min_clearance, "error": ""}
+
+
+# fr : Contrôle des fichiers points paths (texte ou binaire), répartis sur un ensemble de processus. Chaque processus
+# lit le champ de distance en mémoire partagée et ne garde qu'un tracé à la fois. Renvoie un dictionnaire par
+# fichier, dans l'ordre de paths.
+# en : Check of the points files paths (text or binary), spread over a pool of processes. Each process reads the
+# distance field memory-mapped and only keeps one drawing at a time. Returns one dictionary per file, in the order
+# of paths.
+def validate_files(paths, circuit="circuitMIA.png", dilation=10, threshold=0.5, label=1, workers=None):
+    # fr : Construction (ou lecture) de la pyramide et du masque de la piste une seule fois avant de lancer les
+    # processus.
+    # en : Building (or loading) of the pyramid and of the mask of the track once before starting the processes.
+    pyramid = load_pyramid(circuit, threshold=threshold)
+    if label == 1:
+        load_track_mask(circuit, dilation, threshold, distance_field=pyramid.field)
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(paths) // (workers * 8))
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(circuit, dilation, threshold, label)) as executor:
+        return list(executor.map(_check_file, paths, chunksize=chunksize))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check points files against the corridor of a circuit.")
+    parser.add_argument("points", nargs="+", help="pointsN.txt/.bin files (pixels)")
+    parser.add_argument("--circuit", default="circuitMIA.png", help="circuit image")
+    parser.add_argument("--dilation", type=float, default=10, help="dilation of the circuit edges in pixels")
+    parser.add_argument("--threshold", type=float, default=0.5, help="grey level of the track in the image")
+    parser.add_argument("--label", type=int, default=1,
+                        help="mask value to stay in (1 : the track in the corridor, 0 : outside of it)")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (default : all cores)")
+    parser.add_argument("--csv", default=None, help="write the report to this CSV file")
+    args = parser.parse_args(argv)
+
+    results = validate_files(args.points, args.circuit, args.dilation, args.threshold, args.label, args.workers)
+    fields = ["points", "n_points", "first_violation", "min_clearance", "error"]
+    if args.csv is not None:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(results)
+    for result in results:
+        if result["error"]:
+            print("%s : unreadable (%s)" % (result["points"], result["error"]))
+        elif result["first_violation"] != -1:
+            print("%s : leaves the corridor at point %d, min clearance %.1f px"
+                  % (result["points"], result["first_violation"], result["min_clearance"]))
+    valid = sum(result["first_violation"] == -1 for result in results)
+    print("%d/%d files inside the corridor" % (valid, len(results)))
+    return 0 if valid == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
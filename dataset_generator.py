@@ -0,0 +1,187 @@
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# Dataset generator : automatic generation of "close but different" trajectories from a validated points file.
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# fr : Utilisation : python dataset_generator.py points1.txt -n 10000 -o dataset/
+# en : Usage : python dataset_generator.py points1.txt -n 10000 -o dataset/
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+import trajectory_compiler
+from corridor import load_corridor_mask, mask_label, polyline_first_violation
+
+
+# fr : Paramètres par défaut des perturbations (en pixels pour le bruit et le décalage).
+# en : Default parameters of the perturbations (in pixels for the noise and the offset).
+NOISE = 8.0
+NOISE_LENGTH = 60
+OFFSET = 10.0
+SPEED_JITTER = 0.2
+
+
+# fr : Bruit aléatoire lissé par une gaussienne d'écart-type length (en nombre de points), normalisé pour avoir un
+# écart-type de 1.
+# en : Random noise smoothed by a gaussian of standard deviation length (in number of points), normalized to have a
+# standard deviation of 1.
+def smooth_noise(rng, n, length):
+    if length <= 0:
+        return rng.standard_normal(n)
+    radius = int(3 * length)
+    kernel = np.exp(-0.5 * (np.arange(-radius, radius + 1) / length) ** 2)
+    noise = np.convolve(rng.standard_normal(n + 2 * radius), kernel, mode="valid")
+    return noise / (noise.std() or 1.0)
+
+
+# fr : Vecteurs normaux unitaires au tracé en chaque point.
+# en : Unit normal vectors of the drawing at each point.
+def normals(points):
+    tangent = np.gradient(points, axis=0)
+    norm = np.hypot(tangent[:, 0], tangent[:, 1])
+    norm[norm == 0] = 1.0
+    return np.column_stack((-tangent[:, 1], tangent[:, 0])) / norm[:, None]
+
+
+# fr : Variation de la vitesse : les points sont redistribués le long du tracé avec un espacement modulé par un bruit
+# lissé, le nombre de points et les extrémités restant les mêmes. Appliquée aux mesures rééchantillonnées (voir
+# trajectory_compiler.resample_arc_length), elle fait varier la distance parcourue à chaque commande, donc la vitesse.
+# en : Speed jitter : the points are redistributed along the drawing with a spacing modulated by a smoothed noise, the
+# number of points and the ends staying the same. Applied to the resampled measurements (see
+# trajectory_compiler.resample_arc_length), it makes the distance covered by each command, hence the speed, vary.
+def jitter_speed(rng, points, jitter, length):
+    steps = np.hypot(*np.diff(points, axis=0).T)
+    arc = np.concatenate(([0.0], np.cumsum(steps)))
+    if arc[-1] == 0 or jitter <= 0:
+        return points
+    factors = np.clip(1.0 + jitter * smooth_noise(rng, len(steps), length), 0.05, None)
+    new_arc = np.concatenate(([0.0], np.cumsum(steps * factors)))
+    new_arc *= arc[-1] / new_arc[-1]
+    return np.column_stack((np.interp(new_arc, arc, points[:, 0]), np.interp(new_arc, arc, points[:, 1])))
+
+
+# fr : Variante perturbée d'un tracé (en pixels) : décalage latéral constant et bruit lissé selon la normale au tracé.
+# La vitesse n'est pas portée par les points, le tracé étant rééchantillonné à la compilation : elle varie ensuite
+# sur les mesures (voir sample_jitter_length et _generate).
+# en : Perturbed variant of a drawing (in pixels) : constant lateral offset and smoothed noise along the normal of the
+# drawing. The speed is not carried by the points, the drawing being resampled when compiled : it varies afterwards
+# on the measurements (see sample_jitter_length and _generate).
+def perturb(rng, points, noise=NOISE, noise_length=NOISE_LENGTH, offset=OFFSET):
+    points = np.asarray(points, dtype=float)
+    lateral = rng.uniform(-offset, offset) + noise * smooth_noise(rng, len(points), noise_length)
+    return np.rint(points + lateral[:, None] * normals(points)).astype(np.int32)
+
+
+# fr : Longueur de corrélation length (en nombre de points du tracé) convertie en nombre de mesures espacées de
+# spacing mètres.
+# en : Correlation length length (in number of points of the drawing) converted to a number of measurements spaced
+# spacing metres apart.
+def sample_jitter_length(points, length, distance_ratio=trajectory_compiler.DISTANCE_RATIO,
+                         spacing=trajectory_compiler.SAMPLE_SPACING):
+    steps = np.hypot(*np.diff(np.asarray(points, dtype=float), axis=0).T)
+    if len(steps) == 0:
+        return length
+    return length * steps.mean() / distance_ratio / spacing
+
+
+# fr : État de chaque processus de travail : tracé de référence, masque du couloir et paramètres.
+# en : State of each worker process : reference drawing, corridor mask and parameters.
+_worker = {}
+
+
+def _init_worker(points, circuit, dilation, label, params):
+    _worker["points"] = points
+    _worker["mask"] = load_corridor_mask(circuit, dilation)
+    _worker["label"] = label
+    _worker.update(params)
+
+
+# fr : Génère la variante index : on tire des perturbations (au plus attempts fois) jusqu'à ce que le tracé reste dans
+# le couloir, puis on l'enregistre et on le compile. Le générateur aléatoire ne dépend que de (seed, index, essai),
+# donc le résultat ne dépend pas du nombre de processus.
+# en : Generates the variant index : perturbations are drawn (at most attempts times) until the drawing stays in the
+# corridor, then it is saved and compiled. The random generator only depends on (seed, index, attempt), so the result
+# does not depend on the number of processes.
+def _generate(index):
+    w = _worker
+    for attempt in range(w["attempts"]):
+        rng = np.random.default_rng([w["seed"], index, attempt])
+        variant = perturb(rng, w["points"], w["noise"], w["noise_length"], w["offset"])
+        if polyline_first_violation(w["mask"], variant, w["label"]) != -1:
+            continue
+        try:
+            start_x, start_y, xpos, ypos = trajectory_compiler.points_to_samples(variant)
+            samples = jitter_speed(rng, np.column_stack((xpos, ypos)), w["speed_jitter"],
+                                   sample_jitter_length(variant, w["noise_length"]))
+            start, speed, angle_array = trajectory_compiler.compile_trajectory(start_x, start_y, samples[:, 0],
+                                                                               samples[:, 1])
+        except ValueError:
+            return index, False
+        points_path = os.path.join(w["output_dir"], "points%d.txt" % (index + 1))
+        trajectory_path = os.path.join(w["output_dir"], "trajectoire%d.txt" % (index + 1))
+        trajectory_compiler.write_points(points_path, variant)
+        trajectory_compiler.write_trajectory(trajectory_path, start, speed, angle_array)
+        if w["binary"]:
+            import binary_format
+            binary_format.write_points_bin(points_path[:-4] + ".bin", variant)
+            binary_format.write_trajectory_bin(trajectory_path[:-4] + ".bin", start, speed, angle_array)
+        return index, True
+    return index, False
+
+
+# fr : Génère count variantes du fichier points_path dans output_dir, réparties sur un ensemble de processus. Renvoie
+# le nombre de variantes acceptées.
+# en : Generates count variants of the points_path file in output_dir, spread over a pool of processes. Returns the
+# number of accepted variants.
+def generate_dataset(points_path, count, output_dir, circuit="circuitMIA.png", dilation=10, noise=NOISE,
+                     noise_length=NOISE_LENGTH, offset=OFFSET, speed_jitter=SPEED_JITTER, seed=0, attempts=5,
+                     workers=None, binary=False):
+    points = trajectory_compiler.read_points(points_path)
+    os.makedirs(output_dir, exist_ok=True)
+    # fr : Calcul (ou lecture) du champ de distance une seule fois avant de lancer les processus.
+    # en : Computation (or loading) of the distance field once before starting the processes.
+    mask = load_corridor_mask(circuit, dilation)
+    label = mask_label(mask, points[0, 0], points[0, 1])
+    if label is None:
+        raise ValueError("%s does not start inside the circuit image" % points_path)
+
+    params = dict(noise=noise, noise_length=noise_length, offset=offset, speed_jitter=speed_jitter, seed=seed,
+                  attempts=attempts, output_dir=output_dir, binary=binary)
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, count // (workers * 8))
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(points, circuit, dilation, label, params)) as executor:
+        return sum(ok for _, ok in executor.map(_generate, range(count), chunksize=chunksize))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate perturbed variants of a validated points file.")
+    parser.add_argument("points", help="validated points file (pixels)")
+    parser.add_argument("-n", "--count", type=int, default=100, help="number of variants")
+    parser.add_argument("-o", "--output-dir", default="dataset", help="folder of the generated files")
+    parser.add_argument("--circuit", default="circuitMIA.png", help="circuit image")
+    parser.add_argument("--dilation", type=int, default=10, help="dilation of the circuit edges in pixels")
+    parser.add_argument("--noise", type=float, default=NOISE, help="amplitude of the smooth noise in pixels")
+    parser.add_argument("--noise-length", type=float, default=NOISE_LENGTH,
+                        help="correlation length of the noise in points")
+    parser.add_argument("--offset", type=float, default=OFFSET, help="maximal lateral offset in pixels")
+    parser.add_argument("--speed-jitter", type=float, default=SPEED_JITTER,
+                        help="relative amplitude of the speed variations")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--attempts", type=int, default=5, help="draws per variant before giving up")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (default : all cores)")
+    parser.add_argument("--binary", action="store_true", help="also write the binary files")
+    args = parser.parse_args(argv)
+
+    accepted = generate_dataset(args.points, args.count, args.output_dir, args.circuit, args.dilation, args.noise,
+                                args.noise_length, args.offset, args.speed_jitter, args.seed, args.attempts,
+                                args.workers, args.binary)
+    print("%d/%d variants generated" % (accepted, args.count))
+    return 0 if accepted == args.count else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# Event replay : recording of the mouse events received by the Canvas and deterministic replay of a session.
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# fr : Utilisation : python event_replay.py record session.jsonl      (lance l'interface et enregistre la souris)
+#                    python event_replay.py replay session.jsonl [--validate] [--show]
+# en : Usage : python event_replay.py record session.jsonl      (starts the interface and records the mouse)
+#              python event_replay.py replay session.jsonl [--validate] [--show]
+# fr : Sans --show, le rejeu se fait sans fenêtre (QT_QPA_PLATFORM=offscreen).
+# en : Without --show, the replay runs without window (QT_QPA_PLATFORM=offscreen).
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+from PyQt5.QtCore import Qt, QEvent, QObject, QPointF
+from PyQt5.QtGui import QMouseEvent
+from PyQt5.QtWidgets import QApplication
+
+import Projet
+from corridor import corridor_components
+
+
+EVENT_TYPES = {"press": QEvent.MouseButtonPress, "move": QEvent.MouseMove, "release": QEvent.MouseButtonRelease}
+EVENT_NAMES = {value: key for key, value in EVENT_TYPES.items()}
+
+
+# fr : Chaque évènement est un dictionnaire {"t", "type", "x", "y", "button", "buttons"} : instant en ms depuis le
+# premier évènement, type "press", "move" ou "release", position dans la scène du canvas (pixels de l'image, donc
+# indépendante du zoom) et boutons de la souris (valeurs Qt).
+# en : Each event is a {"t", "type", "x", "y", "button", "buttons"} dictionary : time in ms since the first event,
+# "press", "move" or "release" type, position in the scene of the canvas (pixels of the image, hence independent of
+# the zoom) and mouse buttons (Qt values).
+def write_events(path, events):
+    with open(path, "w") as f:
+        for event in events:
+            f.write(json.dumps(event) + "\n")
+
+
+def read_events(path):
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# fr : La classe EventRecorder est un filtre d'évènements installé sur la zone d'affichage du canvas : elle copie
+# chaque évènement souris sans le modifier ni l'intercepter.
+# en : The EventRecorder class is an event filter installed on the viewport of the canvas : it copies each mouse event
+# without modifying nor intercepting it.
+class EventRecorder(QObject):
+
+    def __init__(self, canvas):
+        super().__init__(canvas)
+        self.canvas = canvas
+        self.events = []
+        self._origin = None
+        canvas.viewport().installEventFilter(self)
+
+
+    def eventFilter(self, watched, event):
+        kind = EVENT_NAMES.get(event.type())
+        if kind is not None:
+            if self._origin is None:
+                self._origin = event.timestamp()
+            position = self.canvas.scenePosition(event)
+            self.events.append({"t": event.timestamp() - self._origin, "type": kind, "x": position.x(),
+                                "y": position.y(), "button": int(event.button()), "buttons": int(event.buttons())})
+        return False
+
+
+    def save(self, path):
+        write_events(path, self.events)
+
+
+# fr : Rejoue les évènements sur canvas en les envoyant directement (QApplication.sendEvent) à sa zone d'affichage,
+# avec leurs instants d'origine : le résultat ne dépend pas de la vitesse de la machine. Les positions de la scène sont
+# converties avec le zoom courant. Avec realtime=True, les délais entre évènements sont respectés. Renvoie le nombre
+# d'évènements envoyés.
+# en : Replays the events on canvas by sending them directly (QApplication.sendEvent) to its viewport, with their
+# original timestamps : the result does not depend on the speed of the machine. The scene positions are converted with
+# the current zoom. With realtime=True, the delays between events are kept. Returns the number of events sent.
+def replay(canvas, events, realtime=False):
+    start = time.perf_counter()
+    for event in events:
+        if realtime:
+            delay = event["t"] / 1000 - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+            QApplication.processEvents()
+        position = canvas.viewportTransform().map(QPointF(event["x"], event["y"]))
+        qt_event = QMouseEvent(EVENT_TYPES[event["type"]], position, Qt.MouseButton(event["button"]),
+                               Qt.MouseButtons(event["buttons"]), Qt.NoModifier)
+        qt_event.setTimestamp(int(event["t"]))
+        QApplication.sendEvent(canvas.viewport(), qt_event)
+    return len(events)
+
+
+# fr : Tracé synthétique de n_moves déplacements de step pixels qui suit le milieu de la piste, pour les tests et les
+# mesures de performance : à chaque pas, on choisit parmi les directions proches du cap actuel celle qui, vue
+# lookahead pas plus loin, est la plus éloignée des bords (champ de distance de corridor.py). Le tracé fait demi-tour
+# s'il allait approcher à moins de clearance pixels d'un bord. Nécessite scipy.
+# en : Synthetic stroke of n_moves moves of step pixels following the middle of the track, for tests and performance
+# measurements : at each step, among the directions close to the current heading, the one which, seen lookahead steps
+# further, is the farthest from the borders (distance field of corridor.py) is chosen. The stroke turns back if it
+# would get closer than clearance pixels to a border. Requires scipy.
+def synthetic_stroke(distance_field, n_moves, step=3.0, clearance=12.0, lookahead=6, turn=0.4):
+    field = np.asarray(distance_field)
+    height, width = field.shape
+
+    def clearance_at(points):
+        x = np.clip(np.rint(points[..., 0]).astype(int), 0, width - 1)
+        y = np.clip(np.rint(points[..., 1]).astype(int), 0, height - 1)
+        return field[y, x]
+
+    # fr : Le fond de l'image est aussi clair que la piste : on part du point le plus central de la plus grande
+    # composante du couloir qui ne touche pas le bord de l'image.
+    # en : The background of the image is as bright as the track : the stroke starts at the most central point of the
+    # largest component of the corridor which does not touch the border of the image.
+    labels, track = corridor_components(field > clearance)
+    y, x = np.unravel_index(np.argmax(np.where(labels == track, field, -np.inf)), field.shape)
+    position = np.array((x, y), dtype=float)
+    angles = np.linspace(-np.pi, np.pi, 72, endpoint=False)
+    heading = angles[np.argmax(clearance_at(position + lookahead * step * np.column_stack((np.cos(angles),
+                                                                                              np.sin(angles)))))]
+    offsets = np.linspace(-turn, turn, 9)
+
+    points = [position.copy()]
+    for _ in range(4 * n_moves):
+        if len(points) > n_moves:
+            break
+        candidates = heading + offsets
+        directions = np.column_stack((np.cos(candidates), np.sin(candidates)))
+        best = np.argmax(clearance_at(position + lookahead * step * directions) - 0.01 * np.abs(offsets))
+        if clearance_at(position + step * directions[best]) <= clearance:
+            heading += np.pi
+            continue
+        heading = candidates[best]
+        position = position + step * directions[best]
+        points.append(position.copy())
+
+    points = np.rint(points).astype(int)
+    events = [{"t": 0, "type": "press", "x": int(points[0, 0]), "y": int(points[0, 1]), "button": 1, "buttons": 1}]
+    events.extend({"t": 8 * i, "type": "move", "x": int(px), "y": int(py), "button": 0, "buttons": 1}
+                  for i, (px, py) in enumerate(points.tolist()))
+    events.append({"t": 8 * len(points), "type": "release", "x": int(points[-1, 0]), "y": int(points[-1, 1]),
+                   "button": 1, "buttons": 0})
+    return events
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record or replay the mouse events of a drawing session.")
+    parser.add_argument("command", choices=("record", "replay"))
+    parser.add_argument("session", help="JSONL file of the mouse events")
+    parser.add_argument("--validate", action="store_true", help="validate the trajectory after the replay")
+    parser.add_argument("--show", action="store_true", help="replay in a visible window, in real time")
+    args = parser.parse_args(argv)
+
+    if args.command == "replay" and not args.show:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    app = QApplication.instance() or QApplication(sys.argv)
+    window = Projet.MainWindow()
+    if args.command == "replay" and not window.canvas.waitForCorridor():
+        return 1
+
+    if args.command == "record":
+        recorder = EventRecorder(window.canvas)
+        window.show()
+        status = app.exec_()
+        recorder.save(args.session)
+        print("%d events recorded in %s" % (len(recorder.events), args.session))
+        return status
+
+    events = read_events(args.session)
+    if args.show:
+        window.show()
+    start = time.perf_counter()
+    replay(window.canvas, events, realtime=args.show)
+    elapsed = time.perf_counter() - start
+    print("%d events replayed in %.3f s, %d points drawn" % (len(events), elapsed, len(window.canvas.all_points)))
+    if args.validate:
+        window.canvas.validate_circuit()
+        window.addCheckBox()
+        print("trajectory %s validated" % window.canvas.last_trajectory_id)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# Instrumentation : opt-in latency measurement of the hot paths of the interface.
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# fr : Activation : PROJET_PROFILE=1 python Projet.py
+#                   PROJET_PROFILE=1 PROJET_PROFILE_JSONL=mesures.jsonl python Projet.py
+# Sans PROJET_PROFILE, les fonctions décorées ne sont pas modifiées et ne coûtent rien de plus.
+# en : Activation : PROJET_PROFILE=1 python Projet.py
+#                   PROJET_PROFILE=1 PROJET_PROFILE_JSONL=measures.jsonl python Projet.py
+# Without PROJET_PROFILE, the decorated functions are left unchanged and cost nothing more.
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+import atexit
+import contextlib
+import functools
+import json
+import os
+import sys
+import time
+
+
+ENABLED = os.environ.get("PROJET_PROFILE", "") not in ("", "0")
+JSONL_PATH = os.environ.get("PROJET_PROFILE_JSONL") or None
+
+
+# fr : La classe LatencyHistogram compte les durées d'appel dans des intervalles de puissances de 2 microsecondes
+# ([0, 1[, [1, 2[, [2, 4[, ...), en gardant aussi le nombre d'appels, le total et le maximum exacts. La mémoire
+# utilisée ne dépend donc pas de la durée de la session.
+# en : The LatencyHistogram class counts the call durations in power of 2 microseconds bins ([0, 1[, [1, 2[, [2, 4[,
+# ...), also keeping the exact number of calls, total and maximum. The memory used hence does not depend on the length
+# of the session.
+class LatencyHistogram:
+
+    def __init__(self):
+        self.bins = [0] * 40
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+    def add(self, seconds):
+        index = min(int(seconds * 1e6).bit_length(), len(self.bins) - 1)
+        self.bins[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+
+    # fr : Borne supérieure (en secondes) de l'intervalle contenant le quantile q, sans dépasser le maximum observé.
+    # en : Upper bound (in seconds) of the bin holding the quantile q, without exceeding the observed maximum.
+    def quantile(self, q):
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.bins):
+            seen += count
+            if seen >= rank and count:
+                return min((1 << index) * 1e-6, self.max)
+        return self.max
+
+
+    def summary(self):
+        return {"count": self.count, "total": self.total, "mean": self.total / self.count if self.count else 0.0,
+                "p50": self.quantile(0.5), "p95": self.quantile(0.95), "p99": self.quantile(0.99), "max": self.max}
+
+
+# fr : La classe Recorder regroupe les histogrammes par nom de point de mesure et écrit éventuellement chaque mesure
+# dans un fichier JSONL ({"name", "start", "duration"} par ligne, en secondes).
+# en : The Recorder class groups the histograms by measurement point name and optionally writes each measurement to a
+# JSONL file ({"name", "start", "duration"} per line, in seconds).
+class Recorder:
+
+    def __init__(self, jsonl_path=None):
+        self.histograms = {}
+        self.origin = time.perf_counter()
+        self.jsonl = open(jsonl_path, "a", buffering=1 << 16) if jsonl_path else None
+
+
+    def record(self, name, start, duration):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+        histogram.add(duration)
+        if self.jsonl is not None:
+            self.jsonl.write(json.dumps({"name": name, "start": round(start - self.origin, 6),
+                                         "duration": round(duration, 9)}) + "\n")
+
+
+    def report(self, file=sys.stderr):
+        if not self.histograms:
+            return
+        print("%-40s %8s %10s %10s %10s %10s %10s" % ("latency (ms)", "calls", "mean", "p50", "p95", "p99", "max"),
+              file=file)
+        for name in sorted(self.histograms, key=lambda n: -self.histograms[n].total):
+            s = self.histograms[name].summary()
+            print("%-40s %8d %10.3f %10.3f %10.3f %10.3f %10.3f"
+                  % (name, s["count"], 1e3 * s["mean"], 1e3 * s["p50"], 1e3 * s["p95"], 1e3 * s["p99"],
+                     1e3 * s["max"]), file=file)
+
+
+    def close(self):
+        if self.jsonl is not None:
+            self.jsonl.close()
+            self.jsonl = None
+
+
+recorder = Recorder(JSONL_PATH) if ENABLED else None
+
+
+def _at_exit():
+    recorder.report()
+    recorder.close()
+
+
+if ENABLED:
+    atexit.register(_at_exit)
+
+
+# fr : Décorateur mesurant la durée de chaque appel sous le nom name (par défaut le nom qualifié de la fonction).
+# Sans instrumentation, la fonction est renvoyée telle quelle.
+# en : Decorator measuring the duration of each call under the name name (by default the qualified name of the
+# function). Without instrumentation, the function is returned as is.
+def timed(name=None):
+    def decorate(function):
+        if not ENABLED:
+            return function
+        label = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                recorder.record(label, start, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+@contextlib.contextmanager
+def _span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.record(name, start, time.perf_counter() - start)
+
+
+# fr : Enregistre sous le nom name la durée écoulée depuis start (valeur de time.perf_counter), par exemple le temps
+# depuis le lancement.
+# en : Records under the name name the time elapsed since start (value of time.perf_counter), for example the time
+# since launch.
+def record_since(name, start):
+    if ENABLED:
+        recorder.record(name, start, time.perf_counter() - start)
+
+
+# fr : Mesure d'une étape à l'intérieur d'une fonction : with span("validate_circuit.export"): ...
+# en : Measurement of a stage inside a function : with span("validate_circuit.export"): ...
+def span(name):
+    return _span(name) if ENABLED else _NULL_SPAN
@@ -0,0 +1,299 @@
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# MCAP exporter : streaming export of the trajectories (commands, reconstructed poses, drawing and circuit map) to an
+# MCAP file, for a replay in Foxglove Studio.
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# fr : Utilisation : python mcap_exporter.py dossier/trajectoire*.txt -o trajectoires.mcap [--circuit circuitMIA.png]
+#                    python mcap_exporter.py --database trajectoires.db [--ids 3 4 5] -o trajectoires.mcap
+# en : Usage : python mcap_exporter.py folder/trajectoire*.txt -o trajectories.mcap [--circuit circuitMIA.png]
+#              python mcap_exporter.py --database trajectoires.db [--ids 3 4 5] -o trajectories.mcap
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# fr : Les messages sont encodés en JSON avec les schémas de Foxglove (foxglove.Grid, foxglove.PoseInFrame,
+# foxglove.PosesInFrame), tous dans le repère "map" de la simulation (en mètres, y vers le haut) :
+#   - /map : l'image du circuit, publiée une seule fois au début du fichier (l'image d'origine est aussi jointe)
+#   - /commands : les commandes (vitesse, angle de braquage), une toutes les period secondes
+#   - /pose : la pose reconstruite par le modèle bicyclette (voir simulator.py) avant chaque commande
+#   - /path et /drawing : la trajectoire reconstruite et le tracé d'origine entiers, au début de chaque trajectoire
+# Les trajectoires se suivent dans le temps : les messages sont écrits dans l'ordre chronologique, une trajectoire à la
+# fois, et le fichier se lit donc en une seule passe.
+# en : The messages are JSON-encoded with the Foxglove schemas (foxglove.Grid, foxglove.PoseInFrame,
+# foxglove.PosesInFrame), all in the "map" frame of the simulation (in metres, y upwards) :
+#   - /map : the circuit image, published only once at the beginning of the file (the original image is also attached)
+#   - /commands : the commands (speed, steering angle), one every period seconds
+#   - /pose : the pose reconstructed by the bicycle model (see simulator.py) before each command
+#   - /path and /drawing : the whole reconstructed trajectory and original drawing, at the beginning of each trajectory
+# The trajectories follow each other in time : the messages are written in chronological order, one trajectory at a
+# time, and the file is hence read in a single pass.
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+import argparse
+import base64
+import json
+import os
+import sys
+import numpy as np
+
+from simulator import points_path_for, points_to_simulation, read_commands, read_points_any, simulate
+from trajectory_compiler import DISTANCE_RATIO, ENTRAXE, SIMULATION_HEIGHT
+
+
+# fr : Durée d'une commande et pause entre deux trajectoires, en secondes.
+# en : Duration of a command and pause between two trajectories, in seconds.
+PERIOD = 0.1
+GAP = 1.0
+
+FRAME = "map"
+
+_TIME = {"type": "object", "properties": {"sec": {"type": "integer"}, "nsec": {"type": "integer"}}}
+_VECTOR = {"type": "object", "properties": {axis: {"type": "number"} for axis in "xyz"}}
+_QUATERNION = {"type": "object", "properties": {axis: {"type": "number"} for axis in "xyzw"}}
+_POSE = {"type": "object", "properties": {"position": _VECTOR, "orientation": _QUATERNION}}
+
+# fr : Schémas JSON des messages, reconnus par Foxglove d'après leur nom.
+# en : JSON schemas of the messages, recognized by Foxglove from their name.
+SCHEMAS = {
+    "foxglove.Grid": {"type": "object", "properties": {
+        "timestamp": _TIME, "frame_id": {"type": "string"}, "pose": _POSE,
+        "column_count": {"type": "integer"},
+        "cell_size": {"type": "object", "properties": {"x": {"type": "number"}, "y": {"type": "number"}}},
+        "row_stride": {"type": "integer"}, "cell_stride": {"type": "integer"},
+        "fields": {"type": "array", "items": {"type": "object", "properties": {
+            "name": {"type": "string"}, "offset": {"type": "integer"}, "type": {"type": "integer"}}}},
+        "data": {"type": "string", "contentEncoding": "base64"}}},
+    "foxglove.PoseInFrame": {"type": "object", "properties": {
+        "timestamp": _TIME, "frame_id": {"type": "string"}, "pose": _POSE}},
+    "foxglove.PosesInFrame": {"type": "object", "properties": {
+        "timestamp": _TIME, "frame_id": {"type": "string"}, "poses": {"type": "array", "items": _POSE}}},
+    "car_drawing.Command": {"type": "object", "properties": {
+        "timestamp": _TIME, "trajectory": {"type": "string"}, "index": {"type": "integer"},
+        "speed": {"type": "number"}, "angle": {"type": "number"}}},
+}
+
+# fr : Sujets écrits et schéma de chacun.
+# en : Written topics and schema of each of them.
+TOPICS = {
+    "/map": "foxglove.Grid",
+    "/commands": "car_drawing.Command",
+    "/pose": "foxglove.PoseInFrame",
+    "/path": "foxglove.PosesInFrame",
+    "/drawing": "foxglove.PosesInFrame",
+}
+
+# fr : Type UINT8 de foxglove.NumericType.
+# en : UINT8 type of foxglove.NumericType.
+_UINT8 = 1
+
+
+def _timestamp(time_ns):
+    return {"sec": int(time_ns // 1000000000), "nsec": int(time_ns % 1000000000)}
+
+
+# fr : Poses (n, 3) (x, y, cap) converties en poses Foxglove, le cap devenant un quaternion autour de z.
+# en : (n, 3) poses (x, y, heading) converted to Foxglove poses, the heading becoming a quaternion around z.
+def _poses(poses):
+    half = poses[:, 2] / 2
+    return [{"position": {"x": x, "y": y, "z": 0.0}, "orientation": {"x": 0.0, "y": 0.0, "z": qz, "w": qw}}
+            for x, y, qz, qw in zip(poses[:, 0].tolist(), poses[:, 1].tolist(), np.sin(half).tolist(),
+                                    np.cos(half).tolist())]
+
+
+# fr : Points d'un tracé (en pixels) convertis en poses dans le repère de la simulation, orientées selon le segment
+# suivant.
+# en : Points of a drawing (in pixels) converted to poses in the simulation frame, oriented along the next segment.
+def _drawing_poses(points, distance_ratio):
+    drawn = points_to_simulation(points, distance_ratio)
+    steps = np.diff(drawn, axis=0)
+    heading = np.arctan2(steps[:, 1], steps[:, 0])
+    heading = np.append(heading, heading[-1] if len(heading) else 0.0)
+    return _poses(np.column_stack((drawn, heading)))
+
+
+# fr : La classe McapExporter écrit les trajectoires une par une dans un fichier MCAP. Seule la trajectoire en cours
+# est en mémoire ; les messages sont regroupés en blocs compressés (chunk_size octets) écrits au fil de l'eau, et
+# l'index placé à la fin du fichier permet aux outils de visualisation de s'y déplacer sans tout relire.
+# en : The McapExporter class writes the trajectories one by one into an MCAP file. Only the trajectory in progress is
+# in memory ; the messages are grouped into compressed chunks (chunk_size bytes) written on the fly, and the index
+# placed at the end of the file lets the visualization tools seek in it without reading everything again.
+class McapExporter:
+
+    def __init__(self, path, period=PERIOD, gap=GAP, entraxe=ENTRAXE, distance_ratio=DISTANCE_RATIO,
+                 chunk_size=1024 * 1024):
+        from mcap.writer import Writer
+
+        self.path = path
+        self.period_ns = int(round(period * 1e9))
+        self.gap_ns = int(round(gap * 1e9))
+        self.entraxe = entraxe
+        self.distance_ratio = distance_ratio
+        self.time_ns = 0
+        self.count = 0
+        self._stream = open(path, "wb")
+        self._writer = Writer(self._stream, chunk_size=chunk_size)
+        self._writer.start(profile="", library="car-drawing")
+        schema_ids = {name: self._writer.register_schema(name=name, encoding="jsonschema",
+                                                         data=json.dumps(schema).encode())
+                      for name, schema in SCHEMAS.items()}
+        self._channels = {topic: self._writer.register_channel(topic=topic, message_encoding="json",
+                                                               schema_id=schema_ids[schema])
+                          for topic, schema in TOPICS.items()}
+        self._sequence = 0
+
+
+    def close(self):
+        self._writer.finish()
+        self._stream.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+    def _write(self, topic, time_ns, message):
+        self._sequence += 1
+        self._writer.add_message(channel_id=self._channels[topic], log_time=time_ns,
+                                 data=json.dumps(message, separators=(",", ":")).encode(), publish_time=time_ns,
+                                 sequence=self._sequence)
+
+
+    # fr : Carte du circuit : le niveau level de sa pyramide (voir tile_pyramid.py) publié comme une grille RGBA de
+    # 2^level / distance_ratio mètres par case, dont l'origine est le coin bas gauche de l'image. L'image d'origine est
+    # jointe au fichier telle quelle.
+    # en : Map of the circuit : the level level of its pyramid (see tile_pyramid.py) published as an RGBA grid of
+    # 2^level / distance_ratio metres per cell, whose origin is the bottom left corner of the image. The original image
+    # is attached to the file as is.
+    def write_map(self, circuit, level=0):
+        from tile_pyramid import load_pyramid
+
+        pyramid = load_pyramid(circuit)
+        level = min(max(level, 0), pyramid.levels - 1)
+        # fr : Les lignes de la grille vont vers les y croissants, celles de l'image vers le bas.
+        # en : The rows of the grid go towards increasing y, the ones of the image downwards.
+        image = np.ascontiguousarray(np.asarray(pyramid.images[level])[::-1])
+        height, width = image.shape[:2]
+        cell = (1 << level) / self.distance_ratio
+        self._write("/map", self.time_ns, {
+            "timestamp": _timestamp(self.time_ns), "frame_id": FRAME,
+            "pose": {"position": {"x": 0.0, "y": SIMULATION_HEIGHT - pyramid.height / self.distance_ratio, "z": 0.0},
+                     "orientation": {"x": 0.0, "y": 0.0, "z": 0.0, "w": 1.0}},
+            "column_count": width, "cell_size": {"x": cell, "y": cell}, "row_stride": 4 * width, "cell_stride": 4,
+            "fields": [{"name": name, "offset": offset, "type": _UINT8}
+                       for offset, name in enumerate(("red", "green", "blue", "alpha"))],
+            "data": base64.b64encode(image.tobytes()).decode("ascii")})
+        with open(circuit, "rb") as f:
+            self._writer.add_attachment(create_time=self.time_ns, log_time=self.time_ns,
+                                        name=os.path.basename(circuit), media_type="image/png", data=f.read())
+
+
+    # fr : Trajectoire name : position de départ (x, y, angle) dans le repère de la simulation, commandes (n, 2)
+    # (vitesse, angle) et éventuellement les points du tracé d'origine (en pixels). Renvoie l'instant de son début,
+    # en nanosecondes.
+    # en : Trajectory name : starting position (x, y, angle) in the simulation frame, (n, 2) commands (speed, angle)
+    # and possibly the points of the original drawing (in pixels). Returns the time of its beginning, in nanoseconds.
+    def write_trajectory(self, name, start, commands, points=None):
+        commands = np.asarray(commands, dtype=float).reshape(-1, 2)
+        poses = simulate(start, commands[:, 0], commands[:, 1], self.entraxe)[0]
+        # fr : Une commande NaN (angle rejeté, voir trajectory_compiler.curv_to_angle) termine la simulation : la
+        # trajectoire est coupée à la première pose NaN, avec les commandes qui y mènent, pour que la pose et la
+        # commande de même indice restent publiées au même instant.
+        # en : A NaN command (rejected angle, see trajectory_compiler.curv_to_angle) ends the simulation : the
+        # trajectory is cut at the first NaN pose, with the commands leading to it, so that the pose and the command
+        # of the same index stay published at the same time.
+        invalid = np.flatnonzero(np.isnan(poses).any(axis=1))
+        if len(invalid):
+            end = int(invalid[0])
+            print("%s : NaN pose at index %d, trajectory truncated to %d of %d commands"
+                  % (name, end, max(end - 1, 0), len(commands)), file=sys.stderr)
+            poses, commands = poses[:end], commands[:max(end - 1, 0)]
+        pose_messages = _poses(poses)
+        begin = self.time_ns
+        self._writer.add_metadata(name="trajectory", data={"name": str(name), "log_time": str(begin),
+                                                           "n_commands": str(len(commands))})
+
+        stamp = _timestamp(begin)
+        self._write("/path", begin, {"timestamp": stamp, "frame_id": FRAME, "poses": pose_messages})
+        if points is not None and len(points):
+            self._write("/drawing", begin, {"timestamp": stamp, "frame_id": FRAME,
+                                            "poses": _drawing_poses(points, self.distance_ratio)})
+        for index, pose in enumerate(pose_messages):
+            time_ns = begin + index * self.period_ns
+            stamp = _timestamp(time_ns)
+            self._write("/pose", time_ns, {"timestamp": stamp, "frame_id": FRAME, "pose": pose})
+            if index < len(commands):
+                speed, angle = commands[index].tolist()
+                self._write("/commands", time_ns, {"timestamp": stamp, "trajectory": str(name), "index": index,
+                                                   "speed": speed, "angle": angle})
+        self.time_ns = begin + max(len(pose_messages) - 1, 0) * self.period_ns + self.gap_ns
+        self.count += 1
+        return begin
+
+
+# fr : Trajectoires (nom, départ, commandes, points) lues une par une dans des fichiers trajectoire, avec leur fichier
+# points s'il existe.
+# en : Trajectories (name, start, commands, points) read one by one from trajectory files, with their points file if
+# it exists.
+def iter_files(paths):
+    for path in paths:
+        start, commands = read_commands(path)
+        points_path = points_path_for(path)
+        points = read_points_any(points_path) if os.path.exists(points_path) else None
+        yield os.path.basename(path), start, commands, points
+
+
+# fr : Trajectoires (nom, départ, commandes, points) lues une par une dans un dépôt (voir trajectory_repository.py).
+# en : Trajectories (name, start, commands, points) read one by one from a repository (see trajectory_repository.py).
+def iter_repository(repository, ids=None, circuit=None):
+    for trajectory_id in (ids if ids is not None else repository.ids(circuit)):
+        trajectory = repository.get(trajectory_id)
+        yield "trajectory%d" % trajectory.id, trajectory.start, trajectory.commands, trajectory.points
+
+
+# fr : Écriture des trajectoires trajectories (voir iter_files et iter_repository) dans le fichier MCAP path, précédées
+# de la carte du circuit si circuit est donné. Renvoie le nombre de trajectoires écrites.
+# en : Writing of the trajectories trajectories (see iter_files and iter_repository) into the MCAP file path, preceded
+# by the map of the circuit if circuit is given. Returns the number of written trajectories.
+def export_mcap(path, trajectories, circuit=None, period=PERIOD, gap=GAP, entraxe=ENTRAXE,
+                distance_ratio=DISTANCE_RATIO, map_level=0):
+    with McapExporter(path, period, gap, entraxe, distance_ratio) as exporter:
+        if circuit is not None:
+            exporter.write_map(circuit, map_level)
+        for name, start, commands, points in trajectories:
+            exporter.write_trajectory(name, start, commands, points)
+        return exporter.count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export trajectories to an MCAP file for Foxglove Studio.")
+    parser.add_argument("trajectories", nargs="*", help="trajectoireN.txt/.bin files, next to their pointsN files")
+    parser.add_argument("-o", "--output", default="trajectoires.mcap", help="MCAP file to write")
+    parser.add_argument("--database", default=None, help="read the trajectories from this repository instead")
+    parser.add_argument("--ids", type=int, nargs="*", default=None, help="with --database, trajectories to export")
+    parser.add_argument("--circuit", default=None,
+                        help="circuit image published as the map (with --database, also selects the trajectories)")
+    parser.add_argument("--map-level", type=int, default=0, help="pyramid level of the map (0 : full resolution)")
+    parser.add_argument("--period", type=float, default=PERIOD, help="duration of a command in seconds")
+    parser.add_argument("--gap", type=float, default=GAP, help="pause between two trajectories in seconds")
+    parser.add_argument("--entraxe", type=float, default=ENTRAXE, help="wheelbase of the car in metres")
+    parser.add_argument("--distance-ratio", type=float, default=DISTANCE_RATIO, help="pixels per metre")
+    args = parser.parse_args(argv)
+    if (args.database is None) == (not args.trajectories):
+        parser.error("give either trajectory files or --database")
+
+    if args.database is None:
+        count = export_mcap(args.output, iter_files(args.trajectories), args.circuit, args.period, args.gap,
+                            args.entraxe, args.distance_ratio, args.map_level)
+    else:
+        from trajectory_repository import TrajectoryRepository
+
+        with TrajectoryRepository(args.database) as repository:
+            count = export_mcap(args.output, iter_repository(repository, args.ids, args.circuit), args.circuit,
+                                args.period, args.gap, args.entraxe, args.distance_ratio, args.map_level)
+    print("%d trajectories exported to %s" % (count, args.output))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# Scene items : graphics items of the zoomable Canvas (tiled background, vector trajectories and stroke being drawn).
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# fr : Les coordonnées de la scène sont les pixels de l'image du circuit (niveau 0 de la pyramide) : un point de la
+# scène vaut 1 / distance_ratio mètre, quel que soit le zoom de la vue.
+# en : The coordinates of the scene are the pixels of the circuit image (level 0 of the pyramid) : a point of the scene
+# is worth 1 / distance_ratio metre, whatever the zoom of the view.
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+import math
+from collections import OrderedDict
+
+import numpy as np
+from PyQt5.QtCore import Qt, QPointF, QRectF, QLineF
+from PyQt5.QtGui import QColor, QImage, QPainter, QPen, QPixmap, QPolygonF
+from PyQt5.QtWidgets import QGraphicsItem, QStyleOptionGraphicsItem
+
+from stroke_buffer import StrokeBuffer
+from spline_curve import simplification_tolerances
+
+
+# fr : Écart maximal (en pixels de l'écran) entre une trajectoire simplifiée et la trajectoire complète.
+# en : Maximum gap (in screen pixels) between a simplified trajectory and the whole trajectory.
+SCREEN_TOLERANCE = 0.5
+
+
+def _polygon(points):
+    return QPolygonF([QPointF(x, y) for x, y in points.tolist()])
+
+
+# fr : La classe TrajectoryItem affiche une trajectoire enregistrée sous forme vectorielle. Tant que la vue n'est pas
+# dézoomée, la polyligne complète est tracée ; en dessous, la polyligne est simplifiée pour chaque niveau de zoom
+# (puissance de 2) à moins de SCREEN_TOLERANCE pixel de l'écran près, et gardée en cache.
+# en : The TrajectoryItem class shows a saved trajectory as vectors. As long as the view is not zoomed out, the whole
+# polyline is drawn ; below, the polyline is simplified for each zoom level (power of 2) within SCREEN_TOLERANCE screen
+# pixel, and kept in cache.
+class TrajectoryItem(QGraphicsItem):
+
+    def __init__(self, points, color, width=3):
+        super().__init__()
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
+        self.pen = QPen(QColor(color))
+        self.pen.setWidth(width)
+        self.pen.setStyle(Qt.SolidLine)
+        self._tolerances = None
+        self._polylines = {}
+        if len(self.points):
+            (left, top), (right, bottom) = self.points.min(axis=0), self.points.max(axis=0)
+            self._rect = QRectF(left, top, right - left, bottom - top).adjusted(-width, -width, width, width)
+        else:
+            self._rect = QRectF()
+
+
+    def boundingRect(self):
+        return self._rect
+
+
+    # fr : Polyligne du niveau level : complète au niveau 0, simplifiée à SCREEN_TOLERANCE * 2^level pixels de la
+    # scène au-delà.
+    # en : Polyline of the level level : whole at level 0, simplified within SCREEN_TOLERANCE * 2^level scene pixels
+    # beyond.
+    def polyline(self, level):
+        polyline = self._polylines.get(level)
+        if polyline is None:
+            points = self.points
+            if level > 0:
+                if self._tolerances is None:
+                    self._tolerances = simplification_tolerances(points, SCREEN_TOLERANCE)
+                points = points[self._tolerances >= SCREEN_TOLERANCE * (1 << level)]
+            polyline = self._polylines[level] = _polygon(points)
+        return polyline
+
+
+    def paint(self, painter, option, widget=None):
+        scale = QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+        level = int(math.floor(math.log2(1.0 / scale))) if 0 < scale < 1 else 0
+        painter.setPen(self.pen)
+        painter.drawPolyline(self.polyline(level))
+
+
+# fr : La classe StrokeItem affiche le tracé en cours, segment par segment. Seul le rectangle du dernier segment est
+# redessiné à chaque ajout, et paint ne trace que les segments qui touchent la zone à redessiner.
+# en : The StrokeItem class shows the drawing in progress, segment by segment. Only the rectangle of the last segment
+# is repainted on each addition, and paint only draws the segments which touch the area to repaint.
+class StrokeItem(QGraphicsItem):
+
+    def __init__(self, color, width=3):
+        super().__init__()
+        self.pen = QPen(QColor(color))
+        self.pen.setWidth(width)
+        self.pen.setStyle(Qt.SolidLine)
+        self.width = width
+        # fr : Extrémités des segments, deux points par segment.
+        # en : Ends of the segments, two points per segment.
+        self._ends = StrokeBuffer(capacity=4096, dtype=np.float64)
+        self._rect = QRectF()
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+        self.setZValue(1)
+
+
+    def boundingRect(self):
+        return self._rect
+
+
+    def setColor(self, color):
+        self.pen.setColor(QColor(color))
+
+
+    def addSegment(self, x0, y0, x1, y1):
+        self._ends.append(x0, y0)
+        self._ends.append(x1, y1)
+        w = self.width
+        segment = QRectF(min(x0, x1) - w, min(y0, y1) - w, abs(x1 - x0) + 2 * w, abs(y1 - y0) + 2 * w)
+        if not self._rect.contains(segment):
+            self.prepareGeometryChange()
+            self._rect = segment if self._rect.isNull() else self._rect.united(segment)
+        self.update(segment)
+
+
+    def clear(self):
+        self.prepareGeometryChange()
+        self._ends.clear()
+        self._rect = QRectF()
+
+
+    # fr : Remplace les segments par ceux de la polyligne points (n, 2), d'un seul coup.
+    # en : Replaces the segments by those of the polyline points (n, 2), at once.
+    def setPolyline(self, points):
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        self.clear()
+        if len(points) < 2:
+            return
+        self._ends.extend(np.stack((points[:-1], points[1:]), axis=1).reshape(-1, 2))
+        (left, top), (right, bottom) = points.min(axis=0), points.max(axis=0)
+        w = self.width
+        self._rect = QRectF(left - w, top - w, right - left + 2 * w, bottom - top + 2 * w)
+        self.update()
+
+
+    def paint(self, painter, option, widget=None):
+        if len(self._ends) == 0:
+            return
+        segments = self._ends.points.reshape(-1, 4)
+        area = option.exposedRect.adjusted(-self.width, -self.width, self.width, self.width)
+        visible = ((np.maximum(segments[:, 0], segments[:, 2]) >= area.left())
+                   & (np.minimum(segments[:, 0], segments[:, 2]) <= area.right())
+                   & (np.maximum(segments[:, 1], segments[:, 3]) >= area.top())
+                   & (np.minimum(segments[:, 1], segments[:, 3]) <= area.bottom()))
+        painter.setPen(self.pen)
+        painter.drawLines([QLineF(*segment) for segment in segments[visible].tolist()])
+
+
+# fr : La classe CurveItem affiche une courbe éditable (voir spline_curve.py) et ses points de contrôle, dont la
+# taille à l'écran ne dépend pas du zoom : le Canvas donne leur demi-côté en pixels de la scène avec setHandleSize.
+# en : The CurveItem class shows an editable curve (see spline_curve.py) and its control points, whose size on screen
+# does not depend on the zoom : the Canvas gives their half side in scene pixels with setHandleSize.
+class CurveItem(QGraphicsItem):
+
+    def __init__(self, curve, color, width=3, handle=4.0):
+        super().__init__()
+        self.curve = curve
+        self.pen = QPen(QColor(color))
+        self.pen.setWidth(width)
+        self.pen.setStyle(Qt.SolidLine)
+        self.width = width
+        self.handle = handle
+        # fr : Indice du point de contrôle sélectionné (None s'il n'y en a pas).
+        # en : Index of the selected control point (None if there is none).
+        self.selected = None
+        self.setZValue(2)
+        self.curveChanged()
+
+
+    def boundingRect(self):
+        return self._rect
+
+
+    def setHandleSize(self, handle):
+        self.prepareGeometryChange()
+        self.handle = handle
+        self._rect = self._bounds()
+
+
+    # fr : À appeler après chaque modification des points de contrôle : la courbe est évaluée de nouveau.
+    # en : To call after each change of the control points : the curve is evaluated again.
+    def curveChanged(self):
+        self.prepareGeometryChange()
+        self.polyline = _polygon(self.curve.points())
+        self._rect = self._bounds()
+        self.update()
+
+
+    def _bounds(self):
+        margin = max(self.width, 2 * self.handle)
+        return self.polyline.boundingRect().adjusted(-margin, -margin, margin, margin)
+
+
+    def paint(self, painter, option, widget=None):
+        painter.setPen(self.pen)
+        painter.drawPolyline(self.polyline)
+        painter.setPen(QPen(Qt.black, 0))
+        size = 2 * self.handle
+        for index, (x, y) in enumerate(self.curve.control.tolist()):
+            painter.setBrush(QColor(255, 140, 0) if index == self.selected else Qt.white)
+            painter.drawRect(QRectF(x - self.handle, y - self.handle, size, size))
+
+
+# fr : La classe TileLayerItem affiche le fond du circuit à partir d'une pyramide de tuiles (voir tile_pyramid.py) :
+# seules les tuiles visibles du niveau adapté au zoom sont lues puis converties en QPixmap. Les capacity dernières
+# tuiles utilisées restent en cache.
+# en : The TileLayerItem class shows the background of the circuit from a tile pyramid (see tile_pyramid.py) : only the
+# visible tiles of the level matching the zoom are read then converted to QPixmap. The last capacity used tiles stay
+# in cache.
+class TileLayerItem(QGraphicsItem):
+
+    def __init__(self, pyramid, capacity=256):
+        super().__init__()
+        self.pyramid = pyramid
+        self.capacity = capacity
+        self._pixmaps = OrderedDict()
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+        self.setZValue(-1)
+
+
+    def boundingRect(self):
+        return QRectF(0, 0, self.pyramid.width, self.pyramid.height)
+
+
+    def _pixmap(self, level, tx, ty):
+        key = (level, tx, ty)
+        pixmap = self._pixmaps.get(key)
+        if pixmap is not None:
+            self._pixmaps.move_to_end(key)
+            return pixmap
+        tile = np.ascontiguousarray(self.pyramid.image_tile(level, tx, ty))
+        size = self.pyramid.tile
+        pixmap = QPixmap.fromImage(QImage(tile.data, size, size, 4 * size, QImage.Format_RGBA8888))
+        self._pixmaps[key] = pixmap
+        if len(self._pixmaps) > self.capacity:
+            self._pixmaps.popitem(last=False)
+        return pixmap
+
+
+    def paint(self, painter, option, widget=None):
+        scale = QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+        level = self.pyramid.level_for_scale(scale)
+        area = option.exposedRect
+        size = self.pyramid.tile << level
+        if level > 0:
+            painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        for tx, ty in self.pyramid.tiles_in(level, area.left(), area.top(), area.right(), area.bottom()):
+            painter.drawPixmap(QRectF(tx * size, ty * size, size, size), self._pixmap(level, tx, ty),
+                               QRectF(0, 0, self.pyramid.tile, self.pyramid.tile))
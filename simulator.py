@@ -0,0 +1,173 @@
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# Simulator : replay of the trajectory command files with the bicycle model, and comparison with the drawn points.
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# fr : Utilisation : python simulator.py dossier/trajectoire*.txt [--csv erreurs.csv]
+# en : Usage : python simulator.py folder/trajectoire*.txt [--csv errors.csv]
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+import argparse
+import csv
+import os
+import sys
+import numpy as np
+
+import trajectory_compiler
+from trajectory_compiler import ENTRAXE, DISTANCE_RATIO, SIMULATION_HEIGHT
+
+
+# fr : Lecture d'un fichier trajectoire, texte ou binaire selon son extension.
+# en : Reading of a trajectory file, text or binary according to its extension.
+def read_commands(path):
+    if path.endswith(".bin"):
+        import binary_format
+        start, commands = binary_format.read_trajectory_bin(path)
+        return start, np.asarray(commands, dtype=float)
+    return trajectory_compiler.read_trajectory(path)
+
+
+# fr : Lecture de plusieurs fichiers trajectoire dans des tableaux à une ligne par trajectoire : positions de départ
+# (n, 3), vitesses et angles (n, longueur maximale) complétés par des NaN, et longueurs.
+# en : Reading of several trajectory files into arrays with one row per trajectory : starting positions (n, 3), speeds
+# and angles (n, maximal length) padded with NaN, and lengths.
+def load_commands(paths):
+    loaded = [read_commands(path) for path in paths]
+    lengths = np.array([len(commands) for _, commands in loaded], dtype=np.intp)
+    starts = np.array([start for start, _ in loaded], dtype=float).reshape(-1, 3)
+    speed = np.full((len(loaded), lengths.max(initial=0)), np.nan)
+    steering = np.full_like(speed, np.nan)
+    for i, (_, commands) in enumerate(loaded):
+        speed[i, :lengths[i]] = commands[:, 0]
+        steering[i, :lengths[i]] = commands[:, 1]
+    return starts, speed, steering, lengths
+
+
+# fr : Intégration du modèle bicyclette pour toutes les trajectoires à la fois. Chaque commande fait avancer la voiture
+# d'une distance égale à sa vitesse, avec une courbure tan(angle) / entraxe ; le cap au milieu du pas est utilisé pour
+# les positions. Les commandes NaN (trajectoires plus courtes) laissent la voiture immobile. Renvoie les poses
+# (x, y, cap) de forme (n, longueur + 1, 3) dans le repère de la simulation, NaN après la fin de chaque trajectoire.
+# en : Integration of the bicycle model for all the trajectories at once. Each command moves the car by a distance
+# equal to its speed, with a curvature tan(angle) / entraxe ; the heading in the middle of the step is used for the
+# positions. NaN commands (shorter trajectories) leave the car still. Returns the poses (x, y, heading) of shape
+# (n, length + 1, 3) in the simulation frame, NaN after the end of each trajectory.
+def simulate(starts, speed, steering, entraxe=ENTRAXE):
+    starts = np.asarray(starts, dtype=float).reshape(-1, 3)
+    speed = np.atleast_2d(np.asarray(speed, dtype=float))
+    steering = np.atleast_2d(np.asarray(steering, dtype=float))
+    padding = np.isnan(speed) | np.isnan(steering)
+    distance = np.where(padding, 0.0, speed)
+    turn = distance * np.tan(np.where(padding, 0.0, steering)) / entraxe
+
+    zeros = np.zeros((len(starts), 1))
+    heading = starts[:, 2:3] + np.concatenate((zeros, np.cumsum(turn, axis=1)), axis=1)
+    middle = heading[:, :-1] + turn / 2
+    x = starts[:, 0:1] + np.concatenate((zeros, np.cumsum(distance * np.cos(middle), axis=1)), axis=1)
+    y = starts[:, 1:2] + np.concatenate((zeros, np.cumsum(distance * np.sin(middle), axis=1)), axis=1)
+
+    poses = np.stack((x, y, heading), axis=-1)
+    ended = np.concatenate((np.zeros((len(starts), 1), dtype=bool), np.cumsum(padding, axis=1) > 0), axis=1)
+    poses[ended] = np.nan
+    return poses
+
+
+# fr : Points d'un tracé (en pixels, repère de l'écran) convertis en mètres dans le repère de la simulation.
+# en : Points of a drawing (in pixels, screen frame) converted to metres in the simulation frame.
+def points_to_simulation(points, distance_ratio=DISTANCE_RATIO):
+    points = np.asarray(points, dtype=float).reshape(-1, 2) / distance_ratio
+    return np.column_stack((points[:, 0], SIMULATION_HEIGHT - points[:, 1]))
+
+
+# fr : Distance de chaque position à la polyligne (distance au segment le plus proche), calculée par blocs pour
+# limiter la mémoire utilisée.
+# en : Distance from each position to the polyline (distance to the closest segment), computed by blocks to limit the
+# memory used.
+def distance_to_polyline(positions, polyline, block=256):
+    positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+    polyline = np.asarray(polyline, dtype=float).reshape(-1, 2)
+    if len(polyline) == 1:
+        return np.hypot(*(positions - polyline[0]).T)
+    a = polyline[:-1]
+    ab = polyline[1:] - a
+    length2 = np.maximum(np.einsum("ij,ij->i", ab, ab), 1e-12)
+    distances = np.empty(len(positions))
+    for i in range(0, len(positions), block):
+        ap = positions[i:i + block, None, :] - a[None, :, :]
+        t = np.clip(np.einsum("pij,ij->pi", ap, ab) / length2, 0.0, 1.0)
+        closest = ap - t[..., None] * ab
+        distances[i:i + block] = np.sqrt(np.min(np.einsum("pij,pij->pi", closest, closest), axis=1))
+    return distances
+
+
+# fr : Écart entre les poses reconstruites d'une trajectoire et le tracé d'origine : écart moyen et maximal au tracé,
+# et distance entre la position finale et le dernier point du tracé (en mètres).
+# en : Deviation between the reconstructed poses of a trajectory and the original drawing : mean and maximal distance
+# to the drawing, and distance between the final position and the last point of the drawing (in metres).
+def deviation(poses, points, distance_ratio=DISTANCE_RATIO):
+    poses = poses[~np.isnan(poses[:, 0])]
+    drawn = points_to_simulation(points, distance_ratio)
+    distances = distance_to_polyline(poses[:, :2], drawn)
+    final = float(np.hypot(*(poses[-1, :2] - drawn[-1])))
+    return {"mean_error": float(distances.mean()), "max_error": float(distances.max()), "final_error": final}
+
+
+# fr : trajectoireN.txt (ou .bin) est associé au fichier pointsN.txt (ou .bin) du même dossier.
+# en : trajectoireN.txt (or .bin) is matched with the pointsN.txt (or .bin) file of the same folder.
+def points_path_for(trajectory_path):
+    folder, name = os.path.split(trajectory_path)
+    if name.startswith("trajectoire_"):
+        name = name[len("trajectoire_"):]
+    elif name.startswith("trajectoire"):
+        name = "points" + name[len("trajectoire"):]
+    path = os.path.join(folder, name)
+    if path.endswith(".bin") and not os.path.exists(path):
+        return path[:-4] + ".txt"
+    return path
+
+
+def read_points_any(path):
+    if path.endswith(".bin"):
+        import binary_format
+        return binary_format.read_points_bin(path)
+    return trajectory_compiler.read_points(path)
+
+
+# fr : Simule toutes les trajectoires d'un coup puis compare chacune à son fichier points.
+# en : Simulates all the trajectories at once then compares each of them with its points file.
+def evaluate(trajectory_paths, entraxe=ENTRAXE, distance_ratio=DISTANCE_RATIO):
+    starts, speed, steering, lengths = load_commands(trajectory_paths)
+    poses = simulate(starts, speed, steering, entraxe)
+    results = []
+    for path, trajectory_poses in zip(trajectory_paths, poses):
+        result = deviation(trajectory_poses, read_points_any(points_path_for(path)), distance_ratio)
+        result["trajectory"] = path
+        results.append(result)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay trajectory files with the bicycle model and measure the "
+                                                 "deviation from the drawn points.")
+    parser.add_argument("trajectories", nargs="+", help="trajectoireN.txt/.bin files, next to their pointsN files")
+    parser.add_argument("--entraxe", type=float, default=ENTRAXE, help="wheelbase of the car in metres")
+    parser.add_argument("--distance-ratio", type=float, default=DISTANCE_RATIO, help="pixels per metre")
+    parser.add_argument("--csv", default=None, help="write the deviations to this CSV file")
+    args = parser.parse_args(argv)
+
+    results = evaluate(args.trajectories, args.entraxe, args.distance_ratio)
+    fields = ["trajectory", "mean_error", "max_error", "final_error"]
+    if args.csv is not None:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(results)
+    for result in results:
+        print("%s : mean %.3f m, max %.3f m, final %.3f m"
+              % (result["trajectory"], result["mean_error"], result["max_error"], result["final_error"]))
+    if results:
+        print("mean error over %d trajectories : %.3f m"
+              % (len(results), np.mean([result["mean_error"] for result in results])))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
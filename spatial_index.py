@@ -0,0 +1,101 @@
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# Spatial index : uniform grid hash of 2D points for the hit-testing of the Canvas.
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+import math
+import numpy as np
+
+
+# fr : La classe GridIndex range des points identifiés par une clé (par exemple (trajectoire, indice)) dans les cases
+# d'une grille de côté cell. Une recherche autour d'un point ne parcourt que les cases qui touchent le disque de
+# recherche : son coût dépend du nombre de points proches et non du nombre total de points. Ajouter, déplacer ou
+# retirer un point coûte O(1).
+# en : The GridIndex class stores points identified by a key (for example (trajectory, index)) in the cells of a grid
+# of side cell. A search around a point only goes through the cells which touch the search disk : its cost depends on
+# the number of close points and not on the total number of points. Adding, moving or removing a point costs O(1).
+class GridIndex:
+
+    def __init__(self, cell=16.0):
+        self.cell = float(cell)
+        self._cells = {}
+        self._positions = {}
+
+
+    def __len__(self):
+        return len(self._positions)
+
+
+    def __contains__(self, key):
+        return key in self._positions
+
+
+    def _cell(self, x, y):
+        return int(math.floor(x / self.cell)), int(math.floor(y / self.cell))
+
+
+    def position(self, key):
+        return self._positions[key]
+
+
+    def insert(self, key, x, y):
+        if key in self._positions:
+            self.remove(key)
+        self._positions[key] = (x, y)
+        self._cells.setdefault(self._cell(x, y), set()).add(key)
+
+
+    # fr : Ajout d'un tableau (n, 2) de points avec leurs n clés.
+    # en : Adds an (n, 2) array of points with their n keys.
+    def insert_many(self, keys, points):
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        cells = np.floor(points / self.cell).astype(np.int64)
+        for key, position, cell in zip(keys, points.tolist(), map(tuple, cells.tolist())):
+            if key in self._positions:
+                self.remove(key)
+            self._positions[key] = tuple(position)
+            self._cells.setdefault(cell, set()).add(key)
+
+
+    def remove(self, key):
+        cell = self._cell(*self._positions.pop(key))
+        keys = self._cells[cell]
+        keys.discard(key)
+        if not keys:
+            del self._cells[cell]
+
+
+    def move(self, key, x, y):
+        if self._cell(*self._positions[key]) == self._cell(x, y):
+            self._positions[key] = (x, y)
+        else:
+            self.insert(key, x, y)
+
+
+    def clear(self):
+        self._cells.clear()
+        self._positions.clear()
+
+
+    # fr : Clés des points à une distance au plus radius de (x, y), du plus proche au plus éloigné.
+    # en : Keys of the points at a distance of at most radius from (x, y), from the closest to the farthest.
+    def query(self, x, y, radius):
+        reach = int(math.ceil(radius / self.cell))
+        cx, cy = self._cell(x, y)
+        found = []
+        for i in range(cx - reach, cx + reach + 1):
+            for j in range(cy - reach, cy + reach + 1):
+                for key in self._cells.get((i, j), ()):
+                    px, py = self._positions[key]
+                    distance = math.hypot(px - x, py - y)
+                    if distance <= radius:
+                        found.append((distance, key))
+        found.sort(key=lambda item: item[0])
+        return [key for _, key in found]
+
+
+    # fr : Clé du point le plus proche de (x, y) à moins de radius, ou None.
+    # en : Key of the closest point to (x, y) within radius, or None.
+    def nearest(self, x, y, radius):
+        keys = self.query(x, y, radius)
+        return keys[0] if keys else None
@@ -0,0 +1,131 @@
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# Spline curve : fitting of a recorded drawing to an editable Catmull-Rom spline and evaluation of the spline.
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+import math
+import numpy as np
+
+
+# fr : Écart maximal (en pixels) entre le tracé et ses points de contrôle, et distance (en pixels) entre deux points
+# de la courbe évaluée.
+# en : Maximum gap (in pixels) between the drawing and its control points, and distance (in pixels) between two
+# points of the evaluated curve.
+FIT_TOLERANCE = 2.0
+CURVE_SPACING = 2.0
+
+
+# fr : Importance de chaque point d'une polyligne (n, 2) pour l'algorithme de Ramer-Douglas-Peucker : la polyligne
+# simplifiée à la tolérance tolerance est formée des points dont l'importance dépasse tolerance. Un seul calcul sert
+# donc à toutes les tolérances. Les extrémités ont une importance infinie ; les portions plus droites que epsilon ne
+# sont pas détaillées.
+# en : Importance of each point of an (n, 2) polyline for the Ramer-Douglas-Peucker algorithm : the polyline
+# simplified at the tolerance tolerance is made of the points whose importance exceeds tolerance. A single computation
+# hence serves all the tolerances. The ends have an infinite importance ; the parts straighter than epsilon are not
+# detailed.
+def simplification_tolerances(points, epsilon=0.5):
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    n = len(points)
+    tolerances = np.zeros(n)
+    if n == 0:
+        return tolerances
+    tolerances[0] = tolerances[-1] = np.inf
+    stack = [(0, n - 1, np.inf)]
+    while stack:
+        first, last, parent = stack.pop()
+        if last - first < 2:
+            continue
+        origin = points[first]
+        chord = points[last] - origin
+        inner = points[first + 1:last] - origin
+        length = math.hypot(chord[0], chord[1])
+        if length > 0:
+            distances = np.abs(chord[0] * inner[:, 1] - chord[1] * inner[:, 0]) / length
+        else:
+            distances = np.hypot(inner[:, 0], inner[:, 1])
+        index = int(np.argmax(distances))
+        tolerance = min(distances[index], parent)
+        if tolerance < epsilon:
+            tolerances[first + 1:last] = np.minimum(distances, parent)
+            continue
+        middle = first + 1 + index
+        tolerances[middle] = tolerance
+        stack.append((first, middle, tolerance))
+        stack.append((middle, last, tolerance))
+    return tolerances
+
+
+# fr : Points de la spline de Catmull-Rom centripète passant par les points de contrôle control (m, 2), espacés
+# d'environ spacing le long de chaque segment. La version centripète ne forme ni boucle ni pointe entre deux points de
+# contrôle proches. Aux extrémités, on ajoute le symétrique du deuxième point.
+# en : Points of the centripetal Catmull-Rom spline going through the control points control (m, 2), about spacing
+# apart along each segment. The centripetal version forms neither loop nor cusp between two close control points. At
+# the ends, the mirror of the second point is added.
+def catmull_rom(control, spacing=CURVE_SPACING):
+    control = np.asarray(control, dtype=float).reshape(-1, 2)
+    if len(control) > 1:
+        keep = np.concatenate(([True], np.any(np.diff(control, axis=0) != 0, axis=1)))
+        control = control[keep]
+    if len(control) < 2:
+        return control.copy()
+    padded = np.concatenate(([2 * control[0] - control[1]], control, [2 * control[-1] - control[-2]]))
+    p0, p1, p2, p3 = padded[:-3], padded[1:-2], padded[2:-1], padded[3:]
+    d01 = np.maximum(np.sqrt(np.hypot(*(p1 - p0).T)), 1e-9)
+    d12 = np.maximum(np.sqrt(np.hypot(*(p2 - p1).T)), 1e-9)
+    d23 = np.maximum(np.sqrt(np.hypot(*(p3 - p2).T)), 1e-9)
+
+    # fr : Paramètres des points de chaque segment, t dans [t1, t2[ avec t0 = 0, t1 = d01, t2 = t1 + d12.
+    # en : Parameters of the points of each segment, t in [t1, t2[ with t0 = 0, t1 = d01, t2 = t1 + d12.
+    counts = np.maximum(np.ceil(np.hypot(*(p2 - p1).T) / spacing).astype(np.intp), 1)
+    segment = np.repeat(np.arange(len(counts)), counts)
+    u = (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)) / counts[segment]
+    t1, t2 = d01[segment], d01[segment] + d12[segment]
+    t3 = t2 + d23[segment]
+    t = (t1 + u * d12[segment])[:, None]
+    t1, t2, t3 = t1[:, None], t2[:, None], t3[:, None]
+    p0, p1, p2, p3 = p0[segment], p1[segment], p2[segment], p3[segment]
+
+    # fr : Formule de Barry et Goldman.
+    # en : Barry and Goldman formula.
+    a1 = ((t1 - t) * p0 + t * p1) / t1
+    a2 = ((t2 - t) * p1 + (t - t1) * p2) / (t2 - t1)
+    a3 = ((t3 - t) * p2 + (t - t2) * p3) / (t3 - t2)
+    b1 = ((t2 - t) * a1 + t * a2) / t2
+    b2 = ((t3 - t) * a2 + (t - t1) * a3) / (t3 - t1)
+    curve = ((t2 - t) * b1 + (t - t1) * b2) / (t2 - t1)
+    return np.concatenate((curve, control[-1:]))
+
+
+# fr : La classe SplineCurve est une courbe éditable : ses points de contrôle sont les points les plus importants du
+# tracé (voir simplification_tolerances) et la courbe est la spline de Catmull-Rom qui les relie. Déplacer un point de
+# contrôle ne modifie la courbe qu'entre ses deux voisins de chaque côté.
+# en : The SplineCurve class is an editable curve : its control points are the most important points of the drawing
+# (see simplification_tolerances) and the curve is the Catmull-Rom spline joining them. Moving a control point only
+# changes the curve between its two neighbours on each side.
+class SplineCurve:
+
+    def __init__(self, control, spacing=CURVE_SPACING):
+        self.control = np.array(control, dtype=float).reshape(-1, 2)
+        self.spacing = spacing
+
+
+    # fr : Courbe passant à moins de tolerance pixels des points du tracé points (n, 2).
+    # en : Curve going within tolerance pixels of the points of the drawing points (n, 2).
+    @classmethod
+    def fit(cls, points, tolerance=FIT_TOLERANCE, spacing=CURVE_SPACING):
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        return cls(points[simplification_tolerances(points, tolerance) >= tolerance], spacing)
+
+
+    def __len__(self):
+        return len(self.control)
+
+
+    def move(self, index, x, y):
+        self.control[index] = (x, y)
+
+
+    # fr : Points (en pixels) de la courbe, à passer à la chaîne de compilation comme un tracé.
+    # en : Points (in pixels) of the curve, to pass to the compilation pipeline like a drawing.
+    def points(self):
+        return catmull_rom(self.control, self.spacing)
@@ -0,0 +1,105 @@
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# Stroke buffer : compact and growable storage of the points acquired while drawing.
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+import numpy as np
+
+
+# fr : La classe StrokeBuffer stocke les coordonnées x,y (et éventuellement les instants) des points d'un tracé dans un
+# tableau NumPy préalloué. Lorsque le tableau est plein, sa capacité est doublée : l'ajout d'un point coûte donc O(1)
+# en moyenne, au lieu d'une copie complète du tableau avec np.append.
+# en : The StrokeBuffer class stores the x,y coordinates (and optionally the timestamps) of the points of a drawing in
+# a preallocated NumPy array. When the array is full, its capacity is doubled : appending a point therefore costs O(1)
+# on average, instead of a full copy of the array with np.append.
+class StrokeBuffer:
+
+    def __init__(self, capacity=1024, dtype=np.int32, timestamps=False):
+        self._xy = np.empty((max(int(capacity), 1), 2), dtype=dtype)
+        self._t = np.empty(len(self._xy), dtype=np.float64) if timestamps else None
+        self._size = 0
+
+
+    def __len__(self):
+        return self._size
+
+
+    # fr : Ajout d'un point à la fin du tracé. t est l'instant du point (en ms), ignoré si les instants ne sont pas
+    # stockés.
+    # en : Appends a point at the end of the drawing. t is the timestamp of the point (in ms), ignored if timestamps
+    # are not stored.
+    def append(self, x, y, t=None):
+        if self._size == len(self._xy):
+            self._grow(2 * len(self._xy))
+        self._xy[self._size, 0] = x
+        self._xy[self._size, 1] = y
+        if self._t is not None:
+            self._t[self._size] = np.nan if t is None else t
+        self._size += 1
+
+
+    # fr : Ajout d'un tableau (n, 2) de points d'un seul coup.
+    # en : Appends an (n, 2) array of points at once.
+    def extend(self, points, t=None):
+        points = np.asarray(points).reshape(-1, 2)
+        end = self._size + len(points)
+        if end > len(self._xy):
+            self._grow(max(end, 2 * len(self._xy)))
+        self._xy[self._size:end] = points
+        if self._t is not None:
+            self._t[self._size:end] = np.nan if t is None else t
+        self._size = end
+
+
+    def _grow(self, capacity):
+        xy = np.empty((capacity, 2), dtype=self._xy.dtype)
+        xy[:self._size] = self._xy[:self._size]
+        self._xy = xy
+        if self._t is not None:
+            t = np.empty(capacity, dtype=np.float64)
+            t[:self._size] = self._t[:self._size]
+            self._t = t
+
+
+    # fr : On vide le tracé en conservant la mémoire déjà allouée.
+    # en : The drawing is emptied while keeping the memory already allocated.
+    def clear(self):
+        self._size = 0
+
+
+    # fr : On ne garde que les size premiers points.
+    # en : Only the first size points are kept.
+    def truncate(self, size):
+        self._size = min(max(int(size), 0), self._size)
+
+
+    # fr : Vues (sans copie) sur les points stockés. Elles ne sont valables que jusqu'au prochain ajout.
+    # en : Views (without copy) of the stored points. They are only valid until the next append.
+    @property
+    def points(self):
+        return self._xy[:self._size]
+
+
+    @property
+    def x(self):
+        return self._xy[:self._size, 0]
+
+
+    @property
+    def y(self):
+        return self._xy[:self._size, 1]
+
+
+    @property
+    def timestamps(self):
+        if self._t is None:
+            return None
+        return self._t[:self._size]
+
+
+    # fr : Dernier point du tracé, sous forme de couple (x, y).
+    # en : Last point of the drawing, as an (x, y) pair.
+    def last(self):
+        if self._size == 0:
+            raise IndexError("empty stroke")
+        return tuple(self._xy[self._size - 1].tolist())
@@ -0,0 +1,202 @@
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# Stroke estimator : incremental resampling, speed, curvature and steering computation while a stroke is drawn.
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+import copy
+import numpy as np
+
+import trajectory_compiler
+from trajectory_compiler import ENTRAXE, DISTANCE_RATIO, SAMPLE_SPACING, SIMULATION_HEIGHT
+from stroke_buffer import StrokeBuffer
+
+
+# fr : La classe StreamingEstimator reçoit les points du tracé (en pixels) un par un et produit au fil de l'eau les
+# mêmes mesures que la chaîne points_to_samples + compile_trajectory : rééchantillonnage tous les spacing mètres, puis
+# vitesse, courbure et angle de braquage. Les dérivées de np.gradient sont centrées : la vitesse d'une mesure est
+# connue dès la mesure suivante, sa courbure deux mesures plus tard. Les deux dernières valeurs, qui utilisent les
+# formules de bord de np.gradient, ne sont calculées qu'à la validation (flush). Le résultat est identique au calcul
+# en une fois.
+# en : The StreamingEstimator class receives the points of the drawing (in pixels) one by one and produces on the fly
+# the same measurements as the points_to_samples + compile_trajectory pipeline : resampling every spacing metres, then
+# speed, curvature and steering angle. The derivatives of np.gradient are centered : the speed of a measurement is
+# known from the next measurement on, its curvature two measurements later. The last two values, which use the edge
+# formulas of np.gradient, are only computed on validation (flush). The result is identical to the one-shot
+# computation.
+class StreamingEstimator:
+
+    def __init__(self, spacing=SAMPLE_SPACING, distance_ratio=DISTANCE_RATIO, entraxe=ENTRAXE, policy="clip"):
+        if policy not in trajectory_compiler.STEERING_POLICIES:
+            raise ValueError("unknown steering policy %r, expected one of %s"
+                             % (policy, ", ".join(trajectory_compiler.STEERING_POLICIES)))
+        self.spacing = spacing
+        self.distance_ratio = distance_ratio
+        self.entraxe = entraxe
+        self.policy = policy
+        # fr : Mesures (en mètres), dérivées premières et secondes, puis couples (courbure, angle) déjà définitifs.
+        # en : Measurements (in metres), first and second derivatives, then (curvature, angle) pairs already final.
+        self._samples = StrokeBuffer(capacity=256, dtype=np.float64)
+        self._first = StrokeBuffer(capacity=256, dtype=np.float64)
+        self._second = StrokeBuffer(capacity=256, dtype=np.float64)
+        self._steering = StrokeBuffer(capacity=256, dtype=np.float64)
+        self.reset()
+
+
+    # fr : On oublie le tracé en cours.
+    # en : The current drawing is forgotten.
+    def reset(self):
+        self._samples.clear()
+        self._first.clear()
+        self._second.clear()
+        self._steering.clear()
+        self._start = None
+        self._previous = None
+        self._arc = 0.0
+        self._next = 0
+
+
+    def __len__(self):
+        return len(self._samples)
+
+
+    # fr : Mesures (en mètres) déjà produites, tableau (n, 2).
+    # en : Measurements (in metres) already produced, (n, 2) array.
+    @property
+    def samples(self):
+        return self._samples.points
+
+
+    # fr : Courbures et angles de braquage définitifs (les deux dernières mesures n'en ont pas encore).
+    # en : Final curvatures and steering angles (the last two measurements do not have one yet).
+    @property
+    def curvature(self):
+        return self._steering.x
+
+
+    @property
+    def angles(self):
+        return self._steering.y
+
+
+    # fr : Vrai si |entraxe * c| >= 1 (ou c indéfinie) pour la mesure index, dont la courbure doit être connue.
+    # en : True if |entraxe * c| >= 1 (or c undefined) for the measurement index, whose curvature must be known.
+    def out_of_range(self, index):
+        return not abs(self.entraxe * self._steering.x[index]) < 1
+
+
+    # fr : Ajout d'un point du tracé (en pixels). Renvoie les indices des mesures dont la courbure vient d'être calculée.
+    # en : Adds a point of the drawing (in pixels). Returns the indices of the measurements whose curvature has just
+    # been computed.
+    def add_point(self, x, y):
+        point = np.array((x, y), dtype=float) / self.distance_ratio
+        if self._previous is None:
+            self._start = point
+            self._previous = point
+            return self._add_sample(point)
+
+        length = np.hypot(*(point - self._previous))
+        if not length > 0:
+            return range(0)
+        arc = self._arc + length
+        done = len(self._steering)
+
+        # fr : Interpolation linéaire aux abscisses curvilignes k * spacing de ce segment, avec la formule de np.interp.
+        # en : Linear interpolation at the arc lengths k * spacing of this segment, with the formula of np.interp.
+        while self._next * self.spacing <= arc:
+            target = self._next * self.spacing
+            if target == arc:
+                sample = point
+            else:
+                sample = (point - self._previous) / (arc - self._arc) * (target - self._arc) + self._previous
+            self._add_sample(sample)
+        self._previous = point
+        self._arc = arc
+        return range(done, len(self._steering))
+
+
+    def _add_sample(self, sample):
+        self._samples.append(sample[0], sample[1])
+        self._next += 1
+        f = self._samples.points
+        n = len(f)
+        # fr : Dérivée première de la mesure n - 2 (formule de bord pour la première mesure).
+        # en : First derivative of the measurement n - 2 (edge formula for the first measurement).
+        if n >= 2:
+            self._first.extend(f[1] - f[0] if n == 2 else (f[n - 1] - f[n - 3]) / 2.0)
+        # fr : Dérivée seconde, courbure et angle de la mesure n - 3.
+        # en : Second derivative, curvature and angle of the measurement n - 3.
+        if n >= 3:
+            d = self._first.points
+            self._second.extend(d[1] - d[0] if n == 3 else (d[n - 2] - d[n - 4]) / 2.0)
+            curvature = self._curvature(d[n - 3:n - 2], self._second.points[n - 3:n - 2])[0]
+            self._steering.append(curvature, self._angles(np.array([curvature]))[0])
+        return range(0)
+
+
+    def _resize(self, count):
+        while len(self._samples) < count:
+            self._add_sample(self._previous)
+        if len(self._samples) > count:
+            self._samples.truncate(count)
+            self._first.truncate(count - 1)
+            self._second.truncate(count - 2)
+            self._steering.truncate(count - 2)
+            self._next = count
+
+
+    @staticmethod
+    def _curvature(first, second):
+        x_t, y_t = first[:, 0], first[:, 1]
+        xx_t, yy_t = second[:, 0], second[:, 1]
+        speed = np.sqrt(x_t * x_t + y_t * y_t)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (xx_t * y_t - x_t * yy_t) / speed ** 3
+
+
+    # fr : Pendant le tracé, la politique "reject" ne lève pas d'erreur : les valeurs hors limites sont NaN jusqu'à
+    # la validation.
+    # en : While drawing, the "reject" policy does not raise : out of range values are NaN until validation.
+    def _angles(self, curvature):
+        policy = "nan" if self.policy == "reject" else self.policy
+        return trajectory_compiler.curv_to_angle(curvature, self.entraxe, policy)
+
+
+    # fr : Fin du tracé : calcul des valeurs de bord puis renvoi de la position et de l'angle de départ (repère de la
+    # simulation), des vitesses et des angles de braquage, comme compile_trajectory. Le tracé n'est pas oublié.
+    # en : End of the drawing : computation of the edge values then return of the starting position and angle
+    # (simulation frame), of the speeds and of the steering angles, like compile_trajectory. The drawing is not
+    # forgotten.
+    def flush(self):
+        # fr : Le nombre de mesures est celui de resample_arc_length, int(arc / spacing) + 1. Au fil de l'eau, une
+        # mesure est produite dès que k * spacing <= arc : selon les arrondis, il peut en manquer une (la fin du tracé,
+        # comme np.interp au-delà du dernier point) ou y en avoir une de trop. Ce cas rare est corrigé sur une copie,
+        # pour que le tracé puisse encore être prolongé.
+        # en : The number of measurements is the one of resample_arc_length, int(arc / spacing) + 1. On the fly, a
+        # measurement is produced as soon as k * spacing <= arc : depending on the roundings, one may be missing (the
+        # end of the drawing, like np.interp beyond the last point) or one may be extra. This rare case is fixed on a
+        # copy, so that the drawing can still be extended.
+        count = int(self._arc / self.spacing) + 1 if self._previous is not None else 0
+        if len(self._samples) != count:
+            estimator = copy.deepcopy(self)
+            estimator._resize(count)
+            return estimator.flush()
+
+        f = self._samples.points
+        n = len(f)
+        if n < 3:
+            raise ValueError("at least 3 measured points are needed to compile a trajectory, got %d" % n)
+
+        first = np.concatenate((self._first.points, [f[n - 1] - f[n - 2]]))
+        second = np.concatenate((self._second.points,
+                                 [(first[n - 1] - first[n - 3]) / 2.0, first[n - 1] - first[n - 2]]))
+        speed = np.sqrt(first[:, 0] * first[:, 0] + first[:, 1] * first[:, 1])
+        tail = self._curvature(first[n - 2:], second[n - 2:])
+        curvature = np.concatenate((self._steering.x, tail))
+        if self.policy == "reject":
+            angle_array = trajectory_compiler.curv_to_angle(curvature, self.entraxe, "reject")
+        else:
+            angle_array = np.concatenate((self._steering.y, self._angles(tail)))
+
+        start_x, start_y = self._start
+        start_angle = trajectory_compiler.calcul_start_angle(start_x, start_y, f[:, 0], f[:, 1])
+        return (start_x, SIMULATION_HEIGHT - start_y, start_angle), speed, angle_array
@@ -0,0 +1,180 @@
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# Stroke journal : append-only log of the drawing operations of the Canvas, for undo and redo.
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+import numpy as np
+
+from stroke_buffer import StrokeBuffer
+
+
+# fr : Types d'opérations : ajout de points au tracé en cours (un geste, de l'appui au relâchement du bouton),
+# effacement du tracé en cours, et remplacement des points d'une trajectoire enregistrée (édition, gomme).
+# en : Kinds of operations : addition of points to the drawing in progress (one gesture, from the press to the release
+# of the button), clearing of the drawing in progress, and replacement of the points of a saved trajectory (edition,
+# eraser).
+DRAW, CLEAR, EDIT = 0, 1, 2
+
+# fr : Un instantané de l'état du tracé est gardé dès que snapshot_points points ont été ajoutés depuis le précédent.
+# en : A snapshot of the state of the drawing is kept as soon as snapshot_points points have been added since the
+# previous one.
+SNAPSHOT_POINTS = 1024
+
+
+# fr : La classe StrokeJournal enregistre les opérations sous forme de tableaux compacts : une ligne (type, clé,
+# début, milieu, fin, liée) par opération, et un seul tableau de points (x, y, instant) dans lequel chaque
+# opération désigne ses points par des indices. Le tracé en cours n'est jamais copié : il se reconstruit à partir des
+# opérations DRAW depuis le dernier CLEAR. Pour éviter de tout recalculer, l'appelant peut attacher à une opération un
+# instantané de ses propres calculs (par exemple l'estimateur), repris ensuite par latest_snapshot.
+# Annuler ou rétablir ne fait que déplacer la tête du journal ; une opération liée à la précédente est annulée et
+# rétablie avec elle. Une nouvelle opération après une annulation supprime les opérations annulées.
+# en : The StrokeJournal class records the operations as compact arrays : one row (kind, key, start, middle, end,
+# joined) per operation, and a single array of points (x, y, timestamp) in which each operation refers to its points by
+# indices. The drawing in progress is never copied : it is rebuilt from the DRAW operations since the last CLEAR. To
+# avoid computing everything again, the caller can attach to an operation a snapshot of its own computations (for
+# example the estimator), then found again by latest_snapshot.
+# Undoing or redoing only moves the head of the journal ; an operation joined to the previous one is undone and
+# redone with it. A new operation after an undo drops the undone operations.
+class StrokeJournal:
+
+    def __init__(self, capacity=256, snapshot_points=SNAPSHOT_POINTS):
+        self._entries = np.empty((max(int(capacity), 1), 6), dtype=np.int64)
+        self._points = StrokeBuffer(capacity=4096, dtype=np.float64, timestamps=True)
+        self._snapshots = {}
+        self.snapshot_points = snapshot_points
+        # fr : Nombre d'opérations enregistrées, et nombre d'opérations actives (les suivantes sont annulées).
+        # en : Number of recorded operations, and number of active operations (the next ones are undone).
+        self._size = 0
+        self.head = 0
+
+
+    def __len__(self):
+        return self._size
+
+
+    def can_undo(self):
+        return self.head > 0
+
+
+    def can_redo(self):
+        return self.head < self._size
+
+
+    def _append(self, kind, key, blocks, joined=False):
+        # fr : Les opérations annulées sont oubliées, ainsi que leurs points et leurs instantanés.
+        # en : The undone operations are forgotten, as well as their points and their snapshots.
+        if self.head < self._size:
+            self._size = self.head
+            end = int(self._entries[self._size - 1, 4]) if self._size else 0
+            self._points.truncate(end)
+            self._snapshots = {k: v for k, v in self._snapshots.items() if k < self._size}
+        if self._size == len(self._entries):
+            entries = np.empty((2 * len(self._entries), 6), dtype=np.int64)
+            entries[:self._size] = self._entries[:self._size]
+            self._entries = entries
+        bounds = [len(self._points)]
+        for points, timestamps in blocks:
+            self._points.extend(points, timestamps)
+            bounds.append(len(self._points))
+        start, middle, end = bounds[0], bounds[1] if len(bounds) > 2 else bounds[-1], bounds[-1]
+        self._entries[self._size] = (kind, key, start, middle, end, joined and self._size > 0)
+        self._size += 1
+        self.head = self._size
+        return self._size - 1
+
+
+    # fr : Points (n, 2) ajoutés au tracé en cours par un geste, avec leurs instants. left indique si le geste est
+    # sorti du couloir (le tracé n'est alors plus valide) : c'est la clé des opérations DRAW.
+    # en : Points (n, 2) added to the drawing in progress by one gesture, with their timestamps. left tells whether the
+    # gesture left the corridor (the drawing is then no longer valid) : it is the key of the DRAW operations.
+    def record_draw(self, points, timestamps=None, left=False):
+        return self._append(DRAW, int(bool(left)), [(points, timestamps)])
+
+
+    def record_clear(self):
+        return self._append(CLEAR, -1, [])
+
+
+    # fr : Remplacement des points old par les points new pour la trajectoire trajectory_id : old est vide si la
+    # trajectoire est créée, new si elle est supprimée. joined lie l'opération à la précédente.
+    # en : Replacement of the points old by the points new for the trajectory trajectory_id : old is empty if the
+    # trajectory is created, new if it is deleted. joined joins the operation to the previous one.
+    def record_edit(self, trajectory_id, old, new, joined=False):
+        return self._append(EDIT, trajectory_id, [(old, None), (new, None)], joined)
+
+
+    # fr : Opération index : (type, clé, points avant, points après). Pour DRAW, les points avant sont vides.
+    # en : Operation index : (kind, key, points before, points after). For DRAW, the points before are empty.
+    def entry(self, index):
+        kind, key, start, middle, end, _ = self._entries[index].tolist()
+        points = self._points.points
+        if kind == DRAW:
+            return kind, key, points[start:start], points[start:end]
+        return kind, key, points[start:middle], points[middle:end]
+
+
+    # fr : Annule la dernière opération active (et celles qui lui sont liées) et renvoie les indices des opérations
+    # annulées, dans l'ordre où les défaire.
+    # en : Undoes the last active operation (and the ones joined to it) and returns the indices of the undone
+    # operations, in the order in which to revert them.
+    def undo(self):
+        indices = []
+        while self.can_undo():
+            self.head -= 1
+            indices.append(self.head)
+            if not self._entries[self.head, 5]:
+                break
+        return indices
+
+
+    def redo(self):
+        indices = []
+        while self.can_redo():
+            indices.append(self.head)
+            self.head += 1
+            if self.head == self._size or not self._entries[self.head, 5]:
+                break
+        return indices
+
+
+    # fr : Indices des opérations DRAW actives du tracé en cours (depuis le dernier CLEAR actif).
+    # en : Indices of the active DRAW operations of the drawing in progress (since the last active CLEAR).
+    def _stroke_entries(self):
+        kinds = self._entries[:self.head, 0]
+        clears = np.flatnonzero(kinds == CLEAR)
+        first = int(clears[-1]) + 1 if len(clears) else 0
+        return first + np.flatnonzero(kinds[first:] == DRAW)
+
+
+    # fr : Points (n, 2) et instants du tracé en cours, reconstruits à partir des opérations actives, et vrai si aucun
+    # de ses gestes n'est sorti du couloir.
+    # en : Points (n, 2) and timestamps of the drawing in progress, rebuilt from the active operations, and true if
+    # none of its gestures left the corridor.
+    def stroke(self):
+        entries = self._entries[self._stroke_entries()]
+        if len(entries) == 0:
+            return np.empty((0, 2)), np.empty(0), True
+        ranges = np.concatenate([np.arange(start, end) for start, end in entries[:, [2, 4]].tolist()])
+        return self._points.points[ranges], self._points.timestamps[ranges], not entries[:, 1].any()
+
+
+    # fr : Attache à l'opération index un instantané de l'état après cette opération, pour stroke_length points.
+    # en : Attaches to the operation index a snapshot of the state after this operation, for stroke_length points.
+    def snapshot(self, index, stroke_length, state):
+        self._snapshots[index] = (stroke_length, state)
+
+
+    # fr : Vrai si un nouvel instantané vaut la peine d'être pris pour un tracé de stroke_length points.
+    # en : True if a new snapshot is worth taking for a drawing of stroke_length points.
+    def wants_snapshot(self, stroke_length):
+        latest = self.latest_snapshot()
+        return stroke_length - (latest[0] if latest else 0) >= self.snapshot_points
+
+
+    # fr : Dernier instantané (nombre de points, état) valable pour le tracé en cours, ou None.
+    # en : Last snapshot (number of points, state) valid for the drawing in progress, or None.
+    def latest_snapshot(self):
+        for index in self._stroke_entries()[::-1].tolist():
+            if index in self._snapshots:
+                return self._snapshots[index]
+        return None
@@ -0,0 +1,36 @@
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# Tests of spatial_index.py : the grid queries must give the same keys as a brute force search.
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+import numpy as np
+
+from spatial_index import GridIndex
+
+
+def test_query_matches_brute_force():
+    rng = np.random.default_rng(0)
+    points = rng.uniform(-200, 1200, (2000, 2))
+    index = GridIndex(cell=16.0)
+    index.insert_many(range(len(points)), points)
+    for x, y, radius in zip(rng.uniform(-200, 1200, 50), rng.uniform(-200, 1200, 50), rng.uniform(0, 60, 50)):
+        distances = np.hypot(points[:, 0] - x, points[:, 1] - y)
+        keys = index.query(x, y, radius)
+        assert sorted(keys) == np.flatnonzero(distances <= radius).tolist()
+        assert np.all(np.diff(distances[keys]) >= 0)
+        nearest = index.nearest(x, y, radius)
+        assert nearest == (keys[0] if keys else None)
+
+
+def test_move_and_remove():
+    index = GridIndex(cell=10.0)
+    index.insert("a", 1.0, 1.0)
+    index.insert("b", 50.0, 50.0)
+    index.move("a", 3.0, 2.0)
+    assert index.position("a") == (3.0, 2.0)
+    index.move("a", 48.0, 49.0)
+    assert index.query(50.0, 50.0, 5.0) == ["b", "a"]
+    assert index.query(1.0, 1.0, 5.0) == []
+    index.remove("b")
+    assert "b" not in index and len(index) == 1
+    assert index.nearest(50.0, 50.0, 5.0) == "a"
@@ -0,0 +1,61 @@
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# Tests of stroke_estimator.py : the streaming computation must give the same commands as the batch compiler.
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+import numpy as np
+import pytest
+
+import trajectory_compiler
+from stroke_estimator import StreamingEstimator
+
+
+def _stream(points):
+    estimator = StreamingEstimator()
+    for x, y in points:
+        estimator.add_point(x, y)
+    return estimator
+
+
+def _assert_same(points):
+    start, speed, angle_array = _stream(points).flush()
+    batch_start, batch_speed, batch_angles = trajectory_compiler.compile_points(points)
+    assert start == batch_start
+    assert len(speed) == len(batch_speed)
+    np.testing.assert_array_equal(speed, batch_speed)
+    np.testing.assert_array_equal(angle_array, batch_angles)
+
+
+# fr : Tracés droits dont la longueur est un multiple exact de l'espacement (20 pixels = 0.2 m) : c'est là que les
+# arrondis de k * spacing et de arc / spacing peuvent donner une mesure de plus ou de moins.
+# en : Straight drawings whose length is an exact multiple of the spacing (20 pixels = 0.2 m) : this is where the
+# roundings of k * spacing and of arc / spacing may give one measurement more or less.
+@pytest.mark.parametrize("length", range(60, 1520, 20))
+@pytest.mark.parametrize("step", [1, 4, 7])
+def test_flush_matches_batch_on_spacing_multiples(length, step):
+    xs = np.append(np.arange(0, length, step), length)
+    _assert_same(np.column_stack((xs + 100, np.full(len(xs), 200))))
+
+
+def test_flush_matches_batch_on_random_strokes():
+    rng = np.random.default_rng(1)
+    for _ in range(200):
+        points = np.cumsum(rng.integers(-3, 6, (rng.integers(50, 400), 2)), axis=0) + 200
+        _assert_same(points)
+
+
+# fr : La correction du nombre de mesures se fait sur une copie : le tracé peut être prolongé après flush.
+# en : The fix of the number of measurements is done on a copy : the drawing can be extended after flush.
+def test_flush_keeps_the_drawing():
+    xs = np.arange(100, 441, 4)
+    points = np.column_stack((xs, np.full(len(xs), 200)))
+    estimator = _stream(points[:60])
+    estimator.flush()
+    for x, y in points[60:]:
+        estimator.add_point(x, y)
+    np.testing.assert_array_equal(estimator.flush()[1], trajectory_compiler.compile_points(points)[1])
+
+
+def test_flush_needs_three_measurements():
+    with pytest.raises(ValueError):
+        _stream([(100, 200), (110, 200)]).flush()
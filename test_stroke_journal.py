@@ -0,0 +1,74 @@
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# Tests of stroke_journal.py : rebuilding of the drawing in progress, undo and redo of grouped operations.
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+import numpy as np
+
+from stroke_journal import CLEAR, DRAW, EDIT, StrokeJournal
+
+
+def _gesture(start, n=5):
+    return np.column_stack((np.arange(start, start + n), np.full(n, 10.0)))
+
+
+def test_stroke_is_rebuilt_from_the_gestures():
+    journal = StrokeJournal(capacity=1)
+    journal.record_draw(_gesture(0))
+    journal.record_draw(_gesture(5), left=True)
+    points, _, valid = journal.stroke()
+    np.testing.assert_array_equal(points, np.concatenate((_gesture(0), _gesture(5))))
+    assert not valid
+    journal.record_clear()
+    assert len(journal.stroke()[0]) == 0
+
+
+def test_undo_redo_one_gesture():
+    journal = StrokeJournal()
+    journal.record_draw(_gesture(0))
+    journal.record_draw(_gesture(5))
+    assert journal.undo() == [1]
+    np.testing.assert_array_equal(journal.stroke()[0], _gesture(0))
+    assert journal.redo() == [1]
+    assert len(journal.stroke()[0]) == 10
+
+
+# fr : Une opération liée à la précédente (par exemple la création de la trajectoire d'une validation, liée à
+# l'effacement du tracé) est annulée et rétablie avec elle.
+# en : An operation joined to the previous one (for example the creation of the trajectory of a validation, joined to
+# the clearing of the drawing) is undone and redone with it.
+def test_joined_operations_are_grouped():
+    journal = StrokeJournal()
+    journal.record_draw(_gesture(0))
+    journal.record_clear()
+    journal.record_edit(7, np.empty((0, 2)), _gesture(0), joined=True)
+    assert journal.undo() == [2, 1]
+    np.testing.assert_array_equal(journal.stroke()[0], _gesture(0))
+    assert journal.redo() == [1, 2]
+    kind, key, before, after = journal.entry(2)
+    assert (kind, key, len(before)) == (EDIT, 7, 0)
+    np.testing.assert_array_equal(after, _gesture(0))
+    assert [journal.entry(i)[0] for i in range(3)] == [DRAW, CLEAR, EDIT]
+
+
+def test_new_operation_drops_the_undone_ones():
+    journal = StrokeJournal()
+    journal.record_draw(_gesture(0))
+    journal.record_draw(_gesture(5))
+    journal.undo()
+    journal.record_draw(_gesture(20))
+    assert not journal.can_redo()
+    assert len(journal) == 2
+    np.testing.assert_array_equal(journal.stroke()[0], np.concatenate((_gesture(0), _gesture(20))))
+
+
+def test_latest_snapshot_follows_the_head():
+    journal = StrokeJournal(snapshot_points=5)
+    first = journal.record_draw(_gesture(0))
+    assert journal.wants_snapshot(5)
+    journal.snapshot(first, 5, "state")
+    journal.record_draw(_gesture(5))
+    assert journal.latest_snapshot() == (5, "state")
+    journal.undo()
+    journal.undo()
+    assert journal.latest_snapshot() is None
@@ -0,0 +1,87 @@
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# Tests of trajectory_repository.py : round trip of the trajectories and stability of their identifiers.
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+import numpy as np
+import pytest
+
+from trajectory_repository import TrajectoryRepository
+
+
+@pytest.fixture
+def repository(tmp_path):
+    with TrajectoryRepository(str(tmp_path / "trajectoires.db")) as repository:
+        yield repository
+
+
+def _record(seed, circuit="circuitMIA.png"):
+    rng = np.random.default_rng(seed)
+    points = rng.integers(0, 1000, (20, 2))
+    return points, (1.0, 2.0, 0.5), rng.random(10), rng.random(10) - 0.5, circuit, {"entraxe": 0.3355}
+
+
+def test_add_get_round_trip(repository):
+    points, start, speed, angle_array, circuit, params = _record(0)
+    trajectory_id = repository.add(points, start, speed, angle_array, circuit, params, created=12.5)
+    trajectory = repository.get(trajectory_id)
+    assert trajectory.id == trajectory_id
+    assert trajectory.circuit == circuit
+    assert trajectory.created == 12.5
+    assert trajectory.params == params
+    assert trajectory.start == start
+    np.testing.assert_array_equal(trajectory.points, points)
+    np.testing.assert_array_equal(repository.points(trajectory_id), points)
+    np.testing.assert_array_equal(trajectory.commands, np.column_stack((speed, angle_array)))
+
+
+def test_delete_and_contains(repository):
+    ids = [repository.add(*_record(seed)) for seed in range(3)]
+    repository.delete(ids[1:2])
+    assert ids[1] not in repository
+    assert ids[0] in repository and ids[2] in repository
+    assert repository.ids() == [ids[0], ids[2]]
+    with pytest.raises(KeyError):
+        repository.get(ids[1])
+
+
+# fr : Les identifiants ne sont jamais réutilisés : après la suppression de la dernière trajectoire, la plus récente
+# qui reste est la dernière de ids (c'est elle que le Canvas reprend) et l'ajout suivant reçoit un nouvel identifiant.
+# en : The identifiers are never reused : after the deletion of the last trajectory, the most recent one left is the
+# last one of ids (the one the Canvas falls back to) and the next addition gets a new identifier.
+def test_ids_are_stable(repository):
+    ids = [repository.add(*_record(seed)) for seed in range(3)]
+    repository.delete([ids[-1]])
+    assert repository.ids("circuitMIA.png")[-1] == ids[1]
+    new_id = repository.add(*_record(3))
+    assert new_id > ids[-1]
+    assert repository.ids() == [ids[0], ids[1], new_id]
+
+
+def test_insert_restores_a_deleted_identifier(repository):
+    trajectory_id = repository.add(*_record(0))
+    repository.add(*_record(1))
+    repository.delete([trajectory_id])
+    points, start, speed, angle_array, circuit, params = _record(0)
+    assert repository.insert(trajectory_id, points, start, speed, angle_array, circuit, params) == trajectory_id
+    np.testing.assert_array_equal(repository.points(trajectory_id), points)
+    assert repository.ids() == sorted(repository.ids())
+
+
+def test_update_keeps_identity(repository):
+    trajectory_id = repository.add(*_record(0), created=1.0)
+    points, start, speed, angle_array, _, _ = _record(1)
+    repository.update(trajectory_id, points, start, speed, angle_array, {"sample_spacing": 0.2})
+    trajectory = repository.get(trajectory_id)
+    assert trajectory.created == 1.0
+    assert trajectory.params == {"entraxe": 0.3355, "sample_spacing": 0.2}
+    np.testing.assert_array_equal(trajectory.points, points)
+
+
+def test_circuits(repository):
+    repository.add(*_record(0, "b.png"))
+    repository.add(*_record(1, "a.png"))
+    repository.add(*_record(2, "b.png"))
+    assert repository.circuits() == ["b.png", "a.png"]
+    assert repository.count("b.png") == 2
+    assert len(repository.ids("a.png")) == 1
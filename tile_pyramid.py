@@ -0,0 +1,327 @@
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# Tile pyramid : tiled, multi-resolution and memory-mapped storage of a circuit image and of its distance field.
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# fr : Une pyramide est un dossier du cache (voir corridor.py) contenant :
+#   - meta.json : largeur, hauteur, taille des tuiles et nombre de niveaux
+#   - image-K.npy : le niveau K de l'image (RGBA, uint8), réduit 2^K fois, rangé tuile par tuile (ny, nx, T, T, 4)
+#   - field.npy : le champ de distance en pleine résolution (float32), rangé tuile par tuile (ny, nx, T, T), borné à
+#     +/- FIELD_MARGIN pixels
+# Chaque tuile est contiguë dans le fichier : lire une tuile ne charge que ses pages, la mémoire utilisée suit donc la
+# zone affichée et non la taille de la carte.
+# en : A pyramid is a folder of the cache (see corridor.py) holding :
+#   - meta.json : width, height, tile size and number of levels
+#   - image-K.npy : the level K of the image (RGBA, uint8), reduced 2^K times, stored tile by tile (ny, nx, T, T, 4)
+#   - field.npy : the distance field at full resolution (float32), stored tile by tile (ny, nx, T, T), bounded to
+#     +/- FIELD_MARGIN pixels
+# Each tile is contiguous in the file : reading a tile only loads its pages, the memory used hence follows the shown
+# area and not the size of the map.
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# fr : Utilisation : python tile_pyramid.py carte.png [--tile 256]
+# en : Usage : python tile_pyramid.py map.png [--tile 256]
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+import argparse
+import json
+import math
+import os
+import shutil
+import sys
+import numpy as np
+
+from corridor import CACHE_DIR, cache_key
+
+
+TILE = 256
+# fr : Le champ de distance est exact jusqu'à FIELD_MARGIN pixels du bord, puis borné à +/- FIELD_MARGIN : bien au-delà
+# des marges du couloir, et cela permet de le calculer tuile par tuile (voir _store_field).
+# en : The distance field is exact up to FIELD_MARGIN pixels from the border, then bounded to +/- FIELD_MARGIN : well
+# beyond the clearances of the corridor, and this allows computing it tile by tile (see _store_field).
+FIELD_MARGIN = 256
+
+
+# fr : La classe TiledArray présente un tableau rangé tuile par tuile (ny, nx, T, T, ...) comme un tableau (H, W, ...)
+# indexé par des coordonnées entières ou des tableaux de coordonnées : array[ys, xs]. C'est l'indexation utilisée par
+# corridor.py, qui fonctionne donc telle quelle sur un masque en tuiles. np.asarray(array) reconstruit le tableau
+# complet.
+# en : The TiledArray class presents an array stored tile by tile (ny, nx, T, T, ...) as an (H, W, ...) array indexed
+# by integer coordinates or arrays of coordinates : array[ys, xs]. This is the indexing used by corridor.py, which
+# hence works as is on a tiled mask. np.asarray(array) rebuilds the whole array.
+class TiledArray:
+
+    def __init__(self, tiles, height, width):
+        self.tiles = tiles
+        self.tile = tiles.shape[2]
+        self.shape = (height, width) + tiles.shape[4:]
+        self.dtype = tiles.dtype
+
+
+    def __getitem__(self, key):
+        ys, xs = key
+        if isinstance(ys, slice) or isinstance(xs, slice):
+            raise TypeError("TiledArray only supports array[ys, xs] indexing, use region() for slices")
+        tile = self.tile
+        return self.tiles[ys // tile, xs // tile, ys % tile, xs % tile]
+
+
+    # fr : Copie dense du rectangle [x0, x1[ x [y0, y1[ (limité à l'image), en ne lisant que les tuiles concernées.
+    # en : Dense copy of the rectangle [x0, x1[ x [y0, y1[ (limited to the image), only reading the tiles involved.
+    def region(self, x0, y0, x1, y1):
+        x0, y0 = max(int(x0), 0), max(int(y0), 0)
+        x1, y1 = min(int(x1), self.shape[1]), min(int(y1), self.shape[0])
+        out = np.empty((max(y1 - y0, 0), max(x1 - x0, 0)) + self.shape[2:], dtype=self.dtype)
+        t = self.tile
+        for ty in range(y0 // t, (y1 - 1) // t + 1 if y1 > y0 else 0):
+            for tx in range(x0 // t, (x1 - 1) // t + 1 if x1 > x0 else 0):
+                top, left = max(y0, ty * t), max(x0, tx * t)
+                bottom, right = min(y1, (ty + 1) * t), min(x1, (tx + 1) * t)
+                out[top - y0:bottom - y0, left - x0:right - x0] = \
+                    self.tiles[ty, tx, top - ty * t:bottom - ty * t, left - tx * t:right - tx * t]
+        return out
+
+
+    def __array__(self, dtype=None, copy=None):
+        out = self.region(0, 0, self.shape[1], self.shape[0])
+        return out if dtype is None else out.astype(dtype)
+
+
+    # fr : Masque du couloir (1 si la valeur dépasse clearance), calculé à la lecture : rien n'est alloué d'avance.
+    # en : Corridor mask (1 if the value exceeds clearance), computed on read : nothing is allocated beforehand.
+    def threshold(self, clearance):
+        return ThresholdedArray(self, clearance)
+
+
+# fr : Vue paresseuse (array > clearance) d'un TiledArray, en uint8, avec la même indexation.
+# en : Lazy (array > clearance) view of a TiledArray, as uint8, with the same indexing.
+class ThresholdedArray:
+
+    def __init__(self, array, clearance):
+        self.array = array
+        self.clearance = clearance
+        self.shape = array.shape
+        self.dtype = np.dtype(np.uint8)
+
+
+    def __getitem__(self, key):
+        return (self.array[key] > self.clearance).astype(np.uint8)
+
+
+    def region(self, x0, y0, x1, y1):
+        return (self.array.region(x0, y0, x1, y1) > self.clearance).astype(np.uint8)
+
+
+    def __array__(self, dtype=None, copy=None):
+        out = self.region(0, 0, self.shape[1], self.shape[0])
+        return out if dtype is None else out.astype(dtype)
+
+
+# fr : La classe TilePyramid ouvre une pyramide en mémoire partagée (memory-map) : aucune tuile n'est lue avant d'être
+# demandée.
+# en : The TilePyramid class opens a pyramid memory-mapped : no tile is read before it is requested.
+class TilePyramid:
+
+    def __init__(self, folder):
+        with open(os.path.join(folder, "meta.json")) as f:
+            meta = json.load(f)
+        self.folder = folder
+        self.width = meta["width"]
+        self.height = meta["height"]
+        self.tile = meta["tile"]
+        self.levels = meta["levels"]
+        self.images = [TiledArray(np.load(os.path.join(folder, "image-%d.npy" % level), mmap_mode="r"),
+                                  *self.level_shape(level)) for level in range(self.levels)]
+        self.field = TiledArray(np.load(os.path.join(folder, "field.npy"), mmap_mode="r"), self.height, self.width)
+
+
+    # fr : Hauteur et largeur du niveau level, en pixels.
+    # en : Height and width of the level level, in pixels.
+    def level_shape(self, level):
+        return _level_shape(self.height, self.width, level)
+
+
+    # fr : Niveau à afficher pour une échelle donnée (pixels de l'écran par pixel de l'image) : le plus réduit dont la
+    # résolution reste au moins celle de l'écran.
+    # en : Level to show for a given scale (screen pixels per image pixel) : the most reduced one whose resolution is
+    # still at least the one of the screen.
+    def level_for_scale(self, scale):
+        if scale <= 0:
+            return self.levels - 1
+        return min(max(int(math.floor(math.log2(1.0 / scale))), 0), self.levels - 1)
+
+
+    # fr : Tuiles (tx, ty) du niveau level qui recouvrent le rectangle [x0, x1[ x [y0, y1[ donné en pixels du niveau 0.
+    # en : Tiles (tx, ty) of the level level which cover the rectangle [x0, x1[ x [y0, y1[ given in pixels of level 0.
+    def tiles_in(self, level, x0, y0, x1, y1):
+        height, width = self.level_shape(level)
+        size = self.tile << level
+        tx0, ty0 = max(int(x0) // size, 0), max(int(y0) // size, 0)
+        tx1 = min(int(math.ceil(x1 / size)), -(-width // self.tile))
+        ty1 = min(int(math.ceil(y1 / size)), -(-height // self.tile))
+        return [(tx, ty) for ty in range(ty0, ty1) for tx in range(tx0, tx1)]
+
+
+    # fr : Tuile (T, T, 4) du niveau level, lue dans le fichier à la demande.
+    # en : (T, T, 4) tile of the level level, read from the file on demand.
+    def image_tile(self, level, tx, ty):
+        return self.images[level].tiles[ty, tx]
+
+
+def _level_shape(height, width, level):
+    return -(-height // (1 << level)), -(-width // (1 << level))
+
+
+# fr : Range un tableau (H, W, ...) tuile par tuile dans out, bande de tuiles par bande de tuiles pour limiter la
+# mémoire utilisée. Les bords sont complétés par fill.
+# en : Stores an (H, W, ...) array tile by tile in out, one row of tiles at a time to limit the memory used. The
+# borders are padded with fill.
+def _store_tiles(out, source, fill):
+    ny, nx, tile = out.shape[:3]
+    rest = out.shape[4:]
+    for ty in range(ny):
+        strip = np.asarray(source[ty * tile:(ty + 1) * tile])
+        padded = np.full((tile, nx * tile) + rest, fill, dtype=out.dtype)
+        padded[:strip.shape[0], :strip.shape[1]] = strip
+        out[ty] = padded.reshape((tile, nx, tile) + rest).swapaxes(0, 1)
+
+
+# fr : Niveau suivant de l'image : moyenne de chaque bloc de 2 x 2 pixels, tuile par tuile.
+# en : Next level of the image : average of each block of 2 x 2 pixels, tile by tile.
+def _reduce_level(out, tiles):
+    ny, nx, tile = tiles.shape[:3]
+    for ty in range(out.shape[0]):
+        for tx in range(out.shape[1]):
+            block = np.zeros((2 * tile, 2 * tile, 4), dtype=np.float32)
+            for dy in range(2):
+                for dx in range(2):
+                    if 2 * ty + dy < ny and 2 * tx + dx < nx:
+                        block[dy * tile:(dy + 1) * tile, dx * tile:(dx + 1) * tile] = tiles[2 * ty + dy, 2 * tx + dx]
+            out[ty, tx] = np.rint(block.reshape(tile, 2, tile, 2, 4).mean(axis=(1, 3))).astype(np.uint8)
+
+
+# fr : Champ de distance signé (voir corridor.compute_distance_field), calculé tuile par tuile à partir des tuiles de
+# l'image en pleine résolution image. Pour chaque tuile, la distance est calculée sur la tuile élargie de margin pixels
+# puis bornée à margin : le bord le plus proche d'un pixel, s'il est à moins de margin pixels, est dans la fenêtre, donc
+# le résultat est exact. Seule une fenêtre est en mémoire à la fois.
+# en : Signed distance field (see corridor.compute_distance_field), computed tile by tile from the tiles of the full
+# resolution image image. For each tile, the distance is computed on the tile widened by margin pixels then bounded to
+# margin : the closest border of a pixel, if it is less than margin pixels away, is in the window, so the result is
+# exact. Only one window is in memory at a time.
+def _store_field(out, image, threshold=0.5, margin=FIELD_MARGIN):
+    from scipy import ndimage
+    from skimage import color
+
+    height, width = image.shape[:2]
+    tile = out.shape[2]
+    for ty in range(out.shape[0]):
+        for tx in range(out.shape[1]):
+            x0, y0 = tx * tile, ty * tile
+            x1, y1 = min(x0 + tile, width), min(y0 + tile, height)
+            wx0, wy0 = max(x0 - margin, 0), max(y0 - margin, 0)
+            # fr : Même conversion en niveaux de gris que io.imread(..., as_gray=True).
+            # en : Same grey level conversion as io.imread(..., as_gray=True).
+            window = image.region(wx0, wy0, x1 + margin, y1 + margin)
+            track = color.rgb2gray(color.rgba2rgb(window)) >= threshold
+            inside = ndimage.distance_transform_edt(track) if not track.all() else np.full(track.shape, margin)
+            outside = ndimage.distance_transform_edt(~track) if track.any() else np.full(track.shape, margin)
+            field = np.where(track, np.minimum(inside, margin), -np.minimum(outside, margin))
+            block = np.full((tile, tile), -np.inf, dtype=np.float32)
+            block[:y1 - y0, :x1 - x0] = field[y0 - wy0:y1 - wy0, x0 - wx0:x1 - wx0]
+            out[ty, tx] = block
+
+
+def _read_rgba(image_path):
+    from skimage import io
+
+    image = io.imread(image_path)
+    if image.ndim == 2:
+        image = np.stack((image,) * 3, axis=-1)
+    if image.dtype != np.uint8:
+        image = (image / (np.iinfo(image.dtype).max if image.dtype.kind in "ui" else 1.0) * 255).astype(np.uint8)
+    if image.shape[2] == 3:
+        image = np.concatenate((image, np.full(image.shape[:2] + (1,), 255, dtype=np.uint8)), axis=-1)
+    return image
+
+
+# fr : Construction de la pyramide de l'image image_path dans le dossier folder. Le champ de distance est calculé tuile
+# par tuile à partir du niveau 0 (voir _store_field), sans copie complète en mémoire ni dans le cache.
+# en : Building of the pyramid of the image image_path in the folder folder. The distance field is computed tile by
+# tile from the level 0 (see _store_field), without a whole copy in memory nor in the cache.
+def build_pyramid(image_path, folder, tile=TILE, threshold=0.5):
+    image = _read_rgba(image_path)
+    height, width = image.shape[:2]
+    levels = 1
+    while max(_level_shape(height, width, levels - 1)) > tile:
+        levels += 1
+
+    tmp_folder = "%s.%d.tmp" % (folder, os.getpid())
+    os.makedirs(tmp_folder, exist_ok=True)
+    previous = None
+    for level in range(levels):
+        level_height, level_width = _level_shape(height, width, level)
+        shape = (-(-level_height // tile), -(-level_width // tile), tile, tile, 4)
+        tiles = np.lib.format.open_memmap(os.path.join(tmp_folder, "image-%d.npy" % level), mode="w+",
+                                          dtype=np.uint8, shape=shape)
+        if previous is None:
+            _store_tiles(tiles, image, 0)
+        else:
+            _reduce_level(tiles, previous)
+        tiles.flush()
+        previous = tiles
+    del image
+
+    image = TiledArray(np.load(os.path.join(tmp_folder, "image-0.npy"), mmap_mode="r"), height, width)
+    tiles = np.lib.format.open_memmap(os.path.join(tmp_folder, "field.npy"), mode="w+", dtype=np.float32,
+                                      shape=(-(-height // tile), -(-width // tile), tile, tile))
+    _store_field(tiles, image, threshold)
+    tiles.flush()
+    del image
+    del tiles, previous
+
+    with open(os.path.join(tmp_folder, "meta.json"), "w") as f:
+        json.dump({"width": width, "height": height, "tile": tile, "levels": levels}, f)
+    try:
+        os.replace(tmp_folder, folder)
+    except OSError:
+        # fr : Un autre processus a construit la même pyramide entre-temps.
+        # en : Another process has built the same pyramid in the meantime.
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+
+
+# fr : Renvoie la pyramide de l'image, construite dans le cache si elle n'existe pas encore.
+# en : Returns the pyramid of the image, built in the cache if it does not exist yet.
+def load_pyramid(image_path, tile=TILE, threshold=0.5, cache_dir=CACHE_DIR):
+    folder = _pyramid_folder(image_path, tile, threshold, cache_dir)
+    if not os.path.exists(os.path.join(folder, "meta.json")):
+        build_pyramid(image_path, folder, tile, threshold)
+    return TilePyramid(folder)
+
+
+# fr : Renvoie la pyramide de l'image si elle est déjà dans le cache, None sinon (rien n'est construit).
+# en : Returns the pyramid of the image if it is already in the cache, None otherwise (nothing is built).
+def cached_pyramid(image_path, tile=TILE, threshold=0.5, cache_dir=CACHE_DIR):
+    folder = _pyramid_folder(image_path, tile, threshold, cache_dir)
+    if not os.path.exists(os.path.join(folder, "meta.json")):
+        return None
+    return TilePyramid(folder)
+
+
+def _pyramid_folder(image_path, tile, threshold, cache_dir):
+    key = cache_key(image_path, tile=tile, threshold=threshold, field_margin=FIELD_MARGIN)
+    return os.path.join(cache_dir, "pyramid-%s" % key)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the tiled, multi-resolution pyramid of a circuit image.")
+    parser.add_argument("image", help="circuit image")
+    parser.add_argument("--tile", type=int, default=TILE, help="size of the tiles in pixels")
+    parser.add_argument("--threshold", type=float, default=0.5, help="gray level above which a pixel is track")
+    args = parser.parse_args(argv)
+
+    pyramid = load_pyramid(args.image, args.tile, args.threshold)
+    print("%s : %d x %d pixels, %d levels of %d px tiles in %s"
+          % (args.image, pyramid.width, pyramid.height, pyramid.levels, pyramid.tile, pyramid.folder))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,316 @@
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# Trajectory compiler : conversion of the pointsN.txt files into trajectoireN.txt command files, without Qt.
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# fr : Utilisation : python trajectory_compiler.py dossier_points/ -o dossier_trajectoires/
+# en : Usage : python trajectory_compiler.py points_folder/ -o trajectories_folder/
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+import argparse
+import math
+import os
+import sys
+import numpy as np
+
+
+# fr : entraxe correspondant à l'empattement de la voiture (distance entre les roues arrières et avants), en mètres.
+# en : center distance corresponding to the wheelbase of the car (distance between rear and front wheels), in metres.
+ENTRAXE = 0.3355
+# fr : Le rapport de distance écran-réel est d'environ 100 pixels/m.
+# en : The screen-to-real distance ratio is about 100 pixels/m.
+DISTANCE_RATIO = 100
+# fr : Ancien échantillonnage : une mesure tous les 30 points du tracé (option --point-interval).
+# en : Former sampling : a measurement every 30 points of the drawing (--point-interval option).
+POINT_INTERVAL = 30
+# fr : Distance (en mètres) entre deux mesures après rééchantillonnage par abscisse curviligne, soit une commande tous
+# les 20 cm.
+# en : Distance (in metres) between two measurements after arc-length resampling, i.e. one command every 20 cm.
+SAMPLE_SPACING = 0.2
+# fr : Hauteur du circuit dans le logiciel de simulation, utilisée pour retourner l'axe y.
+# en : Height of the circuit in the simulation software, used to flip the y axis.
+SIMULATION_HEIGHT = 4.67
+
+
+# fr : Politiques possibles lorsque |entraxe * c| >= 1 : "clip" sature l'angle de braquage à +/- atan(1),
+# "nan" conserve l'ancien comportement (NaN dans le fichier) et "reject" lève une ValueError.
+# en : Available policies when |entraxe * c| >= 1 : "clip" saturates the steering angle at +/- atan(1),
+# "nan" keeps the former behaviour (NaN in the file) and "reject" raises a ValueError.
+STEERING_POLICIES = ("clip", "nan", "reject")
+
+
+# fr : Fonction permettant de calculer la courbure c et la vitesse selon la position de tous les points mesurés. Les
+# tableaux peuvent contenir plusieurs trajectoires de même longueur (une par ligne), les dérivées sont prises sur le
+# dernier axe.
+# en : Function to calculate the curvature c and the speed according to the position of all the measured points. The
+# arrays may hold several trajectories of the same length (one per row), derivatives are taken along the last axis.
+def calcul_curvature(x_value, y_value):
+    # fr : Dérivées premières puis secondes des positions.
+    # en : First then second derivatives of the positions.
+    x_t = np.gradient(x_value, axis=-1)
+    y_t = np.gradient(y_value, axis=-1)
+    xx_t = np.gradient(x_t, axis=-1)
+    yy_t = np.gradient(y_t, axis=-1)
+
+    # fr : La vitesse est la norme de la dérivée première.
+    # en : The speed is the norm of the first derivative.
+    speed = np.sqrt(x_t * x_t + y_t * y_t)
+
+    # fr : Par rapport à la formule d'origine, le signe est inversé puisque l'axe y de l'écran pointe vers le bas. Une
+    # vitesse nulle (deux points confondus) donne une courbure NaN.
+    # en : Compared to the original formula, the sign is reversed since the y axis of the screen points down. A zero
+    # speed (two identical points) gives a NaN curvature.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        curvature_val = (xx_t * y_t - x_t * yy_t) / speed ** 3
+
+    return curvature_val, speed
+
+
+# fr : Calcul des angles de braquage nécessaires pour un tableau de courbures c (de forme quelconque) :
+# angle = arctan(L/R) avec R = 1/c. Le paramètre policy indique le traitement des valeurs |L*c| >= 1 (voir
+# STEERING_POLICIES). Avec "clip", une courbure NaN donne un braquage nul.
+# en : Computes the steering angles needed for an array of curvatures c (of any shape) : angle = arctan(L/R) with
+# R = 1/c. The policy parameter tells how values with |L*c| >= 1 are handled (see STEERING_POLICIES). With "clip", a NaN
+# curvature gives a zero steering.
+def curv_to_angle(c, entraxe=ENTRAXE, policy="clip"):
+    if policy not in STEERING_POLICIES:
+        raise ValueError("unknown steering policy %r, expected one of %s" % (policy, ", ".join(STEERING_POLICIES)))
+
+    ratio = entraxe * np.asarray(c, dtype=float)
+    out_of_range = ~(np.abs(ratio) < 1)
+
+    if policy == "clip":
+        ratio = np.clip(np.nan_to_num(ratio, nan=0.0), -1, 1)
+    elif policy == "nan":
+        ratio = np.where(out_of_range, np.nan, ratio)
+    elif out_of_range.any():
+        index = tuple(int(i) for i in np.unravel_index(np.argmax(out_of_range), out_of_range.shape))
+        raise ValueError("|entraxe * c| >= 1 at sample %s (c = %g)"
+                         % (index if len(index) > 1 else index[0], np.asarray(c, dtype=float)[index]))
+
+    return np.arctan(ratio)
+
+
+# fr : Cette fonction permet de calculer le coefficient directeur d'une droite défnie par deux points. yA et yB sont
+# inversés puisque le repère est tel que l'axe y pointe vers le bas. Fonctionne aussi sur des tableaux.
+# en : This function makes it possible to calculate the directing coefficient of a straight line defined by two
+# points. yA and yB are reversed since the mark is such that the y axis points down. Also works on arrays.
+def calculateCoefficent(xA, yA, xB, yB):
+    xA, yA, xB, yB = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (xA, yA, xB, yB)))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        coeff = np.where(xA != xB, (yA - yB) / (xB - xA), 0.0)
+    return coeff[()]
+
+
+# fr : Calcul de l'angle d'orientation de départ de la voiture à partir des trois premières droites traçables
+# (section III.2 du rapport).
+# en : Computes the starting orientation angle of the car from the first three traceable lines (section III.2 of the
+# report).
+def calcul_start_angle(start_x, start_y, xpos, ypos):
+    xpos = np.asarray(xpos, dtype=float)
+    ypos = np.asarray(ypos, dtype=float)
+    coeffd1 = calculateCoefficent(start_x, start_y, xpos[..., 1], ypos[..., 1])
+    coeffd2 = calculateCoefficent(start_x, start_y, xpos[..., 2], ypos[..., 2])
+    coeffd3 = calculateCoefficent(xpos[..., 1], ypos[..., 1], xpos[..., 2], ypos[..., 2])
+
+    # fr : Le coefficient moyen minimise l'incertitude.
+    # en : The average coefficient minimizes the uncertainty.
+    coeff_moyen = (coeffd1 + coeffd2 + coeffd3) / 3
+
+    return np.where(xpos[..., 1] - start_x > 0, np.arctan(coeff_moyen), math.pi + np.arctan(coeff_moyen))[()]
+
+
+# fr : Compile les positions mesurées (en mètres, repère de l'écran) en commandes pour la voiture. Renvoie la position
+# et l'angle de départ dans le repère de la simulation, puis les tableaux des vitesses et des angles de braquage.
+# xpos et ypos peuvent être de forme (n_trajectoires, n_points), start_x et start_y de forme (n_trajectoires,).
+# en : Compiles the measured positions (in metres, screen frame) into commands for the car. Returns the starting
+# position and angle in the simulation frame, then the arrays of speeds and steering angles. xpos and ypos may have
+# the shape (n_trajectories, n_points), start_x and start_y the shape (n_trajectories,).
+def compile_trajectory(start_x, start_y, xpos, ypos, entraxe=ENTRAXE, policy="clip"):
+    xpos = np.asarray(xpos, dtype=float)
+    ypos = np.asarray(ypos, dtype=float)
+    if xpos.shape[-1] < 3:
+        raise ValueError("at least 3 measured points are needed to compile a trajectory, got %d" % xpos.shape[-1])
+
+    curvature_array, speed = calcul_curvature(xpos, ypos)
+    angle_array = curv_to_angle(curvature_array, entraxe, policy)
+    start_angle = calcul_start_angle(start_x, start_y, xpos, ypos)
+
+    # fr : Changement de repère entre l'interface et le logiciel de simulation.
+    # en : Change of frame between the interface and the simulation software.
+    return (start_x, SIMULATION_HEIGHT - np.asarray(start_y, dtype=float)[()], start_angle), speed, angle_array
+
+
+# fr : Rééchantillonnage d'un tracé (tableau (n, 2), unités quelconques) à distance fixe le long de la courbe : les
+# points renvoyés sont à spacing, 2 * spacing, ... du premier point en abscisse curviligne, le reste plus court que
+# spacing étant abandonné. L'espacement ne dépend donc plus de la vitesse de la souris ni de la fréquence des
+# évènements, et np.gradient travaille sur un pas uniforme. Les points confondus sont ignorés.
+# en : Resampling of a drawing ((n, 2) array, any unit) at a fixed distance along the curve : the returned points are
+# at spacing, 2 * spacing, ... from the first point in arc length, the remainder shorter than spacing being dropped.
+# The spacing hence no longer depends on the mouse speed nor on the event rate, and np.gradient works on a uniform
+# step. Identical points are ignored.
+def resample_arc_length(points, spacing):
+    if spacing <= 0:
+        raise ValueError("the sample spacing must be positive, got %g" % spacing)
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    if len(points) == 0:
+        return points
+    arc = np.concatenate(([0.0], np.cumsum(np.hypot(*np.diff(points, axis=0).T))))
+    keep = np.concatenate(([True], np.diff(arc) > 0))
+    arc, points = arc[keep], points[keep]
+    targets = np.arange(int(arc[-1] / spacing) + 1) * spacing
+    return np.column_stack((np.interp(targets, arc, points[:, 0]), np.interp(targets, arc, points[:, 1])))
+
+
+# fr : Espacement des mesures pour une commande toutes les period secondes à la vitesse target_speed (en m/s).
+# en : Spacing of the measurements for one command every period seconds at the target_speed speed (in m/s).
+def spacing_for_speed(target_speed, period):
+    return target_speed * period
+
+
+# fr : Mesures d'un tracé (en pixels) : le départ est le premier point du tracé, puis le tracé est rééchantillonné tous
+# les spacing mètres (voir resample_arc_length). Si point_interval est donné, on reproduit l'ancien échantillonnage du
+# Canvas, une mesure tous les point_interval points en partant du premier.
+# en : Measurements of a drawing (in pixels) : the start is the first point of the drawing, then the drawing is
+# resampled every spacing metres (see resample_arc_length). If point_interval is given, the former Canvas sampling is
+# reproduced, one measurement every point_interval points starting with the first one.
+def points_to_samples(points, distance_ratio=DISTANCE_RATIO, point_interval=None, spacing=SAMPLE_SPACING):
+    points = np.asarray(points, dtype=float).reshape(-1, 2) / distance_ratio
+    if point_interval is None:
+        samples = resample_arc_length(points, spacing)
+    else:
+        samples = points[::point_interval]
+    return points[0, 0], points[0, 1], samples[:, 0], samples[:, 1]
+
+
+# fr : Mise en forme du fichier trajectoire : la première ligne contient la position de départ, les suivantes les
+# commandes (vitesse, angle de braquage).
+# en : Formatting of the trajectory file : the first line holds the starting position, the next ones the commands
+# (speed, steering angle).
+def format_trajectory(start, speed, angle_array):
+    start_x, start_y, start_angle = start
+    lines = ["{0:.3f},{1:.3f},{2:.8f}".format(start_x, start_y, start_angle)]
+    lines.extend("{0:.8f},{1:.8f}".format(v, a) for v, a in zip(speed, angle_array))
+    return "\n".join(lines) + "\n"
+
+
+def write_trajectory(path, start, speed, angle_array):
+    with open(path, "w") as f:
+        f.write(format_trajectory(start, speed, angle_array))
+
+
+# fr : Lecture d'un fichier trajectoire : renvoie la position de départ et le tableau (n, 2) des commandes.
+# en : Reading of a trajectory file : returns the starting position and the (n, 2) array of commands.
+def read_trajectory(path):
+    with open(path, "r") as f:
+        lines = f.read().split("\n")
+    start = tuple(float(v) for v in lines[0].split(","))
+    commands = np.array([line.split(",") for line in lines[1:] if line], dtype=float).reshape(-1, 2)
+    return start, commands
+
+
+# fr : Écriture des points du tracé (en pixels), un couple "x,y" par ligne.
+# en : Writing of the drawing points (in pixels), one "x,y" pair per line.
+def write_points(path, points):
+    points = np.asarray(points).reshape(-1, 2)
+    with open(path, "w") as f:
+        f.write("\n".join("%d,%d" % (x, y) for x, y in points))
+
+
+# fr : Lecture d'un fichier points : renvoie un tableau (n, 2) d'entiers.
+# en : Reading of a points file : returns an (n, 2) array of integers.
+def read_points(path):
+    with open(path, "r") as f:
+        data = f.read()
+    return np.array([line.split(",") for line in data.split("\n") if line], dtype=int).reshape(-1, 2)
+
+
+# fr : Chaîne complète pour un tracé en mémoire : points (en pixels) -> départ, vitesses et angles de braquage.
+# en : Whole pipeline for a drawing in memory : points (in pixels) -> start, speeds and steering angles.
+def compile_points(points, entraxe=ENTRAXE, distance_ratio=DISTANCE_RATIO, point_interval=None, policy="clip",
+                   spacing=SAMPLE_SPACING):
+    start_x, start_y, xpos, ypos = points_to_samples(points, distance_ratio, point_interval, spacing)
+    return compile_trajectory(start_x, start_y, xpos, ypos, entraxe, policy)
+
+
+# fr : Chaîne complète : fichier points -> fichier trajectoire.
+# en : Whole pipeline : points file -> trajectory file.
+def compile_points_file(points_path, trajectory_path, entraxe=ENTRAXE, distance_ratio=DISTANCE_RATIO,
+                        point_interval=None, policy="clip", binary=False, spacing=SAMPLE_SPACING):
+    start, speed, angle_array = compile_points(read_points(points_path), entraxe, distance_ratio, point_interval,
+                                               policy, spacing)
+    write_trajectory(trajectory_path, start, speed, angle_array)
+    if binary:
+        import binary_format
+        binary_format.write_trajectory_bin(os.path.splitext(trajectory_path)[0] + ".bin", start, speed, angle_array)
+
+
+# fr : pointsN.txt devient trajectoireN.txt, les autres noms sont préfixés par "trajectoire_".
+# en : pointsN.txt becomes trajectoireN.txt, other names are prefixed with "trajectoire_".
+def trajectory_name(points_path):
+    name = os.path.basename(points_path)
+    if name.startswith("points"):
+        return "trajectoire" + name[len("points"):]
+    return "trajectoire_" + name
+
+
+def _collect_points_files(inputs):
+    paths = []
+    for path in inputs:
+        if os.path.isdir(path):
+            paths.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if name.startswith("points") and name.endswith(".txt")))
+        else:
+            paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile pointsN.txt files into trajectoireN.txt command files.")
+    parser.add_argument("inputs", nargs="+", help="points files or folders containing points*.txt files")
+    parser.add_argument("-o", "--output-dir", default=None,
+                        help="folder of the trajectory files (default : next to each points file)")
+    parser.add_argument("--entraxe", type=float, default=ENTRAXE, help="wheelbase of the car in metres")
+    parser.add_argument("--distance-ratio", type=float, default=DISTANCE_RATIO, help="pixels per metre")
+    parser.add_argument("--sample-spacing", type=float, default=SAMPLE_SPACING,
+                        help="distance in metres between two measurements along the drawing")
+    parser.add_argument("--target-speed", type=float, default=None,
+                        help="with --command-period, speed in m/s used to derive the sample spacing")
+    parser.add_argument("--command-period", type=float, default=None,
+                        help="with --target-speed, time in seconds between two commands")
+    parser.add_argument("--point-interval", type=int, default=None,
+                        help="former sampling : one measurement every N drawing points (e.g. %d), instead of the "
+                             "arc-length resampling" % POINT_INTERVAL)
+    parser.add_argument("--steering-policy", choices=STEERING_POLICIES, default="clip",
+                        help="handling of the samples where |entraxe * c| >= 1")
+    parser.add_argument("--binary", action="store_true",
+                        help="also write each trajectory in the binary format of binary_format.py")
+    args = parser.parse_args(argv)
+    if (args.target_speed is None) != (args.command_period is None):
+        parser.error("--target-speed and --command-period must be given together")
+    spacing = args.sample_spacing
+    if args.target_speed is not None:
+        spacing = spacing_for_speed(args.target_speed, args.command_period)
+    if spacing <= 0:
+        parser.error("the sample spacing must be positive")
+
+    if args.output_dir is not None:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    failures = 0
+    paths = _collect_points_files(args.inputs)
+    for points_path in paths:
+        output_dir = args.output_dir if args.output_dir is not None else os.path.dirname(points_path)
+        trajectory_path = os.path.join(output_dir, trajectory_name(points_path))
+        try:
+            compile_points_file(points_path, trajectory_path, args.entraxe, args.distance_ratio, args.point_interval,
+                                args.steering_policy, args.binary, spacing)
+        except (OSError, ValueError) as error:
+            failures += 1
+            print("%s : %s" % (points_path, error), file=sys.stderr)
+
+    print("%d/%d trajectories compiled" % (len(paths) - failures, len(paths)))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
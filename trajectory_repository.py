@@ -0,0 +1,276 @@
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# Trajectory repository : single-file SQLite storage of the trajectories, with stable identifiers and metadata.
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# fr : Utilisation : python trajectory_repository.py trajectoires.db list [--circuit circuitMIA.png]
+#                    python trajectory_repository.py trajectoires.db import dossier/points*.txt --circuit circuitMIA.png
+#                    python trajectory_repository.py trajectoires.db export dossier/ [--ids 3 4 5]
+# en : Usage : python trajectory_repository.py trajectoires.db list [--circuit circuitMIA.png]
+#              python trajectory_repository.py trajectoires.db import folder/points*.txt --circuit circuitMIA.png
+#              python trajectory_repository.py trajectoires.db export folder/ [--ids 3 4 5]
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import namedtuple
+import numpy as np
+
+import trajectory_compiler
+
+
+# fr : Les points sont stockés en int32 (x, y en pixels, arrondis au plus proche), les commandes en float64 (vitesse,
+# angle), little-endian.
+# en : Points are stored as int32 (x, y in pixels, rounded to the nearest), commands as float64 (speed, angle),
+# little-endian.
+POINTS_DTYPE = np.dtype("<i4")
+COMMANDS_DTYPE = np.dtype("<f8")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trajectories (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    circuit TEXT NOT NULL,
+    created REAL NOT NULL,
+    params TEXT NOT NULL,
+    start_x REAL NOT NULL,
+    start_y REAL NOT NULL,
+    start_angle REAL NOT NULL,
+    n_points INTEGER NOT NULL,
+    points BLOB NOT NULL,
+    n_commands INTEGER NOT NULL,
+    commands BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS trajectories_circuit ON trajectories (circuit, created);
+CREATE INDEX IF NOT EXISTS trajectories_created ON trajectories (created);
+"""
+
+
+# fr : Trajectoire lue depuis le dépôt. start est la position et l'angle de départ dans le repère de la simulation,
+# points le tableau (n, 2) des points du tracé et commands le tableau (n, 2) des commandes (vitesse, angle).
+# en : Trajectory read from the repository. start is the starting position and angle in the simulation frame, points
+# the (n, 2) array of the drawing points and commands the (n, 2) array of commands (speed, angle).
+Trajectory = namedtuple("Trajectory", "id circuit created params start points commands")
+
+
+# fr : La classe TrajectoryRepository stocke toutes les trajectoires dans un seul fichier SQLite. Chaque trajectoire a
+# un identifiant stable (jamais réutilisé ni renuméroté), un circuit, une date de création et ses paramètres de
+# compilation. Les ajouts et suppressions en masse se font dans une seule transaction.
+# en : The TrajectoryRepository class stores all the trajectories in a single SQLite file. Each trajectory has a
+# stable identifier (never reused nor renumbered), a circuit, a creation date and its compilation parameters. Bulk
+# inserts and deletes are done in a single transaction.
+class TrajectoryRepository:
+
+    def __init__(self, path="trajectoires.db"):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+
+    def close(self):
+        self.connection.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+    @staticmethod
+    def _row(points, start, speed, angle_array, circuit, params, created):
+        points = np.ascontiguousarray(np.rint(points), dtype=POINTS_DTYPE).reshape(-1, 2)
+        commands = np.ascontiguousarray(np.column_stack((speed, angle_array)), dtype=COMMANDS_DTYPE)
+        return (circuit, time.time() if created is None else created, json.dumps(params or {}),
+                float(start[0]), float(start[1]), float(start[2]),
+                len(points), points.tobytes(), len(commands), commands.tobytes())
+
+
+    # fr : Ajout d'une trajectoire, renvoie son identifiant.
+    # en : Adds a trajectory, returns its identifier.
+    def add(self, points, start, speed, angle_array, circuit, params=None, created=None):
+        return self.add_many([(points, start, speed, angle_array, circuit, params, created)])[0]
+
+
+    # fr : Ajout de plusieurs trajectoires (tuples points, start, speed, angle_array, circuit, params, created) dans une
+    # seule transaction : soit toutes sont ajoutées, soit aucune. Renvoie la liste des identifiants.
+    # en : Adds several trajectories (tuples points, start, speed, angle_array, circuit, params, created) in a single
+    # transaction : either all of them are added, or none. Returns the list of identifiers.
+    def add_many(self, records):
+        ids = []
+        with self.connection:
+            for record in records:
+                cursor = self.connection.execute(
+                    "INSERT INTO trajectories (circuit, created, params, start_x, start_y, start_angle, n_points, "
+                    "points, n_commands, commands) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", self._row(*record))
+                ids.append(cursor.lastrowid)
+        return ids
+
+
+    # fr : Ajout d'une trajectoire sous l'identifiant trajectory_id, qui ne doit pas être utilisé : sert à rétablir une
+    # trajectoire supprimée (par exemple par la gomme) sous son identifiant d'origine.
+    # en : Adds a trajectory under the identifier trajectory_id, which must not be in use : used to restore a deleted
+    # trajectory (for example by the eraser) under its original identifier.
+    def insert(self, trajectory_id, points, start, speed, angle_array, circuit, params=None, created=None):
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO trajectories (id, circuit, created, params, start_x, start_y, start_angle, n_points, "
+                "points, n_commands, commands) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (int(trajectory_id),) + self._row(points, start, speed, angle_array, circuit, params, created))
+        return trajectory_id
+
+
+    # fr : Remplacement des points et des commandes d'une trajectoire modifiée (par exemple une courbe éditée). Elle
+    # garde son identifiant, son circuit et sa date de création ; ses paramètres sont complétés par params.
+    # en : Replaces the points and the commands of a modified trajectory (for example an edited curve). It keeps its
+    # identifier, its circuit and its creation date ; its parameters are updated with params.
+    def update(self, trajectory_id, points, start, speed, angle_array, params=None):
+        trajectory = self.get(trajectory_id)
+        merged = dict(trajectory.params, **(params or {}))
+        row = self._row(points, start, speed, angle_array, trajectory.circuit, merged, trajectory.created)
+        with self.connection:
+            self.connection.execute(
+                "UPDATE trajectories SET params = ?, start_x = ?, start_y = ?, start_angle = ?, n_points = ?, "
+                "points = ?, n_commands = ?, commands = ? WHERE id = ?", row[2:] + (int(trajectory_id),))
+
+
+    # fr : Suppression de plusieurs trajectoires dans une seule transaction.
+    # en : Deletes several trajectories in a single transaction.
+    def delete(self, ids):
+        with self.connection:
+            self.connection.executemany("DELETE FROM trajectories WHERE id = ?", [(int(i),) for i in ids])
+
+
+    # fr : Identifiants des trajectoires (éventuellement d'un seul circuit), dans l'ordre de création.
+    # en : Identifiers of the trajectories (possibly of a single circuit), in the order of creation.
+    def ids(self, circuit=None):
+        if circuit is None:
+            rows = self.connection.execute("SELECT id FROM trajectories ORDER BY id")
+        else:
+            rows = self.connection.execute("SELECT id FROM trajectories WHERE circuit = ? ORDER BY id", (circuit,))
+        return [row[0] for row in rows]
+
+
+    # fr : Métadonnées des trajectoires (id, circuit, date de création, nombre de points et de commandes), sans lire
+    # les tableaux.
+    # en : Metadata of the trajectories (id, circuit, creation date, number of points and of commands), without reading
+    # the arrays.
+    def summaries(self, circuit=None):
+        query = "SELECT id, circuit, created, n_points, n_commands FROM trajectories"
+        if circuit is None:
+            return self.connection.execute(query + " ORDER BY id").fetchall()
+        return self.connection.execute(query + " WHERE circuit = ? ORDER BY id", (circuit,)).fetchall()
+
+
+    # fr : Circuits ayant au moins une trajectoire, dans l'ordre de leur première trajectoire.
+    # en : Circuits having at least one trajectory, in the order of their first trajectory.
+    def circuits(self):
+        rows = self.connection.execute("SELECT circuit FROM trajectories GROUP BY circuit ORDER BY MIN(id)")
+        return [row[0] for row in rows]
+
+
+    def __contains__(self, trajectory_id):
+        query = "SELECT 1 FROM trajectories WHERE id = ?"
+        return self.connection.execute(query, (int(trajectory_id),)).fetchone() is not None
+
+
+    def count(self, circuit=None):
+        if circuit is None:
+            return self.connection.execute("SELECT COUNT(*) FROM trajectories").fetchone()[0]
+        return self.connection.execute("SELECT COUNT(*) FROM trajectories WHERE circuit = ?", (circuit,)).fetchone()[0]
+
+
+    # fr : Points (en pixels) d'une trajectoire, sans lire les commandes.
+    # en : Points (in pixels) of a trajectory, without reading the commands.
+    def points(self, trajectory_id):
+        row = self.connection.execute("SELECT points FROM trajectories WHERE id = ?", (int(trajectory_id),)).fetchone()
+        if row is None:
+            raise KeyError(trajectory_id)
+        return np.frombuffer(row[0], dtype=POINTS_DTYPE).reshape(-1, 2)
+
+
+    def get(self, trajectory_id):
+        row = self.connection.execute(
+            "SELECT id, circuit, created, params, start_x, start_y, start_angle, points, commands "
+            "FROM trajectories WHERE id = ?", (int(trajectory_id),)).fetchone()
+        if row is None:
+            raise KeyError(trajectory_id)
+        return Trajectory(row[0], row[1], row[2], json.loads(row[3]), tuple(row[4:7]),
+                          np.frombuffer(row[7], dtype=POINTS_DTYPE).reshape(-1, 2),
+                          np.frombuffer(row[8], dtype=COMMANDS_DTYPE).reshape(-1, 2))
+
+
+    # fr : Écriture des fichiers trajectoire{id}.txt et points{id}.txt attendus par RVIZ dans le dossier folder.
+    # en : Writes the trajectoire{id}.txt and points{id}.txt files expected by RVIZ in the folder folder.
+    def export(self, trajectory_id, folder=".", binary=False):
+        trajectory = self.get(trajectory_id)
+        trajectory_path = os.path.join(folder, "trajectoire%d.txt" % trajectory.id)
+        points_path = os.path.join(folder, "points%d.txt" % trajectory.id)
+        speed, angle_array = trajectory.commands[:, 0], trajectory.commands[:, 1]
+        trajectory_compiler.write_trajectory(trajectory_path, trajectory.start, speed, angle_array)
+        trajectory_compiler.write_points(points_path, trajectory.points)
+        if binary:
+            import binary_format
+            binary_format.write_trajectory_bin(trajectory_path[:-4] + ".bin", trajectory.start, speed, angle_array)
+            binary_format.write_points_bin(points_path[:-4] + ".bin", trajectory.points)
+        return trajectory_path, points_path
+
+
+    # fr : Import de fichiers points existants : ils sont compilés puis ajoutés dans une seule transaction.
+    # en : Import of existing points files : they are compiled then added in a single transaction.
+    def import_points_files(self, paths, circuit, entraxe=trajectory_compiler.ENTRAXE,
+                            distance_ratio=trajectory_compiler.DISTANCE_RATIO, point_interval=None,
+                            spacing=trajectory_compiler.SAMPLE_SPACING):
+        params = {"entraxe": entraxe, "distance_ratio": distance_ratio, "point_interval": point_interval,
+                  "sample_spacing": spacing}
+        records = []
+        for path in paths:
+            points = trajectory_compiler.read_points(path)
+            start, speed, angle_array = trajectory_compiler.compile_points(points, entraxe, distance_ratio,
+                                                                           point_interval, spacing=spacing)
+            records.append((points, start, speed, angle_array, circuit, params, os.path.getmtime(path)))
+        return self.add_many(records)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage a trajectory repository.")
+    parser.add_argument("database", help="SQLite file of the repository")
+    commands = parser.add_subparsers(dest="command", required=True)
+    list_parser = commands.add_parser("list", help="list the stored trajectories")
+    list_parser.add_argument("--circuit", default=None)
+    import_parser = commands.add_parser("import", help="compile and store points files")
+    import_parser.add_argument("files", nargs="+")
+    import_parser.add_argument("--circuit", required=True)
+    export_parser = commands.add_parser("export", help="write trajectoire{id}.txt and points{id}.txt files")
+    export_parser.add_argument("folder")
+    export_parser.add_argument("--ids", type=int, nargs="*", default=None)
+    export_parser.add_argument("--circuit", default=None)
+    export_parser.add_argument("--binary", action="store_true", help="also write the binary files")
+    args = parser.parse_args(argv)
+
+    with TrajectoryRepository(args.database) as repository:
+        if args.command == "list":
+            for trajectory_id, circuit, created, n_points, n_commands in repository.summaries(args.circuit):
+                print("%d\t%s\t%s\t%d points\t%d commands"
+                      % (trajectory_id, circuit, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created)),
+                         n_points, n_commands))
+        elif args.command == "import":
+            ids = repository.import_points_files(args.files, args.circuit)
+            print("%d trajectories imported" % len(ids))
+        else:
+            os.makedirs(args.folder, exist_ok=True)
+            ids = args.ids if args.ids is not None else repository.ids(args.circuit)
+            for trajectory_id in ids:
+                repository.export(trajectory_id, args.folder, args.binary)
+            print("%d trajectories exported" % len(ids))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+# Trajectory store : in-memory cache of the trajectory points and of their vector layers.
+#----------------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+from collections import OrderedDict
+
+from PyQt5.QtGui import QColor
+
+from instrumentation import timed
+from scene_items import TrajectoryItem
+
+
+# fr : La classe TrajectoryLayerCache garde en mémoire les points de chaque trajectoire (lus une seule fois grâce à la
+# fonction loader) et son calque vectoriel (voir scene_items.py), dont les polylignes simplifiées de chaque niveau de
+# zoom sont gardées. Les entrées les moins récemment utilisées sont supprimées au-delà de capacity entrées.
+# en : The TrajectoryLayerCache class keeps in memory the points of each trajectory (read only once with the loader
+# function) and its vector layer (see scene_items.py), which keeps the simplified polylines of each zoom level. The
+# least recently used entries are evicted beyond capacity entries.
+class TrajectoryLayerCache:
+
+    def __init__(self, loader, capacity=64):
+        self.loader = loader
+        self.capacity = capacity
+        self._points = OrderedDict()
+        self._layers = OrderedDict()
+
+
+    def _get(self, cache, key, build):
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+        value = build()
+        cache[key] = value
+        if len(cache) > self.capacity:
+            cache.popitem(last=False)
+        return value
+
+
+    # fr : Points (en pixels) de la trajectoire key.
+    # en : Points (in pixels) of the trajectory key.
+    def points(self, key):
+        return self._get(self._points, key, lambda: self.loader(key))
+
+
+    # fr : Calque de la trajectoire key tracée avec la couleur et l'épaisseur données : un TrajectoryItem à ajouter à
+    # la scène du canvas.
+    # en : Layer of the trajectory key drawn with the given color and width : a TrajectoryItem to add to the scene of
+    # the canvas.
+    def layer(self, key, color, width=3):
+        color = QColor(color)
+        return self._get(self._layers, (key, color.rgba(), width),
+                         lambda: self._render(self.points(key), color, width))
+
+
+    @staticmethod
+    @timed("TrajectoryLayerCache.render")
+    def _render(points, color, width):
+        item = TrajectoryItem(points, color, width)
+        # fr : La polyligne complète est préparée tout de suite : le premier affichage n'a plus qu'à la tracer.
+        # en : The whole polyline is prepared right away : the first display only has to draw it.
+        item.polyline(0)
+        return item
+
+
+    # fr : Oublie les données de la trajectoire key, ou de toutes les trajectoires si key vaut None.
+    # en : Forgets the data of the trajectory key, or of all the trajectories if key is None.
+    def invalidate(self, key=None):
+        if key is None:
+            self._points.clear()
+            self._layers.clear()
+            return
+        self._points.pop(key, None)
+        for layer_key in [k for k in self._layers if k[0] == key]:
+            del self._layers[layer_key]